@@ -0,0 +1,135 @@
+"""
+Fast-path command line parser for CLIA.
+
+Handles the common, well-formed invocations with a single pass over argv and
+returns a namespace with the same attributes argparse would. Anything unusual (--help, unknown or
+abbreviated options, invalid values, --opt=value syntax, split question words)
+returns None so the caller can fall back to argparse for full handling and
+error messages.
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional
+
+COMMANDS = frozenset(("ask", "draft", "explain", "debug", "fix", "generate"))
+AGENTS = ("chat", "plan-build", "react", "llm-compiler", "rewoo", "tot", "babyagi")
+OUTPUT_FORMATS = ("markdown", "json", "text")
+
+# dest -> default, 必须与 main.create_parser 中的子命令参数保持一致
+DEFAULTS = {
+    "question": [],
+    "multiline": False,
+    "verbose": False,
+    "file": None,
+    "model": None,
+    "temperature": None,
+    "top_p": None,
+    "max_retries": None,
+    "stream": False,
+    "quiet": False,
+    "history": None,
+    "output_format": "markdown",
+    "with_interaction": False,
+    "with_reflection": False,
+    "agent": "chat",
+    "max_iterations": 10,
+    "max_depth": 3,
+    "branching_factor": 3,
+    "beam_width": 2,
+    "structured_output": False,
+    "memory_path": None,
+    "enable_memory": False,
+    "memory_limit": 100,
+    "no_memory_summarization": False,
+    "memory_context_limit": 3,
+    "semantic_memory": False,
+    "enable_cache": False,
+    "cache_dir": None,
+    "semantic_cache": False,
+}
+
+# 布尔开关: flag -> dest
+_SWITCHES = {
+    "--multiline": "multiline",
+    "-m": "multiline",
+    "--verbose": "verbose",
+    "-v": "verbose",
+    "--stream": "stream",
+    "--quiet": "quiet",
+    "--with-interaction": "with_interaction",
+    "--with-reflection": "with_reflection",
+    "--structured-output": "structured_output",
+    "--enable-memory": "enable_memory",
+    "--no-memory-summarization": "no_memory_summarization",
+    "--semantic-memory": "semantic_memory",
+    "--enable-cache": "enable_cache",
+    "--semantic-cache": "semantic_cache",
+}
+
+# 带值参数: flag -> (dest, type, choices)
+_OPTIONS = {
+    "--file": ("file", Path, None),
+    "--model": ("model", str, None),
+    "--temperature": ("temperature", float, None),
+    "--top_p": ("top_p", float, None),
+    "--max_retries": ("max_retries", int, None),
+    "--history": ("history", str, None),
+    "--output-format": ("output_format", str, OUTPUT_FORMATS),
+    "--agent": ("agent", str, AGENTS),
+    "--max-iterations": ("max_iterations", int, None),
+    "--max-depth": ("max_depth", int, None),
+    "--branching-factor": ("branching_factor", int, None),
+    "--beam-width": ("beam_width", int, None),
+    "--memory-path": ("memory_path", Path, None),
+    "--memory-limit": ("memory_limit", int, None),
+    "--memory-context-limit": ("memory_context_limit", int, None),
+    "--cache-dir": ("cache_dir", Path, None),
+}
+
+
+def fast_parse(argv: List[str]) -> Optional[SimpleNamespace]:
+    """Parse argv in one pass, or return None when argparse should handle it."""
+    if not argv or argv[0] not in COMMANDS:
+        return None
+
+    values = dict(DEFAULTS)
+    values["command"] = argv[0]
+    question: List[str] = []
+    # 0: 尚未出现问题文本, 1: 正在读取问题文本, 2: 问题文本已结束
+    question_state = 0
+
+    i, n = 1, len(argv)
+    while i < n:
+        token = argv[i]
+        if token.startswith("-"):
+            if question_state == 1:
+                question_state = 2
+            if token in _SWITCHES:
+                values[_SWITCHES[token]] = True
+                i += 1
+                continue
+            spec = _OPTIONS.get(token)
+            if spec is None or i + 1 >= n or argv[i + 1].startswith("-"):
+                return None
+            dest, arg_type, choices = spec
+            try:
+                value = arg_type(argv[i + 1])
+            except ValueError:
+                return None
+            if choices is not None and value not in choices:
+                return None
+            values[dest] = value
+            i += 2
+            continue
+
+        # argparse 只接受一段连续的问题文本
+        if question_state == 2:
+            return None
+        question_state = 1
+        question.append(token)
+        i += 1
+
+    values["question"] = question
+    # 不导入 argparse, 快速路径省去其与 gettext 的导入开销
+    return SimpleNamespace(**values)
@@ -0,0 +1,57 @@
+"""
+Bracket scanners used to locate JSON arrays and objects in LLM responses.
+
+Kept free of optional dependencies and fully annotated so that setup.py can
+compile it ahead of time with mypyc (set CLIA_MYPYC=1 when building); the
+plain Python module is used otherwise.
+"""
+
+import re
+from typing import Pattern
+
+# 定位 JSON 数组/对象结尾时只需关心的字符, 其余字符由正则引擎在 C 层跳过
+_JSON_ARRAY_TOKEN_RE: Pattern[str] = re.compile(r'[\[\]"\\]')
+_JSON_OBJECT_TOKEN_RE: Pattern[str] = re.compile(r'[{}"\\]')
+
+
+def _balanced_end(tokens: Pattern[str], open_char: str, text: str, start: int) -> int:
+    depth: int = 0
+    in_string: bool = False
+    skip: int = -1
+    for match in tokens.finditer(text, start):
+        pos: int = match.start()
+        if pos == skip:
+            continue
+        ch: str = match.group()
+        if in_string:
+            if ch == '\\':
+                skip = pos + 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == open_char:
+            depth += 1
+        else:
+            depth -= 1
+            if not depth:
+                return pos + 1
+    return -1
+
+
+def json_array_end(text: str, start: int) -> int:
+    """
+    从 text[start] 处的 '[' 开始单向扫描, 返回配对的 ']' 之后的下标
+
+    字符串中的方括号和转义引号会被跳过; 数组未闭合时返回 -1
+    """
+    return _balanced_end(_JSON_ARRAY_TOKEN_RE, '[', text, start)
+
+
+def json_object_end(text: str, start: int) -> int:
+    """
+    从 text[start] 处的 '{' 开始单向扫描, 返回配对的 '}' 之后的下标
+
+    字符串中的花括号和转义引号会被跳过; 对象未闭合时返回 -1
+    """
+    return _balanced_end(_JSON_OBJECT_TOKEN_RE, '{', text, start)
@@ -6,18 +6,22 @@ prompt management, conversation history, and reflection capabilities.
 """
 
 from .llm import openai_completion
-from .prompts import get_prompt
+from .prompts import get_prompt, get_prompt_prefix
 from .history import History
 from .memory import MemoryManager, MemoryEntry
-from .react_agent import react_agent, react_agent_simple
-from .plan_build_agent import plan_build
-from .llm_compiler_agent import llm_compiler_agent, llm_compiler_agent_simple
-from .rewoo_agent import rewoo_agent
+from .cache import ResponseCache, SemanticCache
+from .react_agent import react_agent, react_agent_async, react_agent_batch, react_agent_simple
+from .plan_build_agent import plan_build, plan_build_async, plan_build_batch
+from .llm_compiler_agent import llm_compiler_agent, llm_compiler_agent_async, llm_compiler_agent_simple
+from .rewoo_agent import rewoo_agent, rewoo_agent_async
 from .tot_agent import tot_agent, tot_agent_simple
 from .babyagi_agent import babyagi_agent
 from .reflection import (
     AgentReflection,
+    areflect_on_execution,
     reflect_on_execution,
+    areflect_many,
+    reflect_many,
     reflect_react_agent,
     reflect_llm_compiler_agent,
     reflect_plan_build_agent,
@@ -28,20 +32,32 @@ from .reflection import (
 __all__ = [
     "openai_completion",
     "get_prompt",
+    "get_prompt_prefix",
     "History",
     "MemoryManager",
     "MemoryEntry",
+    "ResponseCache",
+    "SemanticCache",
     "react_agent",
+    "react_agent_async",
+    "react_agent_batch",
     "react_agent_simple",
     "plan_build",
+    "plan_build_async",
+    "plan_build_batch",
     "llm_compiler_agent",
+    "llm_compiler_agent_async",
     "llm_compiler_agent_simple",
     "rewoo_agent",
+    "rewoo_agent_async",
     "tot_agent",
     "tot_agent_simple",
     "babyagi_agent",
     "AgentReflection",
+    "areflect_on_execution",
     "reflect_on_execution",
+    "areflect_many",
+    "reflect_many",
     "reflect_react_agent",
     "reflect_llm_compiler_agent",
     "reflect_plan_build_agent",
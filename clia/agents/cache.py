@@ -0,0 +1,238 @@
+"""
+Response Cache for CLIA Agents
+
+This module provides caches for LLM responses:
+1. ResponseCache: exact-match answers for repeated identical questions
+2. SemanticCache: answers for rephrased questions, matched by embedding similarity
+"""
+
+from typing import List, Optional
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from clia.utils import json_dumps_bytes, json_loads
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by SemanticCache
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Exact-match LLM response cache backed by SQLite.
+
+    Entries are keyed on (command, model, temperature, question), see make_key().
+    """
+
+    def __init__(self, cache_dir: Path):
+        """
+        Initialize response cache.
+
+        Args:
+            cache_dir: Directory holding the SQLite cache database
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "responses.sqlite3"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info(f"Response cache opened at {self.db_path}")
+
+    @staticmethod
+    def make_key(command: str, model: str, temperature: float, question: str) -> str:
+        """Build the cache key for a request."""
+        raw = f"{command}|{model}|{temperature}|{question}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: str) -> None:
+        """Store response under key, replacing any previous entry."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, response)
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class SemanticCache:
+    """
+    Near-match LLM response cache based on question embeddings.
+
+    Embeddings are stored L2-normalized in one contiguous float32 matrix, so a
+    lookup is a single matrix-vector product. On disk the rows are raw float32
+    appended one per entry; in memory the matrix grows by doubling its
+    capacity. Requires numpy.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        api_key: str,
+        base_url: str,
+        embedding_model: str = "text-embedding-3-small",
+        threshold: float = 0.92,
+        max_retries: int = 5,
+        timeout: float = 30.0
+    ):
+        """
+        Initialize semantic cache.
+
+        Args:
+            cache_dir: Directory holding the embedding matrix and entries
+            api_key: API key for the embedding endpoint
+            base_url: Base URL for the embedding endpoint
+            embedding_model: Embedding model name
+            threshold: Minimum cosine similarity for a cache hit
+            max_retries: Max retries for API calls
+            timeout: Timeout for API calls
+        """
+        if np is None:
+            raise ImportError("SemanticCache requires numpy (pip install numpy)")
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = self.cache_dir / "embeddings.f32"
+        self.entries_path = self.cache_dir / "semantic_entries.jsonl"
+        self.api_key = api_key
+        self.base_url = base_url
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        # _buffer 的前 _count 行有效, 其余为预留容量
+        self._buffer, self._entries = self._load()
+        self._count = len(self._entries)
+        logger.info(f"Loaded {len(self._entries)} semantic cache entries from {self.cache_dir}")
+
+    def _load(self):
+        """Load the embedding matrix and its entries."""
+        entries: List[dict] = []
+        if self.entries_path.exists():
+            with self.entries_path.open('rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json_loads(line))
+                    except ValueError as e:
+                        logger.warning(f"Failed to parse semantic cache entry: {e}, resetting cache")
+                        return self._reset()
+
+        if not entries or not self.matrix_path.exists():
+            return self._reset()
+
+        # 文件中没有维度信息, 由文件大小与条目数推出每行的长度
+        row_bytes, extra = divmod(self.matrix_path.stat().st_size, len(entries))
+        if extra or not row_bytes or row_bytes % 4:
+            logger.warning("Semantic cache matrix and entries are out of sync, resetting cache")
+            return self._reset()
+        matrix = np.fromfile(self.matrix_path, dtype=np.float32).reshape(len(entries), -1)
+        return matrix, entries
+
+    def _reset(self):
+        """Drop persisted state so matrix rows and entries stay aligned."""
+        # embeddings.npy 为旧版整体重写的矩阵文件
+        for path in (self.matrix_path, self.entries_path, self.cache_dir / "embeddings.npy"):
+            if path.exists():
+                path.unlink()
+        return None, []
+
+    @staticmethod
+    def make_scope(command: str, model: str, temperature: float) -> str:
+        """Build the scope a cached answer is valid for."""
+        return f"{command}|{model}|{temperature}"
+
+    def embed(self, text: str):
+        """Return the L2-normalized float32 embedding for text."""
+        from .llm import openai_embedding
+
+        vector = np.asarray(
+            openai_embedding(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=self.max_retries,
+                model=self.embedding_model,
+                text=text,
+                timeout=self.timeout
+            ),
+            dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, scope: str, threshold: Optional[float] = None) -> Optional[str]:
+        """Return the most similar cached response within scope, or None.
+
+        threshold overrides the cache-wide minimum similarity for this lookup.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            buffer, count, entries = self._buffer, self._count, self._entries
+        if buffer is None or buffer.shape[1] != embedding.shape[0]:
+            return None
+
+        sims = buffer[:count] @ embedding
+        if sims[sims.argmax()] < threshold:
+            return None
+        # 只对超过阈值的少数候选排序, 按相似度从高到低找第一个同 scope 的条目
+        candidates = np.flatnonzero(sims >= threshold)
+        for idx in candidates[np.argsort(-sims[candidates])]:
+            if entries[idx]["scope"] == scope:
+                logger.debug(f"Semantic cache hit (similarity: {sims[idx]:.3f})")
+                return entries[idx]["response"]
+        return None
+
+    def put(self, embedding, scope: str, question: str, response: str) -> None:
+        """Add an entry, appending its row to the persisted matrix."""
+        with self._lock:
+            row = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+            buffer, count = self._buffer, self._count
+            if buffer is None:
+                buffer = np.empty((1, row.shape[0]), dtype=np.float32)
+            elif buffer.shape[1] != row.shape[0]:
+                logger.warning("Embedding dimension changed, skipping semantic cache write")
+                return
+            elif count == buffer.shape[0]:
+                # 容量翻倍, 均摊每次写入的复制开销; 旧缓冲区对并发的 get 保持不变
+                grown = np.empty((2 * count, row.shape[0]), dtype=np.float32)
+                grown[:count] = buffer[:count]
+                buffer = grown
+            buffer[count] = row
+
+            # 磁盘上只追加新的一行, 不重写整个矩阵
+            with self.matrix_path.open('ab') as f:
+                f.write(row.tobytes())
+            entry = {"scope": scope, "question": question, "response": response}
+            with self.entries_path.open('ab') as f:
+                f.write(json_dumps_bytes(entry) + b'\n')
+
+            self._buffer = buffer
+            self._entries.append(entry)
+            self._count = count + 1
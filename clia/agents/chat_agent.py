@@ -2,13 +2,18 @@
 Simple Chat Agent - Direct Q&A without complex reasoning patterns
 """
 
+from itertools import chain
 from typing import Optional, Dict, Tuple
 import logging
 from .llm import openai_completion
-from .prompts import get_prompt
+from .prompts import get_prompt_prefix, msg
+from clia.utils import truncate_tokens
 
 logger = logging.getLogger(__name__)
 
+# Token budget for each remembered answer included in the prompt
+MEMORY_ANSWER_TOKENS = 64
+
 
 def chat_agent(
     question: str,
@@ -25,7 +30,9 @@ def chat_agent(
     timeout: float,
     verbose: bool = False,
     return_metadata: bool = False,
-    memory_manager=None
+    memory_manager=None,
+    response_cache=None,
+    semantic_cache=None
 ) -> str | Tuple[str, Dict]:
     """
     Simple chat agent that directly answers questions without complex reasoning.
@@ -33,6 +40,9 @@ def chat_agent(
     Args:
         question: User's question
         command: Command type (ask, explain, debug, etc.)
+        memory_manager: Optional MemoryManager for conversation context
+        response_cache: Optional ResponseCache for exact-match answers
+        semantic_cache: Optional SemanticCache for answers to rephrased questions
         Other args: LLM configuration parameters
 
     Returns:
@@ -40,49 +50,88 @@ def chat_agent(
     """
     logger.info("Starting chat agent")
 
-    # Build system message based on command
-    prompt_data = get_prompt(command)
-    if prompt_data is None:
-        prompt_data = get_prompt("ask")
-    system_message = prompt_data[0]
-
-    # Prepare messages
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": question}
-    ]
-
     # Add memory context if available
+    context_messages = ()
+    memory_added = False
     if memory_manager and memory_manager.memories:
         try:
             # Get recent memories (last 3 entries)
             recent_memories = memory_manager.memories[-3:]
             if recent_memories:
-                memory_context = "\n\nRelevant context from previous conversations:\n"
+                memory_context = "Relevant context from previous conversations:\n"
                 memory_context += "\n".join([
-                    f"- Q: {mem.question}\n  A: {mem.answer[:200]}..." 
-                    if len(mem.answer) > 200 else f"- Q: {mem.question}\n  A: {mem.answer}"
+                    f"- Q: {mem.question}\n  A: {truncate_tokens(mem.answer, MEMORY_ANSWER_TOKENS)}"
                     for mem in recent_memories
                 ])
-                messages[0]["content"] += memory_context
-                logger.info(f"Added {len(recent_memories)} relevant memories to context")
+                context_messages = (msg("system", memory_context),)
+                memory_added = True
+                logger.info("Added %d relevant memories to context", len(recent_memories))
+        except Exception as e:
+            logger.warning("Failed to retrieve memories: %s", e)
+
+    # Build messages in one pass: static system + few-shot prefix, memory, user.
+    # Keep the prefix byte-identical across calls so provider-side prompt
+    # (KV) caching can hit; never mutate the prefix messages.
+    messages = list(chain(
+        get_prompt_prefix(command),
+        context_messages,
+        (msg("user", question),)
+    ))
+
+    # Look up exact-match cache; streamed output and memory-dependent prompts are not cached
+    cache_key = None
+    response = None
+    if response_cache and not stream and not memory_added:
+        try:
+            cache_key = response_cache.make_key(command, model, temperature, question)
+            response = response_cache.get(cache_key)
+            if response is not None:
+                logger.info("Response cache hit")
+        except Exception as e:
+            logger.warning("Failed to read response cache: %s", e)
+            cache_key = None
+
+    # On exact miss, look for a semantically similar cached question
+    embedding = None
+    scope = None
+    if semantic_cache and response is None and not stream and not memory_added:
+        try:
+            scope = semantic_cache.make_scope(command, model, temperature)
+            embedding = semantic_cache.embed(question)
+            response = semantic_cache.get(embedding, scope)
+            if response is not None:
+                logger.info("Semantic cache hit")
         except Exception as e:
-            logger.warning(f"Failed to retrieve memories: {e}")
+            logger.warning("Failed to read semantic cache: %s", e)
+            embedding = None
 
     # Get response from LLM
-    response = openai_completion(
-        api_key=api_key,
-        base_url=base_url,
-        max_retries=max_retries,
-        model=model,
-        messages=messages,
-        stream=stream,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        max_tokens=max_tokens,
-        timeout=timeout
-    )
+    if response is None:
+        response = openai_completion(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            model=model,
+            messages=messages,
+            stream=stream,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+
+        if cache_key is not None:
+            try:
+                response_cache.put(cache_key, response)
+            except Exception as e:
+                logger.warning("Failed to write response cache: %s", e)
+
+        if embedding is not None:
+            try:
+                semantic_cache.put(embedding, scope, question, response)
+            except Exception as e:
+                logger.warning("Failed to write semantic cache: %s", e)
 
     # Save to memory if available
     if memory_manager:
@@ -96,7 +145,7 @@ def chat_agent(
             )
             logger.info("Saved interaction to memory")
         except Exception as e:
-            logger.warning(f"Failed to save memory: {e}")
+            logger.warning("Failed to save memory: %s", e)
 
     logger.info("Chat agent completed")
 
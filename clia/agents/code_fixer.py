@@ -1,13 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
 from pathlib import Path
+import io
 import re
 import ast
 import difflib
-from clia.agents.llm import openai_completion
+from clia.agents.llm import openai_completion, openai_completion_stream
 from clia.agents import tools as tool_funcs
 
 
+_FILE_LINE_RE = re.compile(r'File "([^"]+)", line (\d+)')
+_ERROR_RE = re.compile(r'(\w+Error): (.+)$', re.MULTILINE)
+_LANG_HEADER_RE = re.compile(r'^(python|py|python3)\n', re.IGNORECASE)
+
+# 单次扫描识别所有错误关键字; 多个关键字同时出现时按优先级 (数值越小越优先) 取类型
+_CLASSIFIER = re.compile(r'(Traceback|File "|FAILED|AssertionError|SyntaxError|invalid syntax)')
+_ERROR_KINDS = {
+    'Traceback': (0, 'python_traceback'),
+    'File "': (0, 'python_traceback'),
+    'FAILED': (1, 'test_failure'),
+    'AssertionError': (1, 'test_failure'),
+    'SyntaxError': (2, 'syntax_error'),
+    'invalid syntax': (2, 'syntax_error'),
+}
+
+
 @dataclass
 class FixResult:
     success: bool
@@ -30,6 +49,52 @@ class CodeFixerConfig:
     file_path: Optional[str] = None
 
 
+class FenceSegmenter:
+    """Split a streamed response on ``` fences without materializing the whole text.
+
+    Text before the first fence is the "preamble", between the first and second
+    fence is "code", between the second and third is "explanation", and anything
+    after that is "trailer" (same segments as response.split("```")).
+    """
+
+    FENCE = "```"
+    SEGMENTS = ("preamble", "code", "explanation")
+
+    def __init__(self) -> None:
+        self.fences = 0
+        self._pending = ""
+
+    def _segment(self) -> str:
+        return self.SEGMENTS[self.fences] if self.fences < len(self.SEGMENTS) else "trailer"
+
+    def feed(self, chunk: str) -> Iterator[Tuple[str, str]]:
+        """Consume a chunk and yield (segment, text) pieces."""
+        text = self._pending + chunk
+        self._pending = ""
+        while True:
+            idx = text.find(self.FENCE)
+            if idx == -1:
+                break
+            if idx:
+                yield self._segment(), text[:idx]
+            self.fences += 1
+            text = text[idx + len(self.FENCE):]
+
+        # 保留末尾可能属于下一个 chunk 中栅栏的反引号
+        keep = 2 if text.endswith("``") else 1 if text.endswith("`") else 0
+        if keep:
+            self._pending = text[-keep:]
+            text = text[:-keep]
+        if text:
+            yield self._segment(), text
+
+    def close(self) -> Iterator[Tuple[str, str]]:
+        """Flush any held-back text at end of stream."""
+        if self._pending:
+            yield self._segment(), self._pending
+            self._pending = ""
+
+
 def _parse_error_input(error_input: str) -> dict:
     """Parse error input and extract structured information"""
     error_info = {
@@ -40,35 +105,41 @@ def _parse_error_input(error_input: str) -> dict:
         "traceback": None
     }
 
+    best = None
+    for match in _CLASSIFIER.finditer(error_input):
+        kind = _ERROR_KINDS[match.group(1)]
+        if best is None or kind[0] < best[0]:
+            best = kind
+            if best[0] == 0:
+                break
+    error_type = best[1] if best else "unknown"
+
     # Python traceback pattern
-    if "Traceback" in error_input or "File \"" in error_input:
+    if error_type == "python_traceback":
         error_info["type"] = "python_traceback"
         error_info["traceback"] = error_input
 
         # Extract file and line
-        file_match = re.search(r'File "([^"]+)", line (\d+)', error_input)
+        file_match = _FILE_LINE_RE.search(error_input)
         if file_match:
             error_info["file"] = file_match.group(1)
             error_info["line"] = int(file_match.group(2))
 
         # Extract error type and message
-        error_match = re.search(r'(\w+Error): (.+)$', error_input, re.MULTILINE)
+        error_match = _ERROR_RE.search(error_input)
         if error_match:
             error_info["message"] = f"{error_match.group(1)}: {error_match.group(2)}"
 
-    # Test output pattern
-    elif "FAILED" in error_input or "AssertionError" in error_input:
-        error_info["type"] = "test_failure"
-
-    # Syntax error pattern
-    elif "SyntaxError" in error_input or "invalid syntax" in error_input:
-        error_info["type"] = "syntax_error"
+    # Test output pattern / Syntax error pattern
+    else:
+        error_info["type"] = error_type
 
     return error_info
 
 
+@lru_cache(maxsize=128)
 def _validate_python_syntax(code: str) -> tuple[bool, Optional[str]]:
-    """Validate Python code syntax"""
+    """Validate Python code syntax (memoized: retries often return identical code)"""
     try:
         ast.parse(code)
         return True, None
@@ -133,13 +204,12 @@ Error Analysis:
 Provide the fixed code followed by a brief explanation of changes."""}
     ]
 
-    response = openai_completion(
+    chunks = openai_completion_stream(
         api_key=api_key,
         base_url=base_url,
         max_retries=2,
         model=model,
         messages=messages,
-        stream=False,
         temperature=temperature,
         top_p=1.0,
         frequency_penalty=0.0,
@@ -147,20 +217,30 @@ Provide the fixed code followed by a brief explanation of changes."""}
         timeout=30.0
     )
 
-    # Try to extract code and explanation
-    if "```" in response:
-        parts = response.split("```")
-        code_part = parts[1] if len(parts) > 1 else response
-        # Remove language identifier
-        code_part = re.sub(r'^python\n', '', code_part, flags=re.IGNORECASE)
-        explanation = parts[2] if len(parts) > 2 else "Code fixed"
-        return code_part.strip(), explanation.strip()
+    # Segment code and explanation while streaming, instead of splitting the full response
+    segmenter = FenceSegmenter()
+    buffers = {name: io.StringIO() for name in FenceSegmenter.SEGMENTS}
+    for chunk in chunks:
+        for segment, text in segmenter.feed(chunk):
+            if segment in buffers:
+                buffers[segment].write(text)
+    for segment, text in segmenter.close():
+        if segment in buffers:
+            buffers[segment].write(text)
 
-    return response, "Code fixed"
+    if not segmenter.fences:
+        return buffers["preamble"].getvalue(), "Code fixed"
+
+    # Remove language identifier
+    code_part = _LANG_HEADER_RE.sub('', buffers["code"].getvalue())
+    explanation = buffers["explanation"].getvalue() if segmenter.fences > 1 else "Code fixed"
+    return code_part.strip(), explanation.strip()
 
 
 def _generate_diff(original: str, fixed: str, filename: str = "code") -> str:
     """Generate unified diff between original and fixed code"""
+    if original == fixed:
+        return ""
     diff = difflib.unified_diff(
         original.splitlines(keepends=True),
         fixed.splitlines(keepends=True),
@@ -252,34 +332,48 @@ def fix_code(
 
         if not tests_passed and config.iterate_until_passing and config.max_iterations > 1:
             # Iterative fixing
-            for iteration in range(1, config.max_iterations):
-                if verbose:
-                    print(f"Iteration {iteration + 1}: Tests failed, attempting to fix...")
-
-                # Re-analyze with test results
-                new_error_input = f"{error_input}\n\nTest Results:\n{test_results}"
-                error_analysis = _analyze_error(new_error_input, fixed_code, api_key, base_url, model, temperature)
-                fixed_code, fix_explanation = _generate_fix(new_error_input, fixed_code, error_analysis,
-                                                            api_key, base_url, model, temperature)
-
-                # Run tests again
-                test_results = tool_funcs.shell_exec(config.test_command, timeout=60.0)
-                tests_passed = "FAILED" not in test_results and "ERROR" not in test_results
-
-                if tests_passed:
-                    diff = _generate_diff(original_code, fixed_code, source_file or "code")
-                    if config.write_back and (config.file_path or source_file):
-                        target_file = config.file_path or source_file
-                        tool_funcs.write_file_safe(target_file, fixed_code, config.backup_original)
-                    return FixResult(
-                        success=True,
-                        fixed_code=fixed_code,
-                        error_analysis=error_analysis,
-                        fix_explanation=fix_explanation,
-                        diff=diff,
-                        test_results=test_results,
-                        iterations_used=iteration + 1
-                    )
+            check_syntax = error_info["type"] in ["python_traceback", "syntax_error"]
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                for iteration in range(1, config.max_iterations):
+                    if verbose:
+                        print(f"Iteration {iteration + 1}: Tests failed, attempting to fix...")
+
+                    # Re-analyze with test results
+                    new_error_input = f"{error_input}\n\nTest Results:\n{test_results}"
+                    error_analysis = _analyze_error(new_error_input, fixed_code, api_key, base_url, model, temperature)
+                    fixed_code, fix_explanation = _generate_fix(new_error_input, fixed_code, error_analysis,
+                                                                api_key, base_url, model, temperature)
+
+                    # Validate syntax in the background while the test subprocess runs
+                    syntax_future = executor.submit(_validate_python_syntax, fixed_code) if check_syntax else None
+
+                    # Run tests again
+                    test_results = tool_funcs.shell_exec(config.test_command, timeout=60.0)
+                    tests_passed = "FAILED" not in test_results and "ERROR" not in test_results
+
+                    if syntax_future is not None:
+                        try:
+                            is_valid, syntax_error = syntax_future.result(timeout=5.0)
+                        except FutureTimeoutError:
+                            is_valid, syntax_error = True, None
+                        if not is_valid:
+                            tests_passed = False
+                            test_results += f"\n\nGenerated code has syntax error: {syntax_error}"
+
+                    if tests_passed:
+                        diff = _generate_diff(original_code, fixed_code, source_file or "code")
+                        if config.write_back and (config.file_path or source_file):
+                            target_file = config.file_path or source_file
+                            tool_funcs.write_file_safe(target_file, fixed_code, config.backup_original)
+                        return FixResult(
+                            success=True,
+                            fixed_code=fixed_code,
+                            error_analysis=error_analysis,
+                            fix_explanation=fix_explanation,
+                            diff=diff,
+                            test_results=test_results,
+                            iterations_used=iteration + 1
+                        )
 
             return FixResult(
                 success=False,
@@ -332,24 +426,18 @@ def fix_code_tool(**kwargs) -> str:
         verbose=kwargs.get("verbose", False)
     )
 
-    output = f"""Fix Result:
-Success: {result.success}
-Iterations: {result.iterations_used}
-
-Error Analysis:
-{result.error_analysis}
-
-Fix Explanation:
-{result.fix_explanation}
-
-Diff:
-{result.diff if result.diff else '(no changes)'}
-
-Fixed Code:
-{result.fixed_code}
-"""
+    parts = [
+        "Fix Result:\n",
+        f"Success: {result.success}\n",
+        f"Iterations: {result.iterations_used}\n\n",
+        "Error Analysis:\n", result.error_analysis, "\n\n",
+        "Fix Explanation:\n", result.fix_explanation, "\n\n",
+        "Diff:\n", result.diff or "(no changes)", "\n\n",
+        "Fixed Code:\n", result.fixed_code, "\n",
+    ]
 
     if result.test_results:
-        output += f"\nTest Results:\n{result.test_results}"
+        parts.append("\nTest Results:\n")
+        parts.append(result.test_results)
 
-    return output
+    return "".join(parts)
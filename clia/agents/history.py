@@ -1,7 +1,8 @@
-from typing import List, Dict, Literal
+from typing import Dict, List, Literal, Optional
 from pathlib import Path
 import logging
-import json
+
+from clia.utils import json_dumps_bytes
 
 Role = Literal["system", "user", "assistant"]
 Message = List[Dict[Role, str]]
@@ -9,20 +10,40 @@ logger = logging.getLogger(__name__)
 
 
 class History:
-    def __init__(self, messages: Message | None = None) -> None:
-        self._messages: Message = list(messages) if messages else []
+    def __init__(self,
+                 messages: Message | None = None,
+                 path: Optional[Path] = None,
+                 buf_threshold: int = 64) -> None:
+        # 不做防御性拷贝: 传入的列表归 History 所有, 调用方之后不应再修改它
+        # _messages 是待写入的缓冲区, flush 后清空
+        self._messages: Message = messages if messages is not None else []
+        self._path: Optional[Path] = Path(path) if path is not None else None
+        self._buf_threshold = buf_threshold
+
+    def add(self, msg: Dict[Role, str]) -> None:
+        """Buffer a message, flushing to the default path once the buffer is full."""
+        self._messages.append(msg)
+        if self._path is not None and len(self._messages) >= self._buf_threshold:
+            self.flush()
+
+    def flush(self, path: Optional[Path] = None) -> None:
+        """Append all buffered messages to path (or the default path) in one write."""
+        path = Path(path) if path is not None else self._path
+        if path is None:
+            raise ValueError("No history path given")
+        if not self._messages:
+            logger.debug("No pending messages to flush.")
+            return
+        logger.debug("flush: %d messages", len(self._messages))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 大缓冲区让多条小记录合并为一次写入
+        with path.open('ab', buffering=1 << 16) as f:
+            f.writelines(json_dumps_bytes(msg) + b'\n' for msg in self._messages)
+        logger.info("Saved %d messages to %s.", len(self._messages), path)
+        self._messages = []
 
     def save_jsonl(self, path: Path) -> None:
         if not self._messages:
             logger.error("No messages to save.")
             return
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open('a', encoding='utf-8') as f:
-            print(self._messages)
-            f.write(
-                '\n'.join([json.dumps(msg, ensure_ascii=False)
-                           for msg in self._messages])
-                + '\n'
-                )
-            logger.info(f"Saved {len(self._messages)} messages to {path}.")
-        return
+        self.flush(path)
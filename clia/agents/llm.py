@@ -1,23 +1,149 @@
-from openai import OpenAI
-from typing import List, Dict
+from functools import lru_cache
+import httpx
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+import asyncio
 import logging
+import sys
+import threading
+import time
+import weakref
+
+from clia.utils import json_dumps_bytes, json_loads
+
+# openai 在首次创建客户端时才导入; 它的依赖会连带导入 argparse 等模块, 拖慢 CLI 启动
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
 
 logger = logging.getLogger(__name__)
 
+# 连接池参数: 多个并行工具/代理调用共享同一客户端时保持足够的 keep-alive 连接
+_POOL_LIMITS = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+
+# 安装了 h2 时启用 HTTP/2, 并发请求复用同一连接多路传输
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# 单个嵌入请求的输入条数上限 (OpenAI 接口限制为 2048)
+EMBEDDING_BATCH_INPUTS = 2048
+
+# 流式输出时每隔多少个分块刷新一次 stdout (遇到换行也会刷新)
+_STREAM_FLUSH_EVERY = 16
+
+# Batch 任务的终止状态
+_BATCH_DONE_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+class TokenBucket:
+    """
+    Proactive requests-per-minute / tokens-per-minute limiter.
+
+    Both budgets refill continuously. reserve() returns how long the caller has
+    to wait before the request fits; 0.0 means it was admitted and charged.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            wait = 0.0
+            if self.rpm:
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+                if self._requests < 1:
+                    wait = (1 - self._requests) * 60.0 / self.rpm
+            if self.tpm:
+                # 单个请求超过整分钟预算时按满桶计, 否则永远无法放行
+                tokens = min(tokens, self.tpm)
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+                if self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+            if wait:
+                return wait
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int) -> None:
+        while (wait := self.reserve(tokens)) > 0:
+            logger.debug("Rate limit reached, waiting %.2fs", wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int) -> None:
+        while (wait := self.reserve(tokens)) > 0:
+            logger.debug("Rate limit reached, waiting %.2fs", wait)
+            await asyncio.sleep(wait)
+
+
+# 进程级限流器, 未配置 RPM/TPM 时为 None
+_rate_limiter: Optional[TokenBucket] = None
 
+
+def set_rate_limit(rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+    """Throttle all completion calls to rpm requests / tpm tokens per minute (None disables)."""
+    global _rate_limiter
+    _rate_limiter = TokenBucket(rpm, tpm) if (rpm or tpm) else None
+
+
+def _estimate_tokens(messages: List[Dict], max_tokens: int, n: int = 1) -> int:
+    # 粗略估计: 每 4 个字符约 1 个 token, 加上每个候选的最大输出长度
+    return n * max_tokens + sum(len(m.get("content") or "") for m in messages) // 4
+
+
+# 复用客户端: 同一组配置共享 httpx 连接池, 避免每次请求重新握手 (OpenAI 客户端线程安全)
+@lru_cache(maxsize=8)
 def _openai_client(*,
                    api_key: str,
                    base_url: str,
-                   max_retries: int) -> OpenAI:
+                   max_retries: int) -> "OpenAI":
+    from openai import OpenAI
 
     return OpenAI(
         api_key=api_key,
         base_url=base_url,
-        max_retries=max_retries
+        max_retries=max_retries,
+        http_client=httpx.Client(limits=_POOL_LIMITS, http2=_HTTP2)
         )
 
 
+# AsyncOpenAI 的连接绑定在创建它的事件循环上, 因此按事件循环分别缓存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, AsyncOpenAI]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def _async_openai_client(*,
+                         api_key: str,
+                         base_url: str,
+                         max_retries: int) -> "AsyncOpenAI":
+    from openai import AsyncOpenAI
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (api_key, base_url, max_retries)
+    client = clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            http_client=httpx.AsyncClient(limits=_POOL_LIMITS, http2=_HTTP2)
+            )
+        clients[key] = client
+    return client
+
+
 def openai_completion(*,
                       api_key: str,
                       base_url: str,
@@ -29,13 +155,21 @@ def openai_completion(*,
                       top_p: float,
                       frequency_penalty: float,
                       max_tokens: int,
-                      timeout: float) -> str:
+                      timeout: float,
+                      n: int = 1) -> Union[str, List[str]]:
 
-    logger.info("Creating OpenAI client")
+    logger.info("Getting OpenAI client")
     client = _openai_client(api_key=api_key,
                             base_url=base_url,
                             max_retries=max_retries)
 
+    # n > 1 时一次请求返回多个候选, 只占用一次 RPM 配额; 流式输出不支持多候选
+    if n > 1 and stream:
+        raise ValueError("Streaming completions do not support n > 1")
+
+    if _rate_limiter is not None:
+        _rate_limiter.acquire(_estimate_tokens(messages, max_tokens, n))
+
     logger.info("Sending OpenAI completion request")
     response = client.chat.completions.create(
         model=model,
@@ -45,10 +179,14 @@ def openai_completion(*,
         top_p=top_p,
         frequency_penalty=frequency_penalty,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        **({"n": n} if n > 1 else {})
     )
 
     logger.info("Received OpenAI completion response")
+    if n > 1:
+        logger.info("Received %d completion candidates", len(response.choices))
+        return [choice.message.content for choice in response.choices]
     # 处理响应
     full_response = []
     if not stream:
@@ -56,17 +194,304 @@ def openai_completion(*,
         content = response.choices[0].message.content
         full_response.append(content)
         logger.info("Non-streaming response received")
-        logger.debug(f"Response: {content}")
+        logger.debug("Response: %s", content)
     else:
         # 流式输出
         # print("-" * 28 + "\n")
+        # 不再逐个分块 flush, 减少 write() 系统调用
+        out = sys.stdout
+        pending = 0
         for chunk in response:
             if chunk.choices and chunk.choices[0].delta.content:
                 content = chunk.choices[0].delta.content
-                print(content, end="", flush=True)
+                out.write(content)
                 full_response.append(content)
+                pending += 1
+                if pending >= _STREAM_FLUSH_EVERY or '\n' in content:
+                    out.flush()
+                    pending = 0
+        out.flush()
         # print("\n" + "-" * 28 + "\n")
         logger.info("Streaming response received")
-        logger.debug(f"Response: {''.join(full_response)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response: %s", ''.join(full_response))
     # 对于流式响应，直接拼接而不添加额外的换行符，以保持JSON格式完整
     return ''.join(full_response) if stream else '\n'.join(full_response)
+
+
+async def openai_completion_async(*,
+                                  api_key: str,
+                                  base_url: str,
+                                  max_retries: int,
+                                  model: str,
+                                  messages: List[Dict],
+                                  stream: bool,
+                                  temperature: float,
+                                  top_p: float,
+                                  frequency_penalty: float,
+                                  max_tokens: int,
+                                  timeout: float,
+                                  n: int = 1,
+                                  response_format: Optional[Dict] = None) -> Union[str, List[str]]:
+    """
+    Async counterpart of openai_completion, using AsyncOpenAI.
+
+    response_format is passed through to the API (e.g. a json_schema for structured output).
+    """
+
+    logger.info("Getting AsyncOpenAI client")
+    client = _async_openai_client(api_key=api_key,
+                                  base_url=base_url,
+                                  max_retries=max_retries)
+
+    # n > 1 时一次请求返回多个候选, 只占用一次 RPM 配额; 流式输出不支持多候选
+    if n > 1 and stream:
+        raise ValueError("Streaming completions do not support n > 1")
+
+    if _rate_limiter is not None:
+        await _rate_limiter.acquire_async(_estimate_tokens(messages, max_tokens, n))
+
+    logger.info("Sending OpenAI completion request")
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=stream,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        **({"n": n} if n > 1 else {}),
+        **({"response_format": response_format} if response_format else {})
+    )
+
+    logger.info("Received OpenAI completion response")
+    if n > 1:
+        logger.info("Received %d completion candidates", len(response.choices))
+        return [choice.message.content for choice in response.choices]
+    if not stream:
+        content = response.choices[0].message.content
+        logger.info("Non-streaming response received")
+        logger.debug("Response: %s", content)
+        return content
+
+    full_response = []
+    out = sys.stdout
+    pending = 0
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            content = chunk.choices[0].delta.content
+            out.write(content)
+            full_response.append(content)
+            pending += 1
+            if pending >= _STREAM_FLUSH_EVERY or '\n' in content:
+                out.flush()
+                pending = 0
+    out.flush()
+    logger.info("Streaming response received")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response: %s", ''.join(full_response))
+    return ''.join(full_response)
+
+
+def openai_completion_stream(*,
+                             api_key: str,
+                             base_url: str,
+                             max_retries: int,
+                             model: str,
+                             messages: List[Dict],
+                             temperature: float,
+                             top_p: float,
+                             frequency_penalty: float,
+                             max_tokens: int,
+                             timeout: float) -> Iterator[str]:
+    """Yield response content chunks as they arrive, without printing them."""
+
+    logger.info("Getting OpenAI client")
+    client = _openai_client(api_key=api_key,
+                            base_url=base_url,
+                            max_retries=max_retries)
+
+    if _rate_limiter is not None:
+        _rate_limiter.acquire(_estimate_tokens(messages, max_tokens))
+
+    logger.info("Sending OpenAI streaming completion request")
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout
+    )
+
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+    logger.info("Streaming response received")
+
+
+async def openai_completion_stream_async(*,
+                                         api_key: str,
+                                         base_url: str,
+                                         max_retries: int,
+                                         model: str,
+                                         messages: List[Dict],
+                                         temperature: float,
+                                         top_p: float,
+                                         frequency_penalty: float,
+                                         max_tokens: int,
+                                         timeout: float,
+                                         response_format: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Async counterpart of openai_completion_stream; response_format is passed through to the API."""
+
+    logger.info("Getting AsyncOpenAI client")
+    client = _async_openai_client(api_key=api_key,
+                                  base_url=base_url,
+                                  max_retries=max_retries)
+
+    if _rate_limiter is not None:
+        await _rate_limiter.acquire_async(_estimate_tokens(messages, max_tokens))
+
+    logger.info("Sending OpenAI streaming completion request")
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        **({"response_format": response_format} if response_format else {})
+    )
+
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+    logger.info("Streaming response received")
+
+
+def openai_embedding(*,
+                     api_key: str,
+                     base_url: str,
+                     max_retries: int,
+                     model: str,
+                     text: str,
+                     timeout: float) -> List[float]:
+
+    logger.info("Getting OpenAI client")
+    client = _openai_client(api_key=api_key,
+                            base_url=base_url,
+                            max_retries=max_retries)
+
+    logger.info("Sending OpenAI embedding request")
+    response = client.embeddings.create(
+        model=model,
+        input=text,
+        timeout=timeout
+    )
+    logger.info("Received OpenAI embedding response")
+    return response.data[0].embedding
+
+
+def openai_embeddings(*,
+                      api_key: str,
+                      base_url: str,
+                      max_retries: int,
+                      model: str,
+                      texts: List[str],
+                      timeout: float) -> List[List[float]]:
+    """Embed several texts with list-input requests, returning vectors in the order of texts."""
+    logger.info("Getting OpenAI client")
+    client = _openai_client(api_key=api_key,
+                            base_url=base_url,
+                            max_retries=max_retries)
+
+    vectors: List[List[float]] = []
+    # 每个请求最多 EMBEDDING_BATCH_INPUTS 条输入, 远少于逐条请求的往返次数
+    for start in range(0, len(texts), EMBEDDING_BATCH_INPUTS):
+        chunk = texts[start:start + EMBEDDING_BATCH_INPUTS]
+        logger.info("Sending OpenAI embedding request for %d texts", len(chunk))
+        response = client.embeddings.create(
+            model=model,
+            input=chunk,
+            timeout=timeout
+        )
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    logger.info("Received OpenAI embedding responses")
+    return vectors
+
+
+def openai_batch_completions(*,
+                             api_key: str,
+                             base_url: str,
+                             max_retries: int,
+                             model: str,
+                             messages_list: List[List[Dict]],
+                             temperature: float,
+                             top_p: float,
+                             frequency_penalty: float,
+                             max_tokens: int,
+                             timeout: float,
+                             poll_interval: float = 30.0,
+                             response_format: Optional[Dict] = None) -> List[Optional[str]]:
+    """
+    Run many chat completions through the OpenAI Batch API and wait for them.
+
+    Returns one completion per entry of messages_list, in order; entries whose
+    request failed (or was not finished when the batch ended) are None.
+    """
+    logger.info("Getting OpenAI client")
+    client = _openai_client(api_key=api_key,
+                            base_url=base_url,
+                            max_retries=max_retries)
+
+    # 每行一个请求, custom_id 为请求序号
+    lines = b"".join(
+        json_dumps_bytes({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "top_p": top_p,
+                "frequency_penalty": frequency_penalty,
+                "max_tokens": max_tokens,
+                **({"response_format": response_format} if response_format else {}),
+            },
+        }) + b"\n"
+        for i, messages in enumerate(messages_list)
+    )
+    batch_file = client.files.create(file=("batch.jsonl", lines), purpose="batch", timeout=timeout)
+    batch = client.batches.create(input_file_id=batch_file.id,
+                                  endpoint="/v1/chat/completions",
+                                  completion_window="24h",
+                                  timeout=timeout)
+    logger.info("Submitted batch %s with %d requests", batch.id, len(messages_list))
+
+    while batch.status not in _BATCH_DONE_STATES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id, timeout=timeout)
+        logger.debug("Batch %s status: %s", batch.id, batch.status)
+    logger.info("Batch %s finished with status %s", batch.id, batch.status)
+
+    results: List[Optional[str]] = [None] * len(messages_list)
+    # 过期或取消的批次也可能带有部分结果
+    if batch.output_file_id:
+        output = client.files.content(batch.output_file_id, timeout=timeout).content
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json_loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                results[int(record["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+    failed = results.count(None)
+    if failed:
+        logger.warning("%d of %d batch requests failed", failed, len(messages_list))
+    return results
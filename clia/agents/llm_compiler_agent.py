@@ -10,19 +10,74 @@ Key features:
 3. Follows dependency order for sequential execution when needed
 """
 
-from typing import Dict, List, Optional, Set, Tuple
-import json
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from collections import defaultdict, deque
+import asyncio
 import re
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from .tool_router import run_tool, tools_specs, TOOLS
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlsplit
+from .tool_router import check_tool_call, run_tool, tools_specs, TOOLS
 from clia.agents import llm, prompts
+from clia.utils import json_array_end, json_loads
 
 logger = logging.getLogger(__name__)
 
 # Regex patterns to extract LLMCompiler plan components
 PLAN_PATTERN = re.compile(r"```json\s*(\[.*?\])\s*```", re.DOTALL)
-PLAN_PATTERN_SIMPLE = re.compile(r"\[.*?\]", re.DOTALL)
+
+# 工具结果只在完成时截取一次预览, 日志和合成提示词都复用它
+RESULT_PREVIEW_CHARS = 500
+
+# 计划已给出最终答案且工具结果总长度低于该值 (且无错误) 时, 跳过合成调用
+SYNTHESIS_SKIP_CHARS = 2048
+
+# 流式解析计划时, 超过该长度仍未出现 JSON 数组则放弃并退回整体解析
+PLAN_STREAM_PROBE_CHARS = 2048
+
+# 工具按负载类型分池执行: I/O 型工具大部分时间在等待, 可以放宽并发
+TOOL_KIND: Dict[str, str] = {
+    "read_file": "io",
+    "write_file": "io",
+    "shell": "io",
+    "http_get": "io",
+    "fix_code": "io",
+    "echo": "cpu",
+}
+_IO_POOL = ThreadPoolExecutor(max_workers=64, thread_name_prefix="clia-io")
+_CPU_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="clia-cpu")
+
+# 同一主机的并发 HTTP 请求上限, 避免压垮单个端点
+HTTP_PER_HOST_LIMIT = 4
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def _pool_for(step: Dict) -> ThreadPoolExecutor:
+    """Pick the executor for a step; final and invalid steps are cheap."""
+    return _IO_POOL if TOOL_KIND.get(step.get("tool"), "cpu") == "io" else _CPU_POOL
+
+
+def _host_semaphore(url) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc if isinstance(url, str) else ""
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(HTTP_PER_HOST_LIMIT)
+    return semaphore
+
+
+def _loads_plan(text: str) -> Optional[List[Dict]]:
+    """Decode text as a JSON plan, returning None unless it is a JSON array."""
+    try:
+        plan = json_loads(text)
+    except ValueError:
+        return None
+    return plan if isinstance(plan, list) else None
 
 
 def _extract_plan(response: str) -> List[Dict]:
@@ -57,94 +112,213 @@ def _extract_plan(response: str) -> List[Dict]:
         }
     ]
     """
-    # Try to find JSON in code blocks first
-    match = PLAN_PATTERN.search(response)
-    if match:
-        try:
-            plan = json.loads(match.group(1))
-            if isinstance(plan, list):
-                return plan
-        except json.JSONDecodeError:
-            pass
+    # JSON mode: the whole response is the plan; only attempt a decode when it
+    # can be an array, so prose answers skip the JSONDecodeError round-trip
+    stripped = response.strip()
+    if stripped.startswith('['):
+        plan = _loads_plan(stripped)
+        if plan is not None:
+            return plan
 
-    # Try simple JSON array
-    match = PLAN_PATTERN_SIMPLE.search(response)
-    if match:
-        try:
-            plan = json.loads(match.group(0))
-            if isinstance(plan, list):
+    # Try to find JSON in code blocks (cheap substring check before the DOTALL scan)
+    if "```json" in response:
+        match = PLAN_PATTERN.search(response)
+        if match:
+            plan = _loads_plan(match.group(1))
+            if plan is not None:
                 return plan
-        except json.JSONDecodeError:
-            pass
 
-    # Fallback: try to parse the entire response as JSON
-    try:
-        plan = json.loads(response)
-        if isinstance(plan, list):
+    # Slice from the first '[' to the last ']' with C-level str.find
+    start, end = response.find('['), response.rfind(']')
+    if start != -1 and end > start:
+        plan = _loads_plan(response[start:end + 1])
+        if plan is not None:
             return plan
-    except json.JSONDecodeError:
-        pass
+
+        # Last resort: first balanced bracketed span
+        end = json_array_end(response, start)
+        if end != -1:
+            plan = _loads_plan(response[start:end])
+            if plan is not None:
+                return plan
 
     # If no valid plan found, return a simple plan with final answer
     logger.warning("Could not extract valid plan, treating response as final answer")
     return [{"id": "final", "action": "final", "answer": response, "dependencies": []}]
 
 
-def _validate_plan(plan: List[Dict]) -> bool:
-    """Validate that the plan is a valid DAG."""
-    # Check for cycles
-    ids = {step.get("id") for step in plan if "id" in step}
+class PlanStreamParser:
+    """
+    Incrementally extract plan steps from a streamed planning response.
+
+    Finds the top-level JSON array and decodes each step object as soon as its
+    closing brace arrives, so execution can start before the plan is complete.
+    If no array starts within PLAN_STREAM_PROBE_CHARS characters, or anything in
+    the array is not a JSON object, the parser marks itself failed and the caller
+    should fall back to _extract_plan on the full text.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict] = []
+        self.failed = False
+        self.done = False
+        self._consumed = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._parts: List[str] = []
+
+    @property
+    def complete(self) -> bool:
+        """True when the whole array was parsed without falling back."""
+        return self.done and not self.failed and bool(self.steps)
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk and return the steps completed by it."""
+        if self.failed or self.done:
+            return []
+
+        new_steps: List[Dict] = []
+        start = 0
+        for i, ch in enumerate(chunk):
+            if self._depth:
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == '\\':
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in '{[':
+                    self._depth += 1
+                elif ch in '}]':
+                    self._depth -= 1
+                    if not self._depth:
+                        self._parts.append(chunk[start:i + 1])
+                        step = self._decode(''.join(self._parts))
+                        self._parts = []
+                        if step is None:
+                            break
+                        new_steps.append(step)
+                continue
+
+            if not self._in_array:
+                if ch == '[':
+                    self._in_array = True
+                elif self._consumed + i >= PLAN_STREAM_PROBE_CHARS:
+                    self.failed = True
+                    break
+            elif ch == '{':
+                self._depth = 1
+                start = i
+            elif ch == ']':
+                self.done = True
+                break
+            elif ch not in ' \t\r\n,':
+                self.failed = True
+                break
+        else:
+            if self._depth:
+                self._parts.append(chunk[start:])
+
+        self._consumed += len(chunk)
+        self.steps.extend(new_steps)
+        return new_steps
+
+    def _decode(self, text: str) -> Optional[Dict]:
+        try:
+            step = json_loads(text)
+        except ValueError:
+            step = None
+        if not isinstance(step, dict):
+            self.failed = True
+            return None
+        return step
+
+
+def _step_dependencies(step: Dict) -> FrozenSet[str]:
+    """Return the step's dependency IDs, deduplicated; a malformed field counts as none."""
+    deps = step.get("dependencies")
+    return frozenset(deps) if isinstance(deps, list) else frozenset()
+
+
+def _topological_order(plan: List[Dict]) -> Optional[List[str]]:
+    """
+    Return the step IDs in dependency order (Kahn's algorithm).
 
+    Returns None if a dependency is missing or the plan contains a cycle.
+    """
     # Build dependency graph
-    graph: Dict[str, Set[str]] = {step.get("id", ""): set() for step in plan if "id" in step}
+    graph: Dict[str, FrozenSet[str]] = {step.get("id", ""): frozenset() for step in plan if "id" in step}
 
     for step in plan:
         step_id = step.get("id")
         if not step_id:
             continue
-        deps = step.get("dependencies", [])
-        if not isinstance(deps, list):
-            deps = []
+        deps = _step_dependencies(step)
 
         # Verify all dependencies exist
         for dep in deps:
-            if dep not in ids:
-                logger.warning(f"Dependency {dep} not found in plan for step {step_id}")
-                return False
-
-        graph[step_id] = set(deps)
-
-    # Check for cycles using DFS
-    visited: Set[str] = set()
-    rec_stack: Set[str] = set()
+            if dep not in graph:
+                logger.warning("Dependency %s not found in plan for step %s", dep, step_id)
+                return None
 
-    def has_cycle(node: str) -> bool:
-        if node in rec_stack:
-            return True
-        if node in visited:
-            return False
+        graph[step_id] = deps
 
-        visited.add(node)
-        rec_stack.add(node)
-
-        for dep in graph.get(node, set()):
-            if has_cycle(dep):
-                return True
+    in_degree: Dict[str, int] = {}
+    children: Dict[str, List[str]] = defaultdict(list)
+    for step_id, deps in graph.items():
+        in_degree[step_id] = len(deps)
+        for dep in deps:
+            children[dep].append(step_id)
+
+    queue = deque(step_id for step_id, degree in in_degree.items() if degree == 0)
+    order: List[str] = []
+    while queue:
+        step_id = queue.popleft()
+        order.append(step_id)
+        for child in children[step_id]:
+            in_degree[child] -= 1
+            if not in_degree[child]:
+                queue.append(child)
+
+    # 环上的节点入度永远不会降为 0
+    if len(order) < len(graph):
+        logger.error("Plan contains cycles - not a valid DAG")
+        return None
+    return order
+
+
+def _reduced_dependencies(plan: List[Dict], order: List[str]) -> Dict[str, FrozenSet[str]]:
+    """
+    Drop dependencies already implied by another dependency (transitive reduction).
 
-        rec_stack.remove(node)
-        return False
+    If step C depends on A and B, and B itself depends on A, C only needs B.
+    order must be a topological order of the plan (see _topological_order).
+    The steps' own "dependencies" fields are left untouched.
+    """
+    deps = {step["id"]: _step_dependencies(step) for step in plan if step.get("id")}
+    ancestors: Dict[str, FrozenSet[str]] = {}
+    reduced: Dict[str, FrozenSet[str]] = {}
+    for step_id in order:
+        direct = deps.get(step_id, frozenset())
+        implied = frozenset().union(*(ancestors[dep] for dep in direct))
+        reduced[step_id] = direct - implied
+        ancestors[step_id] = direct | implied
+    return reduced
 
-    for node_id in graph:
-        if node_id not in visited:
-            if has_cycle(node_id):
-                logger.error("Plan contains cycles - not a valid DAG")
-                return False
 
-    return True
+def _validate_plan(plan: List[Dict]) -> bool:
+    """Validate that the plan is a valid DAG."""
+    return _topological_order(plan) is not None
 
 
+@lru_cache(maxsize=16)
 def _build_compiler_prompt(command: str) -> str:
-    """Build the LLMCompiler system prompt for the agent."""
+    """Build the LLMCompiler system prompt for the agent (cached per command)."""
     system_prompt, _ = prompts.get_prompt(command)
 
     compiler_system_prompt = f"""You are a helpful assistant that uses the LLMCompiler pattern to solve tasks efficiently.
@@ -223,28 +397,47 @@ Now, generate the execution plan for the task below:"""
     return compiler_system_prompt
 
 
-def _execute_step(step: Dict, results: Dict[str, str]) -> Tuple[str, str]:
-    """Execute a single step and return (step_id, result)."""
-    step_id = step.get("id", "unknown")
+def _can_skip_synthesis(base_answer: str, tool_results: Dict[str, str]) -> bool:
+    """Whether the plan's own answer plus the raw tool results is good enough."""
+    if not base_answer:
+        return False
+    if sum(len(result) for result in tool_results.values()) >= SYNTHESIS_SKIP_CHARS:
+        return False
+    return not any("error" in result.lower() for result in tool_results.values())
 
-    # Check if this is a final answer step
-    if step.get("action") == "final":
-        answer = step.get("answer", "")
-        return (step_id, answer)
 
-    # Execute tool
+def _tool_call_error(step: Dict) -> Optional[str]:
+    """Return the error result for a tool step that cannot run, or None if it is valid."""
+    step_id = step.get("id", "unknown")
     tool_name = step.get("tool")
     if not tool_name:
-        return (step_id, f"Error: No tool specified in step {step_id}")
+        return f"Error: No tool specified in step {step_id}"
 
     if tool_name not in TOOLS:
-        return (step_id, f"Error: Unknown tool '{tool_name}'. Available tools: {list(TOOLS.keys())}")
+        return f"Error: Unknown tool '{tool_name}'. Available tools: {list(TOOLS.keys())}"
 
     tool_args = step.get("args", {})
+    if not isinstance(tool_args, dict):
+        return f"Error executing {tool_name} in step {step_id}: args must be a JSON object"
+    error = check_tool_call(tool_name, tool_args)
+    if error:
+        return f"Error executing {tool_name} in step {step_id}: {error}"
+    return None
+
+
+def _run_tool_step(step: Dict) -> Tuple[str, str]:
+    """Run an already validated tool step and return (step_id, result)."""
+    step_id = step.get("id", "unknown")
+    tool_name = step["tool"]
+    tool_args = step.get("args", {})
 
     try:
-        result = run_tool(tool_name, **tool_args)
-        logger.debug(f"Step {step_id} ({tool_name}) completed: {result[:100]}...")
+        if tool_name == "http_get":
+            with _host_semaphore(tool_args.get("url")):
+                result = run_tool(tool_name, **tool_args)
+        else:
+            result = run_tool(tool_name, **tool_args)
+        logger.debug("Step %s (%s) completed: %.100s...", step_id, tool_name, result)
         return (step_id, result)
     except Exception as e:
         error_msg = f"Error executing {tool_name} in step {step_id}: {str(e)}"
@@ -252,68 +445,184 @@ def _execute_step(step: Dict, results: Dict[str, str]) -> Tuple[str, str]:
         return (step_id, error_msg)
 
 
-def _execute_plan_parallel(plan: List[Dict]) -> Dict[str, str]:
-    """
-    Execute the plan respecting dependencies and using parallel execution where possible.
-
-    Returns:
-        Dictionary mapping step IDs to their results
-    """
-    results: Dict[str, str] = {}
-    completed: Set[str] = set()
-
-    # Build dependency graph
-    step_map: Dict[str, Dict] = {step.get("id"): step for step in plan if "id" in step}
+def _execute_step(step: Dict, results: Dict[str, str]) -> Tuple[str, str]:
+    """Execute a single step and return (step_id, result)."""
+    step_id = step.get("id", "unknown")
 
-    # Execute in rounds - each round can run steps whose dependencies are satisfied
-    round_num = 0
-    max_rounds = len(plan) * 2  # Safety limit
+    # Check if this is a final answer step
+    if step.get("action") == "final":
+        answer = step.get("answer", "")
+        return (step_id, answer)
 
-    while len(completed) < len(step_map) and round_num < max_rounds:
-        round_num += 1
+    error = _tool_call_error(step)
+    if error:
+        return (step_id, error)
+    return _run_tool_step(step)
 
-        # Find steps that can be executed (all dependencies completed)
-        ready_steps = []
-        for step_id, step in step_map.items():
-            if step_id in completed:
-                continue
 
-            deps = set(step.get("dependencies", []))
-            if deps.issubset(completed):
-                ready_steps.append(step)
+class _PlanRunner:
+    """
+    Run plan steps as asyncio tasks as soon as their dependencies complete.
 
-        if not ready_steps:
-            # Check if we're stuck (might be a cycle or missing dependency)
-            remaining = set(step_map.keys()) - completed
-            logger.warning(f"No ready steps found. Remaining: {remaining}")
-            break
+    Steps can be added while earlier ones are running (e.g. while the plan is
+    still streaming in), so a step never waits for unrelated slow siblings.
+    Tools are synchronous and run on the long-lived pool matching TOOL_KIND.
 
-        # Execute ready steps in parallel
-        logger.debug(f"Round {round_num}: Executing {len(ready_steps)} steps in parallel")
+    With hold_side_effects=True, ready steps whose tool has side effects are
+    held back until release() is called with the validated plan; steps that
+    depend on them wait for them as usual. Only read-only tools run early.
+    """
 
-        with ThreadPoolExecutor(max_workers=min(len(ready_steps), 10)) as executor:
-            future_to_step = {
-                executor.submit(_execute_step, step, results): step.get("id")
-                for step in ready_steps
-            }
+    def __init__(self, hold_side_effects: bool = False):
+        self.results: Dict[str, str] = {}
+        self.previews: Dict[str, str] = {}
+        self.steps: Dict[str, Dict] = {}
+        self._unmet: Dict[str, int] = {}
+        self._children: Dict[str, List[str]] = defaultdict(list)
+        self._pending: Dict[asyncio.Future, str] = {}
+        self._closed = False
+        self._hold_side_effects = hold_side_effects
+        self._held: List[str] = []
+
+    def add(self, step: Dict, deps: Optional[FrozenSet[str]] = None) -> None:
+        """
+        Register a step, starting it right away if its dependencies are done.
+
+        deps overrides the step's own dependency list (e.g. a reduced set).
+        """
+        step_id = step.get("id")
+        if step_id is None or step_id in self.steps:
+            return
+        self.steps[step_id] = step
+
+        unmet = 0
+        for dep in (_step_dependencies(step) if deps is None else deps):
+            if dep not in self.results:
+                # 依赖尚未完成 (或尚未出现), 完成时再唤醒
+                self._children[dep].append(step_id)
+                unmet += 1
+        self._unmet[step_id] = unmet
+        if not unmet:
+            self._submit(step_id)
+
+    def close(self) -> None:
+        """Stop starting new steps; running ones are left to finish."""
+        self._closed = True
+
+    def release(self, step_map: Dict[str, Dict]) -> None:
+        """
+        Start the held side-effect steps once the complete plan has been validated.
+
+        A held or still-waiting streamed step that is missing from step_map or
+        differs from its validated version is dropped, so add() registers the
+        validated step instead.
+        """
+        self._hold_side_effects = False
+        held, self._held = self._held, []
+        # 仍在等待依赖的流式步骤同样要核对, 否则依赖完成后会执行未经校验的版本
+        waiting = [step_id for step_id, unmet in self._unmet.items() if unmet]
+        for step_id in waiting:
+            if step_map.get(step_id) != self.steps[step_id]:
+                self._forget(step_id)
+        for step_id in held:
+            if step_map.get(step_id) == self.steps[step_id]:
+                self._submit(step_id)
+            else:
+                self._forget(step_id)
+
+    def _forget(self, step_id: str) -> None:
+        """Unregister a step that has not started, so add() can register it again."""
+        del self.steps[step_id]
+        del self._unmet[step_id]
+        for children in self._children.values():
+            if step_id in children:
+                children.remove(step_id)
+
+    def _submit(self, step_id: str) -> None:
+        if self._closed:
+            return
+        step = self.steps[step_id]
+        if step.get("action") == "final":
+            # 最终答案步骤不调用工具, 直接在事件循环内完成, 省去线程切换
+            self._complete(step_id, step.get("answer", ""))
+            return
+        tool = TOOLS.get(step.get("tool"))
+        if self._hold_side_effects and tool is not None and tool.side_effects:
+            # 有副作用的工具必须等完整计划校验通过后才执行
+            logger.debug("Holding side-effect step until the plan is validated: %s", step_id)
+            self._held.append(step_id)
+            return
+        # 工具名和参数在提交前校验一次, 无效步骤直接以错误结果完成
+        error = _tool_call_error(step)
+        if error:
+            self._complete(step_id, error)
+            return
+        logger.debug("Submitting step: %s", step_id)
+        future = asyncio.get_running_loop().run_in_executor(_pool_for(step), _run_tool_step, step)
+        self._pending[future] = step_id
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: asyncio.Future) -> None:
+        step_id = self._pending.pop(future)
+        if future.cancelled():
+            return
+        try:
+            _, result = future.result()
+        except Exception as e:
+            result = f"Error executing step {step_id}: {e}"
+        self._complete(step_id, result)
+
+    def _complete(self, step_id: str, result: str) -> None:
+        self.results[step_id] = result
+        self.previews[step_id] = result[:RESULT_PREVIEW_CHARS]
+        logger.debug("Completed step: %s", step_id)
+        for child in self._children.pop(step_id, ()):
+            self._unmet[child] -= 1
+            if not self._unmet[child]:
+                self._submit(child)
+
+    async def drain(self) -> None:
+        """Wait until no step is running."""
+        while self._pending:
+            await asyncio.wait(list(self._pending))
+
+    async def finish(self) -> Dict[str, str]:
+        """Wait for all runnable steps and report the ones that never became ready."""
+        await self.drain()
+        if len(self.results) < len(self.steps):
+            remaining = set(self.steps) - set(self.results)
+            logger.warning("Some steps were not completed: %s", remaining)
+            for step_id in remaining:
+                self.results[step_id] = self.previews[step_id] = \
+                    f"Error: Step {step_id} was not executed (dependencies not satisfied)"
+        return self.results
+
+
+async def _execute_plan_async(plan: List[Dict]) -> Dict[str, str]:
+    """
+    Execute the plan respecting dependencies, running independent steps concurrently.
 
-            for future in as_completed(future_to_step):
-                step_id, result = future.result()
-                results[step_id] = result
-                completed.add(step_id)
-                logger.debug(f"Completed step: {step_id}")
+    Returns:
+        Dictionary mapping step IDs to their results
+    """
+    runner = _PlanRunner()
+    for step in plan:
+        runner.add(step)
+    return await runner.finish()
 
-    if len(completed) < len(step_map):
-        remaining = set(step_map.keys()) - completed
-        logger.warning(f"Some steps were not completed: {remaining}")
-        for step_id in remaining:
-            if step_id not in results:
-                results[step_id] = f"Error: Step {step_id} was not executed (dependencies not satisfied)"
 
-    return results
+def _execute_plan_parallel(plan: List[Dict]) -> Dict[str, str]:
+    """Synchronous wrapper around _execute_plan_async."""
+    if len(plan) == 1 and "id" in plan[0]:
+        # 单步计划无需调度, 也无需启动事件循环
+        step = plan[0]
+        if not _step_dependencies(step):
+            _, result = _execute_step(step, {})
+            return {step.get("id"): result}
+    return asyncio.run(_execute_plan_async(plan))
 
 
-def llm_compiler_agent(
+async def llm_compiler_agent_async(
     question: str,
     command: str,
     api_key: str = None,
@@ -328,10 +637,12 @@ def llm_compiler_agent(
     timeout: float = 30.0,
     verbose: bool = False,
     return_metadata: bool = False,
-    memory_manager = None
+    memory_manager = None,
+    n_candidates: int = 1,
+    candidate_scorer: Optional[Callable[[str], float]] = None
 ) -> str:
     """
-    Run an LLMCompiler agent to solve a task.
+    Run an LLMCompiler agent to solve a task (async version).
 
     Args:
         question: The user's question or task
@@ -347,6 +658,8 @@ def llm_compiler_agent(
         max_tokens: Maximum tokens in response
         timeout: Request timeout
         verbose: Whether to print intermediate steps
+        n_candidates: Number of synthesis candidates to sample in one request (n > 1 disables streaming)
+        candidate_scorer: Picks the highest-scoring candidate; defaults to the first one
 
     Returns:
         Final answer string
@@ -357,23 +670,14 @@ def llm_compiler_agent(
     # Get recent memory context if available
     memory_context = ""
     if memory_manager and memory_manager.memories:
-        from datetime import datetime, timedelta
-        recent_memories = []
-        for mem in memory_manager.memories:
-            try:
-                mem_time = datetime.fromisoformat(mem.timestamp)
-                if (datetime.now() - mem_time) < timedelta(hours=1):
-                    recent_memories.append(mem)
-            except Exception:
-                pass
-
-        # Get the most recent memories (up to 3)
-        recent_memories = sorted(recent_memories, key=lambda m: m.timestamp, reverse=True)[:3]
+        # Get the most relevant memories (up to 3; the most recent ones unless semantic retrieval is on)
+        # 语义检索可能发起阻塞的嵌入请求, 放到线程中执行以免阻塞事件循环
+        recent_memories = await asyncio.to_thread(memory_manager.relevant_memories, question, limit=3)
 
         if recent_memories:
             memory_context = "\n\n## Previous Conversation Context:\n"
             for i, mem in enumerate(recent_memories, 1):
-                memory_context += f"{i}. User asked: {mem.question}\n   Assistant answered: {mem.answer[:200]}{'...' if len(mem.answer) > 200 else ''}\n"
+                memory_context += f"{i}. User asked: {mem.question}\n   Assistant answered: {mem.answer_preview}\n"
             memory_context += "\nIf the current question relates to previous conversations (e.g., 'add 1 more', 'continue', 'what about next', etc.), please refer to the above context to understand the user's intent.\n"
 
     # Append memory context to system prompt if available
@@ -381,63 +685,117 @@ def llm_compiler_agent(
         system_prompt = system_prompt.rstrip() + memory_context
 
     # Phase 1: Planning - Get the DAG plan from LLM
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": question}
-    ]
+    # 规划与合成共用同一个 system 消息
+    sys_msg = prompts.msg("system", system_prompt)
+    messages = [sys_msg, prompts.msg("user", question)]
 
     logger.info("=" * 60)
     logger.info("PHASE 1: Planning - Generating execution plan")
     logger.info("=" * 60)
 
+    # 流式接收计划, 每个步骤对象一闭合就交给调度器, 规划与执行重叠
+    plan_parser = PlanStreamParser()
+    runner = _PlanRunner(hold_side_effects=True)
+    chunks: List[str] = []
     try:
-        plan_response = llm.openai_completion(
+        async for chunk in llm.openai_completion_stream_async(
             api_key=api_key,
             base_url=base_url,
             max_retries=max_retries,
             model=model,
             messages=messages,
-            stream=stream,
             temperature=temperature,
             top_p=top_p,
             frequency_penalty=frequency_penalty,
             max_tokens=max_tokens,
             timeout=timeout
-        )
+        ):
+            chunks.append(chunk)
+            if stream:
+                sys.stdout.write(chunk)
+            for step in plan_parser.feed(chunk):
+                runner.add(step)
     except Exception as e:
-        logger.error(f"LLM call failed during planning: {e}")
+        logger.error("LLM call failed during planning: %s", e)
+        runner.close()
+        await runner.drain()
         return f"Error: Failed to get plan from LLM: {e}"
+    finally:
+        if stream:
+            sys.stdout.flush()
 
-    logger.info(f"\n[Planning Response]\n{plan_response}\n")
+    plan_response = ''.join(chunks)
+    logger.info("\n[Planning Response]\n%s\n", plan_response)
 
     # Extract and validate plan
-    plan = _extract_plan(plan_response)
-    plan_valid = _validate_plan(plan)
+    if plan_parser.complete:
+        plan = plan_parser.steps
+    else:
+        logger.debug("Incremental plan parsing failed, falling back to full-response parsing")
+        plan = _extract_plan(plan_response)
+    order = _topological_order(plan)
+    plan_valid = order is not None
 
     if not plan_valid:
+        runner.close()
+        await runner.drain()
         logger.error("Invalid plan generated - contains cycles or missing dependencies")
         return "Error: Generated plan is invalid (contains cycles or missing dependencies). Please try again."
 
-    logger.info(f"Plan validated: {len(plan)} steps")
-    for step in plan:
-        deps = step.get("dependencies", [])
-        logger.info(f"  - {step.get('id')}: {step.get('tool', step.get('action', 'unknown'))} (deps: {deps})")
+    logger.info("Plan validated: %d steps", len(plan))
+    if logger.isEnabledFor(logging.INFO):
+        for step in plan:
+            logger.info("  - %s: %s (deps: %s)", step.get('id'),
+                        step.get('tool', step.get('action', 'unknown')), step.get("dependencies", []))
 
     # Phase 2: Execution - Execute the plan respecting dependencies
     logger.info("=" * 60)
     logger.info("PHASE 2: Execution - Running tool calls in parallel where possible")
     logger.info("=" * 60)
 
-    results = _execute_plan_parallel(plan)
+    # 按拓扑序登记, 依赖总是先于依赖它的步骤; 已在流式阶段启动的步骤会被跳过
+    step_map = {step["id"]: step for step in plan if "id" in step}
+    runner.release(step_map)
+    reduced = _reduced_dependencies(plan, order)
+    for step_id in order:
+        runner.add(step_map[step_id], reduced.get(step_id))
+    results = await runner.finish()
+    previews = runner.previews
 
-    logger.info(f"Execution completed: {len(results)} results")
-    for step_id, result in results.items():
-        logger.info(f"  - {step_id}: {result[:500]}...")
+    logger.info("Execution completed: %d results", len(results))
+    if logger.isEnabledFor(logging.INFO):
+        for step_id, preview in previews.items():
+            logger.info("  - %s: %s...", step_id, preview)
 
     logger.info("=" * 60)
     logger.info("Phase 3: Final Answer - Extract final answer or synthesize from results")
     logger.info("=" * 60)
 
+    synthesis_candidates: List[str] = []
+
+    async def synthesize(messages_synthesis: List[Dict]) -> str:
+        """Run the synthesis call, sampling n_candidates answers in a single request if asked."""
+        answer = await llm.openai_completion_async(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            model=model,
+            messages=messages_synthesis,
+            stream=stream and n_candidates <= 1,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            n=n_candidates
+        )
+        if n_candidates <= 1:
+            return answer
+        synthesis_candidates.extend(answer)
+        if candidate_scorer is None:
+            return answer[0]
+        return max(answer, key=candidate_scorer)
+
     # Phase 3: Final Answer - Extract final answer or synthesize from results
     final_steps = [step for step in plan if step.get("action") == "final"]
 
@@ -453,11 +811,15 @@ def llm_compiler_agent(
         if tool_results:
             # Synthesize answer using tool results
             results_summary = "\n".join([
-                f"{step_id}: {result[:500]}"
-                for step_id, result in tool_results.items()
+                f"{step_id}: {previews[step_id]}"
+                for step_id in tool_results
             ])
 
-            synthesis_prompt = f"""Based on the following tool execution results, provide a comprehensive final answer to the user's question.
+            if _can_skip_synthesis(base_answer, tool_results):
+                logger.info("Tool results are small and error-free, skipping synthesis call")
+                final_answer = f"{base_answer}\n\nTool Results:\n{results_summary}"
+            else:
+                synthesis_prompt = f"""Based on the following tool execution results, provide a comprehensive final answer to the user's question.
 
 Question: {question}
 
@@ -468,30 +830,15 @@ Initial Answer: {base_answer}
 
 Please provide a clear, comprehensive final answer that incorporates all relevant information from the tool results:"""
 
-            messages_synthesis = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": synthesis_prompt}
-            ]
-
-            try:
-                final_answer = llm.openai_completion(
-                    api_key=api_key,
-                    base_url=base_url,
-                    max_retries=max_retries,
-                    model=model,
-                    messages=messages_synthesis,
-                    stream=stream,
-                    temperature=temperature,
-                    top_p=top_p,
-                    frequency_penalty=frequency_penalty,
-                    max_tokens=max_tokens,
-                    timeout=timeout
-                )
-                logger.info("Successfully synthesized final answer from tool results")
-            except Exception as e:
-                logger.error(f"Failed to synthesize final answer: {e}")
-                # Fall back to base answer with results appended
-                final_answer = f"{base_answer}\n\nTool Results:\n{results_summary}"
+                messages_synthesis = [sys_msg, prompts.msg("user", synthesis_prompt)]
+
+                try:
+                    final_answer = await synthesize(messages_synthesis)
+                    logger.info("Successfully synthesized final answer from tool results")
+                except Exception as e:
+                    logger.error("Failed to synthesize final answer: %s", e)
+                    # Fall back to base answer with results appended
+                    final_answer = f"{base_answer}\n\nTool Results:\n{results_summary}"
         else:
             # No tool results, use the base answer
             final_answer = base_answer
@@ -501,8 +848,8 @@ Please provide a clear, comprehensive final answer that incorporates all relevan
 
         # Get results summary
         results_summary = "\n".join([
-            f"{step_id}: {result[:200]}"
-            for step_id, result in results.items()
+            f"{step_id}: {preview[:200]}"
+            for step_id, preview in previews.items()
         ])
 
         # Ask LLM to synthesize final answer
@@ -515,27 +862,12 @@ Tool Results:
 
 Provide a clear, concise final answer:"""
 
-        messages_synthesis = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": synthesis_prompt}
-        ]
+        messages_synthesis = [sys_msg, prompts.msg("user", synthesis_prompt)]
 
         try:
-            final_answer = llm.openai_completion(
-                api_key=api_key,
-                base_url=base_url,
-                max_retries=max_retries,
-                model=model,
-                messages=messages_synthesis,
-                stream=stream,
-                temperature=temperature,
-                top_p=top_p,
-                frequency_penalty=frequency_penalty,
-                max_tokens=max_tokens,
-                timeout=timeout
-            )
+            final_answer = await synthesize(messages_synthesis)
         except Exception as e:
-            logger.error(f"Failed to synthesize final answer: {e}")
+            logger.error("Failed to synthesize final answer: %s", e)
             final_answer = f"Tool execution completed but failed to generate final answer: {e}\n\nResults:\n{results_summary}"
 
     # Save to memory if memory manager is available
@@ -553,7 +885,7 @@ Provide a clear, concise final answer:"""
                 }
             )
         except Exception as e:
-            logger.warning(f"Failed to save memory: {e}")
+            logger.warning("Failed to save memory: %s", e)
 
     if return_metadata:
         metadata = {
@@ -561,11 +893,59 @@ Provide a clear, concise final answer:"""
             "execution_results": results,
             "plan_valid": plan_valid
         }
+        if synthesis_candidates:
+            metadata["synthesis_candidates"] = synthesis_candidates
         return final_answer, metadata
 
     return final_answer
 
 
+def llm_compiler_agent(
+    question: str,
+    command: str,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    stream: bool = False,
+    temperature: float = 0.0,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 4096,
+    timeout: float = 30.0,
+    verbose: bool = False,
+    return_metadata: bool = False,
+    memory_manager = None,
+    n_candidates: int = 1,
+    candidate_scorer: Optional[Callable[[str], float]] = None
+) -> str:
+    """
+    Run an LLMCompiler agent to solve a task.
+
+    Synchronous wrapper around llm_compiler_agent_async; see it for the arguments.
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(llm_compiler_agent_async(
+        question=question,
+        command=command,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        stream=stream,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose,
+        return_metadata=return_metadata,
+        memory_manager=memory_manager,
+        n_candidates=n_candidates,
+        candidate_scorer=candidate_scorer
+    ))
+
+
 def llm_compiler_agent_simple(
     question: str,
     command: str = "ask",
@@ -13,11 +13,53 @@ from pathlib import Path
 from datetime import datetime
 import json
 import logging
-from dataclasses import dataclass, asdict
+import mmap
+import os
+import queue
+import re
+import threading
+from dataclasses import dataclass
+import atexit
 import hashlib
+import heapq
+import time
+from collections import Counter
+from operator import attrgetter
+
+from clia.utils import json_dumps_bytes, json_loads
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for semantic retrieval
+    np = None
 
 logger = logging.getLogger(__name__)
 
+# 摘要会写入磁盘 (墓碑, 向量文件, 回答文件名), 算法必须固定, 不能随可选依赖是否安装而变
+def _content_digest(content: str) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+
+_by_epoch = attrgetter("_epoch")
+
+# 超过 ANSWER_INLINE_CHARS 的回答截断保存, 规划器上下文只使用 ANSWER_PREVIEW_CHARS 个字符的预览
+ANSWER_INLINE_CHARS = 2048
+ANSWER_PREVIEW_CHARS = 200
+_ANSWER_REF_RE = re.compile(r"…\[\+\d+ chars at ([0-9a-f]+)\]$")
+
+
+def _preview(answer: str) -> str:
+    return answer[:ANSWER_PREVIEW_CHARS] + ('...' if len(answer) > ANSWER_PREVIEW_CHARS else '')
+
+
+# 墓碑记录: {"_tombstone": [被删除条目的 content hash], "replacement": 摘要条目 (可选)}
+TOMBSTONE_KEY = "_tombstone"
+# 冗余行超过 max_memories // COMPACTION_DIVISOR 时才整体重写文件
+COMPACTION_DIVISOR = 4
+
+# 摘要话题词: 至少 4 个字母或汉字, 顺带去掉标点
+_TOPIC_WORD_RE = re.compile(r"[a-z\u4e00-\u9fff]{4,}")
+
 
 @dataclass
 class MemoryEntry:
@@ -30,19 +72,44 @@ class MemoryEntry:
     metadata: Dict[str, Any]
     summary: Optional[str] = None
 
+    def __post_init__(self):
+        # 只解析一次 ISO 时间戳; 与 _content_hash 一样是普通实例属性, 不参与比较和序列化
+        try:
+            self._epoch = datetime.fromisoformat(self.timestamp).timestamp()
+        except (TypeError, ValueError):
+            self._epoch = 0.0
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary."""
-        return asdict(self)
+        # 直接构造字典: asdict 会递归遍历字段并深拷贝 metadata
+        return {
+            "timestamp": self.timestamp,
+            "question": self.question,
+            "answer": self.answer,
+            "command": self.command,
+            "agent_type": self.agent_type,
+            "metadata": self.metadata,
+            "summary": self.summary,
+        }
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MemoryEntry':
         """Create from dictionary."""
         return cls(**data)
 
+    @property
+    def answer_preview(self) -> str:
+        """Short answer preview for prompt context (stored at insert time)."""
+        preview = self.metadata.get("preview")
+        return preview if preview is not None else _preview(self.answer)
+
     def get_content_hash(self) -> str:
-        """Get hash of question+answer for deduplication."""
-        content = f"{self.question}{self.answer}"
-        return hashlib.md5(content.encode()).hexdigest()
+        """Get hash of question+answer for deduplication (computed once per entry)."""
+        # 缓存为普通实例属性而非 dataclass 字段, 因此不会被 to_dict 序列化
+        content_hash = self.__dict__.get("_content_hash")
+        if content_hash is None:
+            content_hash = self._content_hash = _content_digest(f"{self.question}{self.answer}")
+        return content_hash
 
 
 class MemoryManager:
@@ -66,7 +133,9 @@ class MemoryManager:
         base_url: str = None,
         model: str = None,
         max_retries: int = 5,
-        timeout: float = 30.0
+        timeout: float = 30.0,
+        enable_semantic_retrieval: bool = False,
+        embedding_model: str = "text-embedding-3-small"
     ):
         """
         Initialize memory manager.
@@ -81,6 +150,9 @@ class MemoryManager:
             model: Model name for summarization (optional)
             max_retries: Max retries for API calls
             timeout: Timeout for API calls
+            enable_semantic_retrieval: Retrieve context memories by embedding similarity
+                to the question instead of recency (requires numpy and api_key)
+            embedding_model: Embedding model used for semantic retrieval
         """
         self.memory_path = Path(memory_path)
         self.max_memories = max_memories
@@ -91,47 +163,169 @@ class MemoryManager:
         self.model = model
         self.max_retries = max_retries
         self.timeout = timeout
+        self.embedding_model = embedding_model
+        self.enable_semantic_retrieval = enable_semantic_retrieval
+        if enable_semantic_retrieval and (np is None or not api_key):
+            logger.warning("Semantic memory retrieval requires numpy and an API key, using recent memories instead")
+            self.enable_semantic_retrieval = False
 
         # Ensure memory directory exists
         self.memory_path.parent.mkdir(parents=True, exist_ok=True)
+        self._dirty_count = 0
+        # 追加写入由后台线程完成, 首次追加时才启动
+        self._write_queue: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        # 入队与 close() 的哨兵互斥, 记录不会排在哨兵之后而无人写入
+        self._writer_lock = threading.Lock()
+        # LLM 摘要缓存 (range key -> summary), 首次需要摘要时才从旁路文件加载
+        self.summary_cache_path = self.memory_path.with_name(self.memory_path.stem + ".summaries.jsonl")
+        self._summary_cache: Optional[Dict[str, str]] = None
+        # 语义检索用的向量 (content hash -> L2 归一化 float32 向量), 首次检索时才加载
+        self.answers_dir = self.memory_path.parent / "answers"
+        self.embeddings_path = self.memory_path.with_name(self.memory_path.stem + ".embeddings.npz")
+        self._embeddings: Optional[Dict[str, Any]] = None
+        self._embedding_lock = threading.Lock()
 
         # Load existing memories
         self.memories: List[MemoryEntry] = self._load_memories()
+        self._rebuild_hash_index()
         logger.info(f"Loaded {len(self.memories)} memories from {self.memory_path}")
 
+    def _rebuild_hash_index(self) -> None:
+        """Recompute the content-hash set used for duplicate detection."""
+        self._hash_index = {m.get_content_hash() for m in self.memories}
+
     def _load_memories(self) -> List[MemoryEntry]:
         """Load memories from file."""
         if not self.memory_path.exists():
             return []
 
         try:
-            with self.memory_path.open('r', encoding='utf-8') as f:
+            with self.memory_path.open('rb') as f:
+                # mmap 不能映射空文件
+                if os.fstat(f.fileno()).st_size == 0:
+                    return []
+                # 只读映射整个文件, 逐行切出 bytes 直接交给解码器, 不经过文本解码
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
                 memories = []
-                for line in f:
-                    line = line.strip()
+                # 被墓碑记录删除的条目和墓碑本身都是待压缩的冗余行
+                self._dirty_count = 0
+                start, size = 0, len(mm)
+                while start < size:
+                    end = mm.find(b'\n', start)
+                    if end == -1:
+                        end = size
+                    line = mm[start:end].strip()
+                    start = end + 1
                     if not line:
                         continue
                     try:
-                        data = json.loads(line)
-                        memories.append(MemoryEntry.from_dict(data))
+                        data = json_loads(line)
+                        if TOMBSTONE_KEY in data:
+                            self._dirty_count += 1 + self._apply_tombstone(memories, data)
+                        else:
+                            memories.append(MemoryEntry.from_dict(data))
                     except json.JSONDecodeError as e:
                         logger.warning(f"Failed to parse memory entry: {e}")
                         continue
                 return memories
+            finally:
+                mm.close()
         except Exception as e:
             logger.error(f"Failed to load memories: {e}")
             return []
 
-    def _save_memories(self) -> None:
-        """Save memories to file."""
+    @staticmethod
+    def _apply_tombstone(memories: List[MemoryEntry], record: Dict[str, Any]) -> int:
+        """
+        Replay a tombstone record onto memories loaded so far.
+
+        Entries whose content hash is listed are removed and the optional replacement
+        entry (a summary) takes the position of the first removed one.
+
+        Returns:
+            Number of entries removed
+        """
+        removed = set(record[TOMBSTONE_KEY])
+        position = next((i for i, m in enumerate(memories) if m.get_content_hash() in removed), 0)
+        kept = [m for m in memories if m.get_content_hash() not in removed]
+        replacement = record.get("replacement")
+        if replacement is not None:
+            kept.insert(position, MemoryEntry.from_dict(replacement))
+        count = len(memories) - len(kept) + (replacement is not None)
+        memories[:] = kept
+        return count
+
+    def _append_memory(self, memory: MemoryEntry) -> None:
+        """Queue a single entry for the background writer to append to the memory file."""
+        self._append_record(memory.to_dict())
+
+    def _append_record(self, record: Dict[str, Any]) -> None:
+        """Queue a JSONL record for the background writer."""
+        # 在调用线程中序列化, 入队后条目再被修改也不影响写入内容
+        line = json_dumps_bytes(record) + b'\n'
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="clia-memory-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+            self._write_queue.put(line)
+
+    def _writer_loop(self) -> None:
+        """Append queued records in batches until the None sentinel arrives."""
+        f = None
+        running = True
+        while running:
+            batch = [self._write_queue.get()]
+            while True:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            # 哨兵之后的记录同样写入, 每个取出的元素都要 task_done, 否则 flush() 会一直等待
+            records = [record for record in batch if record is not None]
+            running = len(records) == len(batch)
+            try:
+                if records:
+                    if f is None:
+                        # 无缓冲: 一批记录一次 write 即落盘, 文件只打开一次
+                        f = self.memory_path.open('ab', buffering=0)
+                    f.write(b"".join(records))
+                    logger.debug(f"Appended {len(records)} memories to {self.memory_path}")
+            except Exception as e:
+                logger.error(f"Failed to append memory: {e}")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+        if f is not None:
+            f.close()
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written."""
+        self._write_queue.join()
+
+    def _rewrite_all(self) -> None:
+        """Rewrite the memory file from the in-memory list."""
+        self.close()
+        self._dirty_count = 0
         try:
-            with self.memory_path.open('w', encoding='utf-8') as f:
-                for memory in self.memories:
-                    f.write(json.dumps(memory.to_dict(), ensure_ascii=False) + '\n')
+            with self.memory_path.open('wb') as f:
+                f.writelines(json_dumps_bytes(memory.to_dict()) + b'\n' for memory in self.memories)
             logger.debug(f"Saved {len(self.memories)} memories to {self.memory_path}")
         except Exception as e:
             logger.error(f"Failed to save memories: {e}")
 
+    def close(self) -> None:
+        """Drain pending appends and stop the background writer, if running."""
+        with self._writer_lock:
+            if self._writer is None:
+                return
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+        atexit.unregister(self.close)
+
     def add_memory(
         self,
         question: str,
@@ -150,31 +344,84 @@ class MemoryManager:
             agent_type: Agent type (react, plan-build, llm-compiler)
             metadata: Additional metadata
         """
+        # 超长回答只在内联保留前 ANSWER_INLINE_CHARS 个字符, 全文另存到 answers/ 目录
+        full_answer = None
+        if len(answer) > ANSWER_INLINE_CHARS:
+            full_answer = answer
+            answer_digest = _content_digest(answer)
+            answer = (f"{answer[:ANSWER_INLINE_CHARS]}"
+                      f"…[+{len(full_answer) - ANSWER_INLINE_CHARS} chars at {answer_digest}]")
+
         memory = MemoryEntry(
             timestamp=datetime.now().isoformat(),
             question=question,
             answer=answer,
             command=command,
             agent_type=agent_type,
-            metadata=metadata or {}
+            metadata=dict(metadata) if metadata else {}
         )
+        memory.metadata["preview"] = _preview(answer)
 
         # Check for duplicates
         content_hash = memory.get_content_hash()
-        existing_hashes = {m.get_content_hash() for m in self.memories}
-        if content_hash in existing_hashes:
+        if content_hash in self._hash_index:
             logger.debug("Skipping duplicate memory entry")
             return
 
+        if full_answer is not None:
+            self._store_full_answer(answer_digest, full_answer)
+
         self.memories.append(memory)
+        self._hash_index.add(content_hash)
+
+        self._append_memory(memory)
 
-        # Manage memory size
+        # Manage memory size; evicted entries are tombstoned and the file is only
+        # rewritten once enough superseded lines have accumulated
         if len(self.memories) > self.max_memories:
+            before = self.memories
             self._manage_memory_size()
-
-        self._save_memories()
+            self._rebuild_hash_index()
+            self._record_eviction(before)
         logger.info(f"Added memory entry (total: {len(self.memories)})")
 
+    def _store_full_answer(self, answer_digest: str, answer: str) -> None:
+        """Write an over-long answer to the answers/ side directory."""
+        try:
+            self.answers_dir.mkdir(parents=True, exist_ok=True)
+            (self.answers_dir / f"{answer_digest}.txt").write_text(answer, encoding='utf-8')
+        except Exception as e:
+            logger.warning(f"Failed to store full answer: {e}")
+
+    def load_full_answer(self, memory: MemoryEntry) -> str:
+        """Return the untruncated answer of a memory, reading the side file if needed."""
+        match = _ANSWER_REF_RE.search(memory.answer)
+        if match:
+            path = self.answers_dir / f"{match.group(1)}.txt"
+            if path.exists():
+                return path.read_text(encoding='utf-8')
+        return memory.answer
+
+    def _record_eviction(self, before: List[MemoryEntry]) -> None:
+        """Persist the result of _manage_memory_size as a tombstone, or compact the file."""
+        kept_ids = {id(m) for m in self.memories}
+        before_ids = {id(m) for m in before}
+        removed = [m.get_content_hash() for m in before if id(m) not in kept_ids]
+        replacement = next((m for m in self.memories if id(m) not in before_ids), None)
+        if not removed and replacement is None:
+            # 未达到摘要阈值时没有任何条目被移除, 不写空墓碑
+            return
+
+        self._dirty_count += len(removed) + 1
+        if self._dirty_count > self.max_memories // COMPACTION_DIVISOR:
+            self._rewrite_all()
+            return
+
+        record: Dict[str, Any] = {TOMBSTONE_KEY: removed}
+        if replacement is not None:
+            record["replacement"] = replacement.to_dict()
+        self._append_record(record)
+
     def _manage_memory_size(self) -> None:
         """Manage memory size by summarizing old entries."""
         if not self.enable_summarization:
@@ -206,23 +453,86 @@ class MemoryManager:
             self.memories = [summary_entry] + self.memories[num_to_summarize:]
             logger.info(f"Summarized {num_to_summarize} memories into 1 entry")
 
+    @staticmethod
+    def _range_key(memories: List[MemoryEntry]) -> str:
+        """Stable key for a range of memories, derived from their content hashes."""
+        return _content_digest("".join(m.get_content_hash() for m in memories))
+
+    def _load_summary_cache(self) -> Dict[str, str]:
+        """Load cached summaries from the sidecar file (once)."""
+        if self._summary_cache is None:
+            self._summary_cache = {}
+            if self.summary_cache_path.exists():
+                try:
+                    with self.summary_cache_path.open('rb') as f:
+                        for line in f:
+                            if line.strip():
+                                record = json_loads(line)
+                                self._summary_cache[record["key"]] = record["summary"]
+                except Exception as e:
+                    logger.warning(f"Failed to load summary cache: {e}")
+        return self._summary_cache
+
+    def _store_summary(self, key: str, summary: str) -> None:
+        """Cache a summary in memory and append it to the sidecar file."""
+        self._load_summary_cache()[key] = summary
+        try:
+            with self.summary_cache_path.open('ab') as f:
+                f.write(json_dumps_bytes({"key": key, "summary": summary}) + b'\n')
+        except Exception as e:
+            logger.warning(f"Failed to persist summary cache: {e}")
+
     def _summarize_memories(self, memories: List[MemoryEntry]) -> str:
-        """Summarize a list of memories using LLM."""
+        """
+        Summarize a list of memories using LLM.
+
+        If the range starts with an earlier summary entry, only the entries after it
+        are sent, together with that summary. Results are cached by range key, so the
+        same range is never summarized twice.
+        """
         if not self.api_key or not self.model:
             # Fallback: simple text summary
             return self._simple_summary(memories)
 
+        range_key = self._range_key(memories)
+        cached = self._load_summary_cache().get(range_key)
+        if cached is not None:
+            logger.debug("Summary cache hit")
+            return cached
+
         try:
             from .llm import openai_completion
 
+            # 增量摘要: 已有摘要作为稳定前缀, 只追加新的对话
+            previous_summary = None
+            new_memories = memories
+            if memories[0].command == "summary" and memories[0].summary:
+                previous_summary = memories[0].summary
+                new_memories = memories[1:]
+
             # Build summary prompt
             memory_texts = []
-            for mem in memories:
+            for mem in new_memories:
                 memory_texts.append(
                     f"Q: {mem.question}\nA: {mem.answer[:500]}..."
                 )
 
-            summary_prompt = f"""Summarize the following past conversations into a concise summary that captures:
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant that summarizes conversation history."}
+            ]
+            if previous_summary:
+                messages.append({"role": "user", "content": f"Summary of earlier conversations:\n{previous_summary}"})
+                summary_prompt = f"""Update the summary above with the following newer conversations, keeping:
+1. Key topics discussed
+2. Important information or facts shared
+3. Patterns or recurring themes
+
+Append new entries:
+{chr(10).join(memory_texts)}
+
+Provide the updated concise summary (200-300 words):"""
+            else:
+                summary_prompt = f"""Summarize the following past conversations into a concise summary that captures:
 1. Key topics discussed
 2. Important information or facts shared
 3. Patterns or recurring themes
@@ -231,11 +541,7 @@ Conversations:
 {chr(10).join(memory_texts)}
 
 Provide a concise summary (200-300 words):"""
-
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant that summarizes conversation history."},
-                {"role": "user", "content": summary_prompt}
-            ]
+            messages.append({"role": "user", "content": summary_prompt})
 
             summary = openai_completion(
                 api_key=self.api_key,
@@ -249,25 +555,22 @@ Provide a concise summary (200-300 words):"""
                 frequency_penalty=0.0,
                 max_tokens=500,
                 timeout=self.timeout
-            )
+            ).strip()
 
-            return summary.strip()
+            self._store_summary(range_key, summary)
+            return summary
         except Exception as e:
             logger.warning(f"Failed to generate LLM summary: {e}, using simple summary")
             return self._simple_summary(memories)
 
     def _simple_summary(self, memories: List[MemoryEntry]) -> str:
         """Create a simple text summary without LLM."""
-        topics = {}
+        topics = Counter()
         for mem in memories:
-            # Extract key words from question
-            words = mem.question.lower().split()[:5]
-            for word in words:
-                if len(word) > 3:  # Skip short words
-                    topics[word] = topics.get(word, 0) + 1
+            # Extract key words (4+ letters, no punctuation) from question
+            topics.update(_TOPIC_WORD_RE.findall(mem.question.lower())[:5])
 
-        top_topics = sorted(topics.items(), key=lambda x: x[1], reverse=True)[:5]
-        topic_list = ", ".join([t[0] for t in top_topics])
+        topic_list = ", ".join([word for word, _ in topics.most_common(5)])
 
         return f"Summary of {len(memories)} past conversations covering topics: {topic_list}. " \
                f"Time range: {memories[0].timestamp} to {memories[-1].timestamp}."
@@ -284,19 +587,16 @@ Provide a concise summary (200-300 words):"""
             Number of memories cleared
         """
         if older_than_days:
-            from datetime import datetime, timedelta
-            cutoff = datetime.now() - timedelta(days=older_than_days)
+            cutoff = time.time() - older_than_days * 86400.0
             original_count = len(self.memories)
-            self.memories = [
-                m for m in self.memories
-                if datetime.fromisoformat(m.timestamp) >= cutoff
-            ]
+            self.memories = [m for m in self.memories if m._epoch >= cutoff]
             cleared = original_count - len(self.memories)
         else:
             cleared = len(self.memories)
             self.memories = []
 
-        self._save_memories()
+        self._rebuild_hash_index()
+        self._rewrite_all()
         logger.info(f"Cleared {cleared} memories")
         return cleared
 
@@ -311,19 +611,137 @@ Provide a concise summary (200-300 words):"""
                 "newest": None
             }
 
-        by_command = {}
-        by_agent_type = {}
+        by_command = dict(Counter(m.command for m in self.memories))
+        by_agent_type = dict(Counter(m.agent_type for m in self.memories))
 
-        for mem in self.memories:
-            by_command[mem.command] = by_command.get(mem.command, 0) + 1
-            by_agent_type[mem.agent_type] = by_agent_type.get(mem.agent_type, 0) + 1
-
-        timestamps = [datetime.fromisoformat(m.timestamp) for m in self.memories]
+        oldest = min(self.memories, key=_by_epoch)
+        newest = max(self.memories, key=_by_epoch)
 
         return {
             "total_memories": len(self.memories),
             "by_command": by_command,
             "by_agent_type": by_agent_type,
-            "oldest": min(timestamps).isoformat(),
-            "newest": max(timestamps).isoformat()
+            # 只解析两端的时间戳
+            "oldest": datetime.fromisoformat(oldest.timestamp).isoformat(),
+            "newest": datetime.fromisoformat(newest.timestamp).isoformat()
         }
+
+    def recent_memories(self, max_age_seconds: float = 3600.0, limit: int = 3) -> List[MemoryEntry]:
+        """
+        Return the newest memories recorded within max_age_seconds.
+
+        Args:
+            max_age_seconds: Only include memories younger than this
+            limit: Maximum number of memories to return
+
+        Returns:
+            Matching memories, newest first
+        """
+        cutoff = time.time() - max_age_seconds
+        return heapq.nlargest(limit, (m for m in self.memories if m._epoch > cutoff), key=_by_epoch)
+
+    def relevant_memories(self, question: str, limit: int = 3) -> List[MemoryEntry]:
+        """
+        Return the memories most relevant to question.
+
+        With semantic retrieval enabled, memories are ranked by cosine similarity
+        between their question+answer embedding and the question embedding;
+        otherwise (or if embedding fails) this falls back to recent_memories().
+
+        Args:
+            question: Current user question
+            limit: Maximum number of memories to return
+
+        Returns:
+            Matching memories, most relevant first
+        """
+        if not self.enable_semantic_retrieval or not self.memories:
+            return self.recent_memories(limit=limit)
+
+        try:
+            query = self._embed(question)
+            memories, matrix = self._memory_matrix()
+        except Exception as e:
+            logger.warning(f"Semantic memory retrieval failed: {e}, using recent memories")
+            return self.recent_memories(limit=limit)
+
+        # 条目数受 max_memories 限制, 一次矩阵-向量乘法的精确检索已足够快
+        sims = matrix @ query
+        top = np.argsort(-sims)[:limit]
+        return [memories[i] for i in top]
+
+    def _embed(self, text: str):
+        """Return the L2-normalized float32 embedding for text."""
+        from .llm import openai_embedding
+
+        vector = np.asarray(
+            openai_embedding(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=self.max_retries,
+                model=self.embedding_model,
+                text=text,
+                timeout=self.timeout
+            ),
+            dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _embed_many(self, texts: List[str]) -> List[Any]:
+        """Return L2-normalized float32 embeddings for texts, using list-input requests."""
+        from .llm import openai_embeddings
+
+        vectors = np.asarray(
+            openai_embeddings(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=self.max_retries,
+                model=self.embedding_model,
+                texts=texts,
+                timeout=self.timeout
+            ),
+            dtype=np.float32
+        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return list(vectors / np.where(norms, norms, 1.0))
+
+    def _load_embeddings(self) -> Dict[str, Any]:
+        """Load persisted memory embeddings (once)."""
+        if self._embeddings is None:
+            self._embeddings = {}
+            if self.embeddings_path.exists():
+                try:
+                    with np.load(self.embeddings_path) as data:
+                        self._embeddings = dict(zip(data["hashes"].tolist(), data["vectors"]))
+                except Exception as e:
+                    logger.warning(f"Failed to load memory embeddings: {e}")
+        return self._embeddings
+
+    def _memory_matrix(self):
+        """Return the current memories and their stacked embeddings, embedding any that are missing."""
+        # 批量运行的多个代理可能在不同线程中同时检索, 缺失的向量只嵌入一次
+        with self._embedding_lock:
+            embeddings = self._load_embeddings()
+            memories = list(self.memories)
+            missing = list({m.get_content_hash(): m for m in memories
+                            if m.get_content_hash() not in embeddings}.items())
+            if missing:
+                # 所有缺失的条目合并为一次列表输入的嵌入请求
+                vectors = self._embed_many([f"{mem.question}\n{mem.answer}" for _, mem in missing])
+                for (content_hash, _), vector in zip(missing, vectors):
+                    embeddings[content_hash] = vector
+                self._save_embeddings()
+            return memories, np.stack([embeddings[m.get_content_hash()] for m in memories])
+
+    def _save_embeddings(self) -> None:
+        """Persist embeddings of the current memories, dropping evicted ones."""
+        hashes = [h for h in list(self._hash_index) if h in self._embeddings]
+        self._embeddings = {h: self._embeddings[h] for h in hashes}
+        try:
+            # 先写临时文件再替换, 避免中断时留下损坏的文件
+            tmp_path = self.embeddings_path.with_name(self.embeddings_path.stem + ".tmp.npz")
+            np.savez(tmp_path, hashes=np.array(hashes), vectors=np.stack([self._embeddings[h] for h in hashes]))
+            os.replace(tmp_path, self.embeddings_path)
+        except Exception as e:
+            logger.warning(f"Failed to save memory embeddings: {e}")
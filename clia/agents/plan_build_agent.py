@@ -1,67 +1,50 @@
-from typing import Dict, Optional, List
-import json
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+from functools import lru_cache
+import hashlib
 import re
+import sys
 import logging
-from .tool_router import run_tool, tools_specs, TOOLS
+from .llm_compiler_agent import PlanStreamParser
+from .tool_router import ToolCallCache, run_tool, tools_specs, TOOLS
 from clia.agents import llm, prompts
+from clia.utils import json_array_end, json_dumps_bytes, json_loads
 
 
-logger = logging.getLogger(__name__)
-PLAN_RE = re.compile(r"\[.*\]", re.DOTALL)
+__all__ = ["plan_build", "plan_build_async", "plan_build_batch"]
 
+logger = logging.getLogger(__name__)
+PLAN_MAX_CANDIDATES = 8
+# 语义缓存的作用域: 计划与命令无关; 最终答案还取决于命令和工具结果
+# v2: 计划与问题中的 URL/路径一同缓存, 旧格式的计划不再读取
+PLAN_CACHE_SCOPE = "plan-build:plan:v2|%s|%s"
+ANSWER_CACHE_SCOPE = "plan-build:answer:%s:%s|%s|%s"
+# v2: 槽位带有总数 (<PATH:i/n>), 旧格式的模板不再读取
+TEMPLATE_CACHE_SCOPE = "plan-build:template:v2|%s|%s"
+# 模板只需问题意图相近, 阈值低于整份计划复用
+TEMPLATE_SIMILARITY = 0.8
+# 计划模板的槽位类型: 可以从问题文本中重新提取的参数值
+# 路径只在 URL 以外的文本中提取, 扩展名须以字母开头 (排除 "1.2" 之类的数字)
+URL_PATTERN = re.compile(r"https?://[^\s'\"<>]+")
+PATH_PATTERN = re.compile(r"(?<![\w./-])(?:[\w.-]+/)*[\w-]+\.[A-Za-z]\w*(?![\w/-])")
+# <类型:序号/总数>: 序号是该值在问题中同类值里的位置, 总数不同的问题不套用模板
+SLOT_RE = re.compile(r"<(URL|PATH):(\d+)/(\d+)>")
+# 工具参数中形如 {{step_N}} 或 {{step_N.result}} 的引用表示依赖第 N 步的结果
+STEP_REF_RE = re.compile(r"\{\{?step_(\d+)(?:\.\w+)?\}?\}")
+ERROR_LINE_RE = re.compile(r"error|warning|fail", re.IGNORECASE)
+# 超过预算的工具结果只保留首尾各 RESULT_KEEP_CHARS 个字符和中间的错误行
+RESULT_BUDGET_CHARS = 1500
+RESULT_KEEP_CHARS = 512
+TOOL_FAILED = "[工具执行失败]"
 
-def _extract_plan(plan: str) -> List[Dict]:
-    match = PLAN_RE.search(plan)
-    candidate = match.group(0) if match else None
+# 问题数达到该值且不紧急时, plan_build_batch 改用 OpenAI Batch API
+BATCH_API_MIN_QUESTIONS = 100
+# 在线并发时同时在途的问题数上限, 避免一次性打满服务端限流
+BATCH_MAX_CONCURRENCY = 8
 
-    if not candidate:
-        return [{"action": "final", "answer": plan}]
-    try:
-        plan = json.loads(candidate)
-        if isinstance(plan, list):
-            return plan
-    except Exception:
-        pass
-    return [{"action": "final", "answer": plan}]
 
-
-def _planner(question: str,
-             api_key: str,
-             base_url: str,
-             max_retries: int,
-             model: str,
-             stream: bool,
-             temperature: float,
-             top_p: float,
-             frequency_penalty: float,
-             max_tokens: int,
-             timeout: float,
-             memory_manager = None) -> List[Dict]:
-
-    # 获取任务特定的prompt
-    # Get recent memory context if available
-    memory_context = ""
-    if memory_manager and memory_manager.memories:
-        from datetime import datetime, timedelta
-        recent_memories = []
-        for mem in memory_manager.memories:
-            try:
-                mem_time = datetime.fromisoformat(mem.timestamp)
-                if (datetime.now() - mem_time) < timedelta(hours=1):
-                    recent_memories.append(mem)
-            except:
-                pass
-        
-        # Get the most recent memories (up to 3)
-        recent_memories = sorted(recent_memories, key=lambda m: m.timestamp, reverse=True)[:3]
-        
-        if recent_memories:
-            memory_context = "\n\n## 之前的对话上下文：\n"
-            for i, mem in enumerate(recent_memories, 1):
-                memory_context += f"{i}. 用户问：{mem.question}\n   助手答：{mem.answer[:200]}{'...' if len(mem.answer) > 200 else ''}\n"
-            memory_context += "\n如果当前问题与之前的对话相关 (例如'再加1'、'继续'、'然后呢'等），请参考上述上下文来理解用户的意图。\n"
-    
-    PLAN_PROMPT = f"""
+# 规划提示词模板, 只有工具规范需要填充
+PLAN_PROMPT_TEMPLATE = """
 你是一个规划-执行助手，必须按以下规则生成步骤计划：
 
 1. 输出格式必须是 JSON 数组，每个元素包含以下两种结构之一：
@@ -69,7 +52,7 @@ def _planner(question: str,
    - 最终步骤：{{"action": "final", "answer": "<string>"}}
 
 2. 可用工具规范：
-{tools_specs()}
+{tools_specs}
 
 3. 强制规则：
    - 必须以 {{"action": "final"}} 结尾，无论是否使用了工具
@@ -77,7 +60,7 @@ def _planner(question: str,
    - 如果需要工具，格式为：[工具步骤1,工具步骤2, ...,最终步骤]
    - "answer" 字段中禁止出现任何工具名称或工具调用语法
    - 工具参数必须严格符合工具规范要求
-{memory_context}
+
 4. 示例：
    [
      {{"action": "tool", "tool": "read_file", "args": {{"path_str": "test.txt", "max_chars": 1000}}, "note": "读取文件内容"}},
@@ -92,32 +75,431 @@ def _planner(question: str,
    - 工具参数必须完整且符合 schema 定义
 """
 
-    messages = [
-        {"role": "system", "content": PLAN_PROMPT},
-        {"role": "user", "content": question}
-    ]
+# 结构化输出: 用 JSON Schema 约束规划结果; 根节点必须是对象, 步骤数组放在 steps 字段中,
+# 现有的数组提取逻辑 (流式与整段) 会直接定位到这个数组
+PLAN_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "plan",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "steps": {
+                    "type": "array",
+                    "items": {
+                        "anyOf": [
+                            {
+                                "type": "object",
+                                "properties": {
+                                    "action": {"type": "string", "enum": ["tool"]},
+                                    "tool": {"type": "string", "enum": list(TOOLS)},
+                                    "args": {"type": "object"},
+                                    "note": {"type": "string"}
+                                },
+                                "required": ["action", "tool", "args"]
+                            },
+                            {
+                                "type": "object",
+                                "properties": {
+                                    "action": {"type": "string", "enum": ["final"]},
+                                    "answer": {"type": "string"}
+                                },
+                                "required": ["action", "answer"]
+                            }
+                        ]
+                    }
+                }
+            },
+            "required": ["steps"]
+        }
+    }
+}
+
+
+def _compress_tool_result(result, budget: int = RESULT_BUDGET_CHARS):
+    """Trim a long tool result to its head, tail and any error/warning lines in between."""
+    if not isinstance(result, str) or len(result) <= budget:
+        return result
+    head = result[:RESULT_KEEP_CHARS]
+    middle = result[RESULT_KEEP_CHARS:-RESULT_KEEP_CHARS]
+    tail = result[-RESULT_KEEP_CHARS:]
+    error_lines = "\n".join(line.strip() for line in middle.splitlines() if ERROR_LINE_RE.search(line))
+    error_lines = error_lines[:max(budget - 2 * RESULT_KEEP_CHARS, 0)]
+    kept = f"{error_lines}\n" if error_lines else ""
+    return f"{head}\n...[truncated {len(middle)} chars]...\n{kept}{tail}"
+
+
+def _extract_plan(plan: str) -> List[Dict]:
+    # 从 '[' 处单向扫描找到配对的 ']', 再交给 json_loads (orjson) 一次解码, 避免贪婪正则回溯
+    # 最多尝试 PLAN_MAX_CANDIDATES 个起点, 保证畸形输出下的解析时间有界
+    # 最后一个 ']' 之后的 '[' 不可能闭合, 没有 ']' 时直接退出
+    last = plan.rfind(']') + 1
+    start = plan.find('[', 0, last)
+    for _ in range(PLAN_MAX_CANDIDATES):
+        if start == -1:
+            break
+        end = json_array_end(plan, start)
+        if end != -1:
+            try:
+                candidate = json_loads(plan[start:end])
+                if isinstance(candidate, list):
+                    return candidate
+            except (ValueError, RecursionError):
+                # 解析失败或嵌套过深
+                pass
+        start = plan.find('[', start + 1, last)
+    return [{"action": "final", "answer": plan}]
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _semantic_lookup(semantic_cache, embedding, scope: str, threshold: Optional[float] = None):
+    """Return the cached response for a similar question within scope, or None."""
+    if semantic_cache is None or embedding is None:
+        return None
+    try:
+        return semantic_cache.get(embedding, scope, threshold=threshold)
+    except Exception as e:
+        logger.warning(f"Failed to read semantic cache: {e}")
+        return None
+
+
+def _semantic_store(semantic_cache, embedding, scope: str, question: str, response: str) -> None:
+    if semantic_cache is None or embedding is None:
+        return
+    try:
+        semantic_cache.put(embedding, scope, question, response)
+    except Exception as e:
+        logger.warning(f"Failed to write semantic cache: {e}")
+
+
+def _question_slots(question: str) -> Dict[str, List[str]]:
+    """Distinct URL and path values of a question, in order of appearance; paths inside URLs are ignored."""
+    urls = URL_PATTERN.findall(question)
+    outside = URL_PATTERN.sub(" ", question)
+    return {
+        "URL": list(dict.fromkeys(urls)),
+        "PATH": list(dict.fromkeys(PATH_PATTERN.findall(outside))),
+    }
+
+
+def _make_template(question: str, plan: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Parameterize a plan: tool arguments copied from the question become typed slots.
+
+    A value such as "src/app.py" that appears in the question is replaced with
+    "<PATH:i/n>", where i is its position among the question's n distinct paths;
+    other arguments are kept as constants. Returns None for plans without tool
+    steps or with question-derived values that cannot be extracted again.
+    """
+    slots = _question_slots(question)
+    template: List[Dict] = []
+    for step in plan:
+        if step.get("action") == "final":
+            # 答案因问题而异, 由 builder 重新综合
+            template.append({**step, "answer": ""})
+            continue
+        args = {}
+        for name, value in (step.get("args") or {}).items():
+            if isinstance(value, str) and value and value in question:
+                slot_type = next((t for t, values in slots.items() if value in values), None)
+                if slot_type is None:
+                    return None
+                values = slots[slot_type]
+                value = f"<{slot_type}:{values.index(value)}/{len(values)}>"
+            args[name] = value
+        template.append({**step, "args": args})
+    if not any(step.get("action") != "final" for step in template):
+        return None
+    return template
+
+
+def _fill_template(question: str, template: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Instantiate a plan template with values extracted from question.
+
+    Returns None if a slot cannot be filled, including when the question has a
+    different number of values of the slot's type than the templated one.
+    """
+    found = _question_slots(question)
+    plan: List[Dict] = []
+    for step in template:
+        args = {}
+        for name, value in (step.get("args") or {}).items():
+            match = SLOT_RE.fullmatch(value) if isinstance(value, str) else None
+            if match:
+                values = found[match.group(1)]
+                index = int(match.group(2))
+                if len(values) != int(match.group(3)) or index >= len(values):
+                    return None
+                value = values[index]
+            args[name] = value
+        plan.append({**step, "args": args} if "args" in step else dict(step))
+    return plan
+
+
+def _step_refs(step: Dict) -> Set[int]:
+    """Indices of earlier steps referenced as {{step_N}} / {{step_N.result}} in a step's string arguments."""
+    args = step.get("args") or {}
+    return {int(ref) for value in args.values() if isinstance(value, str)
+            for ref in STEP_REF_RE.findall(value)}
+
+
+def _independent_groups(tool_steps: List[Tuple[int, Dict]]) -> List[List[Tuple[int, Dict]]]:
+    """Split tool steps, in order, into groups whose steps do not reference each other."""
+    groups: List[List[Tuple[int, Dict]]] = []
+    group_indices: Set[int] = set()
+    for idx, step in tool_steps:
+        if not groups or _step_refs(step) & group_indices:
+            groups.append([])
+            group_indices = set()
+        groups[-1].append((idx, step))
+        group_indices.add(idx)
+    return groups
+
+
+def _run_plan_step(idx: int, step: Dict, tool_cache: Optional[ToolCallCache] = None) -> Dict:
+    """Run a single tool step and record its result; repeated identical calls reuse tool_cache."""
+    tool_name = step.get("tool")
+    tool_args = step.get("args", {})
+    cached = False
+    try:
+        logger.debug(f"\nRunning tool: {tool_name} with args: {tool_args}")
+        if tool_cache is not None:
+            result, cached = tool_cache.call(run_tool, tool_name, **tool_args)
+        else:
+            result = run_tool(tool_name, **tool_args)
+        logger.debug(f"\nTool execution result: {result}")
+    except Exception as e:
+        logger.error(f"Tool execution failed: {tool_name}: {e}")
+        result = f"{TOOL_FAILED} {tool_name}: {e}"
+    record = {"step": idx,
+              "tool": tool_name,
+              "args": tool_args,
+              "result": result}
+    if cached:
+        record["cached"] = True
+    return record
+
+
+class _EarlyToolSteps:
+    """
+    Start the plan's first group of independent tool steps while the plan is still streaming.
+
+    Mirrors _independent_groups: steps are started until the first final step or
+    the first step that references a step already started. Only read-only tools
+    start early; the first step with side effects ends the early group, since
+    the plan is not known to be complete yet. _execute_steps later takes the
+    running tasks instead of starting those steps again, and reports the ones
+    it did not take.
+    """
+
+    def __init__(self, max_steps: int):
+        self.max_steps = max_steps
+        # 提前启动的步骤与之后的步骤共用同一个工具调用缓存
+        self.tool_cache = ToolCallCache()
+        self._tasks: Dict[int, Tuple[Dict, asyncio.Task]] = {}
+        self._open = True
+
+    @property
+    def started(self) -> bool:
+        """Whether started steps are still waiting to be taken."""
+        return bool(self._tasks)
+
+    def add(self, idx: int, step: Dict) -> None:
+        if not self._open or idx >= self.max_steps:
+            return
+        action = step.get("action")
+        tool = TOOLS.get(step.get("tool") if action == "tool" else action)
+        if action == "final" or _step_refs(step) & self._tasks.keys() or (tool is not None and tool.side_effects):
+            self._open = False
+        elif action == "tool" or action in TOOLS:
+            logger.debug(f"\nStarting step {idx} before the plan is complete")
+            self._tasks[idx] = (step, asyncio.create_task(asyncio.to_thread(_run_plan_step, idx, step, self.tool_cache)))
+
+    def take(self, idx: int, step: Dict) -> Optional[asyncio.Task]:
+        # 回退到整段解析时计划可能不同, 只复用内容相同的步骤
+        started = self._tasks.get(idx)
+        if started is None or started[0] != step:
+            return None
+        del self._tasks[idx]
+        return started[1]
+
+    async def leftover(self) -> List[Dict]:
+        """Wait for the started steps that were never taken and return their records."""
+        tasks, self._tasks = self._tasks, {}
+        records = await asyncio.gather(*(task for _, task in tasks.values()))
+        # 计划变化后这些步骤不在最终计划中, 但已经执行过, 结果仍需交给 builder
+        return [{**record, "unplanned": True} for record in records]
+
+
+# 规划系统提示词完全静态, 只构建一次; 保持字节不变的前缀, 便于服务端提示词缓存命中
+@lru_cache(maxsize=1)
+def _plan_system_prompt() -> str:
+    return PLAN_PROMPT_TEMPLATE.format(tools_specs=tools_specs())
+
+
+async def _planner_messages(question: str, memory_manager = None) -> List[Dict]:
+    messages = [{"role": "system", "content": _plan_system_prompt()}]
+    # Get recent memory context if available
+    if memory_manager and memory_manager.memories:
+        # Get the most relevant memories (up to 3; the most recent ones unless semantic retrieval is on)
+        # 语义检索可能发起阻塞的嵌入请求, 放到线程中执行以免阻塞事件循环
+        recent_memories = await asyncio.to_thread(memory_manager.relevant_memories, question, limit=3)
+
+        if recent_memories:
+            # 记忆上下文作为单独的消息放在静态前缀之后, 只有它和问题随请求变化
+            memory_context = "## 之前的对话上下文：\n"
+            for i, mem in enumerate(recent_memories, 1):
+                memory_context += f"{i}. 用户问：{mem.question}\n   助手答：{mem.answer_preview}\n"
+            memory_context += "\n如果当前问题与之前的对话相关 (例如'再加1'、'继续'、'然后呢'等），请参考上述上下文来理解用户的意图。\n"
+            messages.append({"role": "system", "content": memory_context})
+
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+async def _planner(question: str,
+             api_key: str,
+             base_url: str,
+             max_retries: int,
+             model: str,
+             stream: bool,
+             temperature: float,
+             top_p: float,
+             frequency_penalty: float,
+             max_tokens: int,
+             timeout: float,
+             memory_manager = None,
+             semantic_cache = None,
+             embedding = None,
+             early_steps: Optional[_EarlyToolSteps] = None,
+             structured_output: bool = False) -> List[Dict]:
+
+    messages = await _planner_messages(question, memory_manager)
     # logger.debug(f"\nPlanning with messages: {messages}")
 
-    # 调用LLM API
-    response = llm.openai_completion(
-        api_key=api_key,
-        base_url=base_url,
-        max_retries=max_retries,
-        model=model,
-        messages=messages,
-        stream=stream,
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        frequency_penalty=frequency_penalty,
-        timeout=timeout
-    )
-
-    response = _extract_plan(response)
+    # 相似问题的计划直接复用缓存, 跳过规划调用; 问题中的 URL/路径必须完全相同, 否则交给模板缓存
+    scope = PLAN_CACHE_SCOPE % (model, temperature)
+    cached = _semantic_lookup(semantic_cache, embedding, scope)
+    if cached is not None:
+        try:
+            entry = json_loads(cached)
+        except ValueError:
+            entry = None
+        if isinstance(entry, dict) and isinstance(entry.get("plan"), list) \
+                and entry.get("slots") == _question_slots(question):
+            logger.info("Semantic cache hit for plan")
+            return entry["plan"]
+
+    # 意图相近的问题: 用当前问题中的 URL/路径填充缓存的计划模板
+    template_scope = TEMPLATE_CACHE_SCOPE % (model, temperature)
+    cached = _semantic_lookup(semantic_cache, embedding, template_scope, threshold=TEMPLATE_SIMILARITY)
+    if cached is not None:
+        try:
+            plan = _fill_template(question, json_loads(cached))
+        except (ValueError, TypeError, AttributeError):
+            plan = None
+        if plan is not None:
+            logger.info("Plan template cache hit")
+            return plan
+
+    # 流式接收计划, 每个步骤对象一闭合就交给 early_steps, 工具 I/O 与计划的剩余解码重叠
+    parser = PlanStreamParser()
+    chunks: List[str] = []
+    try:
+        async for chunk in llm.openai_completion_stream_async(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            frequency_penalty=frequency_penalty,
+            timeout=timeout,
+            response_format=PLAN_RESPONSE_FORMAT if structured_output else None
+        ):
+            chunks.append(chunk)
+            if stream:
+                sys.stdout.write(chunk)
+            new_steps = parser.feed(chunk)
+            if early_steps is not None:
+                for idx, step in enumerate(new_steps, len(parser.steps) - len(new_steps)):
+                    early_steps.add(idx, step)
+    finally:
+        if stream:
+            sys.stdout.flush()
+
+    text = ''.join(chunks)
+    truncated = False
+    if parser.complete:
+        response = parser.steps
+    else:
+        response = _extract_plan(text)
+        if parser.steps and len(response) == 1 and response[0].get("answer") == text:
+            # 计划被截断 (如达到 max_tokens): 保留已完整接收的步骤, 不把原始 JSON 当作答案
+            logger.warning("Plan stream ended early, keeping the complete steps received so far")
+            response = list(parser.steps)
+            truncated = True
+    if embedding is not None and not truncated:
+        entry = {"slots": _question_slots(question), "plan": response}
+        _semantic_store(semantic_cache, embedding, scope, question, json_dumps_bytes(entry).decode())
+        template = _make_template(question, response)
+        if template is not None:
+            _semantic_store(semantic_cache, embedding, template_scope, question, json_dumps_bytes(template).decode())
     return response
 
 
-def _builder(question: str,
+async def _execute_steps(plan: List[Dict], max_steps: int, early_steps: Optional[_EarlyToolSteps] = None) -> List:
+    tool_steps: List[Tuple[int, Dict]] = []
+    final_step_answer = None
+    for idx, step in enumerate(plan[: max_steps]):
+        if step["action"] == "tool" or step["action"] in TOOLS:
+            tool_steps.append((idx, step))
+        elif step["action"] == "final":
+            logger.debug(f"\nFinal answer in step: {step['answer']}")
+            final_step_answer = step["answer"]
+            break
+
+    # 互不依赖的工具步骤 (多为文件/HTTP I/O) 在线程中并发执行, 结果仍按步骤顺序排列
+    # 同一次执行中重复的无副作用工具调用只运行一次
+    tool_cache = early_steps.tool_cache if early_steps is not None else ToolCallCache()
+    results_steps: List = []
+    for group in _independent_groups(tool_steps):
+        results_steps.extend(await asyncio.gather(
+            *((early_steps and early_steps.take(idx, step))
+              or asyncio.to_thread(_run_plan_step, idx, step, tool_cache)
+              for idx, step in group)
+        ))
+    if early_steps is not None:
+        results_steps.extend(await early_steps.leftover())
+    if final_step_answer is not None:
+        results_steps.append(final_step_answer)
+    return results_steps
+
+
+def _results_text(results_steps: List) -> str:
+    # 发送给 LLM 的是压缩后的工具结果, 原始结果保留在 metadata 的 execution_results 中
+    return b"\n".join([
+        json_dumps_bytes({**step, "result": _compress_tool_result(step["result"])} if isinstance(step, dict) else step)
+        for step in results_steps
+    ]).decode()
+
+
+def _builder_messages(question: str, command: str, results_text: str) -> List[Dict]:
+    # 获取任务特定的prompt
+    return [
+        *prompts.get_prompt_prefix(command),
+        {"role": "user", "content": question},
+        {"role": "user", "content": "Planner Results:\n" + results_text}
+    ]
+
+
+async def _builder(question: str,
               plan: List[Dict],
               command: str,
               max_steps: int,
@@ -132,56 +514,54 @@ def _builder(question: str,
               max_tokens: int,
               timeout: float,
               return_metadata: bool = False,
-              memory_manager = None) -> str:
+              memory_manager = None,
+              semantic_cache = None,
+              embedding = None,
+              early_steps: Optional[_EarlyToolSteps] = None) -> str:
 
-    results_steps: List[Dict] = []
-    final_answer: Optional[str] = None
+    # 计划只有一个 final 步骤时, 规划器已经给出了答案, 无需再调用一次 LLM
+    # (提前启动过步骤时除外: 它们的结果要交给 builder)
+    if len(plan) == 1 and plan[0].get("action") == "final" and not (early_steps and early_steps.started):
+        final_answer = plan[0].get("answer", "")
+        logger.info("Plan is a single final step, skipping builder LLM call")
+        if stream:
+            # 流式模式下 main 不再打印结果, 这里补上输出
+            print(final_answer)
+        if return_metadata:
+            metadata = {
+                "plan": plan,
+                "execution_results": [final_answer],
+                "steps_executed": 0,
+                "max_steps": max_steps
+            }
+            return final_answer, metadata
+        return final_answer
 
-    for idx, step in enumerate(plan[: max_steps]):
-        if step["action"] == "tool" or step["action"] in TOOLS:
-            tool_name = step.get("tool")
-            tool_args = step.get("args", {})
-            try:
-                logger.debug(f"\nRunning tool: {tool_name} with args: {tool_args}")
-                result = run_tool(tool_name, **tool_args)
-                logger.debug(f"\nTool execution result: {result}")
-            except Exception as e:
-                logger.error(f"Tool execution failed: {tool_name}: {e}")
-                result = f"[工具执行失败] {tool_name}: {e}"
-            results_steps.append(
-                {"step": idx,
-                 "tool": tool_name,
-                 "args": tool_args,
-                 "result": result})
-        elif step["action"] == "final":
-            logger.debug(f"\nFinal answer in step: {step['answer']}")
-            results_steps.append(step["answer"])
-            break
+    results_steps = await _execute_steps(plan, max_steps, early_steps)
 
-    # 获取任务特定的prompt
-    system_prompt, few_shots = prompts.get_prompt(command)
-    results_text = "\n".join([
-        json.dumps(step, ensure_ascii=False) for step in results_steps])
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *few_shots,
-        {"role": "user", "content": question},
-        {"role": "user", "content": "Planner Results:\n" + results_text}
-    ]
+    results_text = _results_text(results_steps)
+    messages = _builder_messages(question, command, results_text)
 
-    final_answer = llm.openai_completion(
-        api_key=api_key,
-        base_url=base_url,
-        max_retries=max_retries,
-        model=model,
-        messages=messages,
-        stream=stream,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        max_tokens=max_tokens,
-        timeout=timeout
-    )
+    # 只有工具结果相同时, 缓存的最终答案才有效
+    scope = ANSWER_CACHE_SCOPE % (command, _text_digest(results_text), model, temperature)
+    final_answer = _semantic_lookup(semantic_cache, embedding, scope)
+    if final_answer is not None:
+        logger.info("Semantic cache hit for final answer")
+    else:
+        final_answer = await llm.openai_completion_async(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            model=model,
+            messages=messages,
+            stream=stream,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        _semantic_store(semantic_cache, embedding, scope, question, final_answer)
 
     # TO-DO：支持流式输出
 
@@ -198,7 +578,23 @@ def _builder(question: str,
     return final_answer
 
 
-def plan_build(question: str,
+def _remember(memory_manager, question: str, command: str, plan: List[Dict], final_answer) -> None:
+    try:
+        memory_manager.add_memory(
+            question=question,
+            answer=str(final_answer),
+            command=command,
+            agent_type="plan-build",
+            metadata={
+                "plan_length": len(plan),
+                "steps_executed": len([s for s in plan if s.get("action") != "final"])
+            }
+        )
+    except Exception as e:
+        logger.warning(f"Failed to save memory: {e}")
+
+
+async def plan_build_async(question: str,
                  command: str,
                  max_steps: int,
                  api_key: str,
@@ -212,56 +608,198 @@ def plan_build(question: str,
                  max_tokens: int,
                  timeout: float,
                  return_metadata: bool = False,
-                 memory_manager = None) -> str:
-    plan = _planner(question=question,
-                    api_key=api_key,
-                    base_url=base_url,
-                    max_retries=max_retries,
-                    model=model,
-                    stream=stream,
-                    temperature=temperature,
-                    top_p=top_p,
-                    frequency_penalty=frequency_penalty,
-                    max_tokens=max_tokens,
-                    timeout=timeout,
-                    memory_manager=memory_manager)
-    result = _builder(question=question,
-                     plan=plan,
-                     command=command,
-                     max_steps=max_steps,
-                     api_key=api_key,
-                     base_url=base_url,
-                     max_retries=max_retries,
-                     model=model,
-                     stream=stream,
-                     temperature=temperature,
-                     top_p=top_p,
-                     frequency_penalty=frequency_penalty,
-                     max_tokens=max_tokens,
-                     timeout=timeout,
-                     return_metadata=return_metadata,
-                     memory_manager=memory_manager)
+                 memory_manager = None,
+                 semantic_cache = None,
+                 structured_output: bool = False) -> str:
+    # 与 chat agent 一致: 流式输出和依赖记忆上下文的请求不走缓存; 问题只嵌入一次, 计划和答案查找共用
+    embedding = None
+    if semantic_cache and not stream and not (memory_manager and memory_manager.memories):
+        try:
+            embedding = await asyncio.to_thread(semantic_cache.embed, question)
+        except Exception as e:
+            logger.warning(f"Failed to embed question for semantic cache: {e}")
+
+    early_steps = _EarlyToolSteps(max_steps)
+    plan = await _planner(question=question,
+                          api_key=api_key,
+                          base_url=base_url,
+                          max_retries=max_retries,
+                          model=model,
+                          stream=stream,
+                          temperature=temperature,
+                          top_p=top_p,
+                          frequency_penalty=frequency_penalty,
+                          max_tokens=max_tokens,
+                          timeout=timeout,
+                          memory_manager=memory_manager,
+                          semantic_cache=semantic_cache,
+                          embedding=embedding,
+                          early_steps=early_steps,
+                          structured_output=structured_output)
+    result = await _builder(question=question,
+                            plan=plan,
+                            command=command,
+                            max_steps=max_steps,
+                            api_key=api_key,
+                            base_url=base_url,
+                            max_retries=max_retries,
+                            model=model,
+                            stream=stream,
+                            temperature=temperature,
+                            top_p=top_p,
+                            frequency_penalty=frequency_penalty,
+                            max_tokens=max_tokens,
+                            timeout=timeout,
+                            return_metadata=return_metadata,
+                            memory_manager=memory_manager,
+                            semantic_cache=semantic_cache,
+                            embedding=embedding,
+                            early_steps=early_steps)
     
     # Save to memory if memory manager is available
     if memory_manager:
-        try:
-            # Extract final answer from result (could be string or tuple)
-            if isinstance(result, tuple):
-                final_answer = result[0]
-            else:
-                final_answer = result
-            memory_manager.add_memory(
-                question=question,
-                answer=str(final_answer),
-                command=command,
-                agent_type="plan-build",
-                metadata={
-                    "plan_length": len(plan),
-                    "steps_executed": len([s for s in plan if s.get("action") != "final"])
-                }
-            )
-        except Exception as e:
-            import logging
-            logging.getLogger(__name__).warning(f"Failed to save memory: {e}")
+        # Extract final answer from result (could be string or tuple)
+        _remember(memory_manager, question, command, plan, result[0] if isinstance(result, tuple) else result)
     
     return result
+
+
+def plan_build(question: str,
+                 command: str,
+                 max_steps: int,
+                 api_key: str,
+                 base_url: str,
+                 max_retries: int,
+                 model: str,
+                 stream: bool,
+                 temperature: float,
+                 top_p: float,
+                 frequency_penalty: float,
+                 max_tokens: int,
+                 timeout: float,
+                 return_metadata: bool = False,
+                 memory_manager = None,
+                 semantic_cache = None,
+                 structured_output: bool = False) -> str:
+    """
+    Synchronous wrapper around plan_build_async.
+
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(plan_build_async(question=question,
+                                        command=command,
+                                        max_steps=max_steps,
+                                        api_key=api_key,
+                                        base_url=base_url,
+                                        max_retries=max_retries,
+                                        model=model,
+                                        stream=stream,
+                                        temperature=temperature,
+                                        top_p=top_p,
+                                        frequency_penalty=frequency_penalty,
+                                        max_tokens=max_tokens,
+                                        timeout=timeout,
+                                        return_metadata=return_metadata,
+                                        memory_manager=memory_manager,
+                                        semantic_cache=semantic_cache,
+                                        structured_output=structured_output))
+
+
+async def _plan_build_batch_api(questions: List[str],
+                                command: str,
+                                max_steps: int,
+                                api_key: str,
+                                base_url: str,
+                                max_retries: int,
+                                model: str,
+                                stream: bool,
+                                temperature: float,
+                                top_p: float,
+                                frequency_penalty: float,
+                                max_tokens: int,
+                                timeout: float,
+                                return_metadata: bool = False,
+                                memory_manager = None,
+                                semantic_cache = None,
+                                structured_output: bool = False) -> List:
+    # 离线批处理: 规划和构建各提交一个 Batch 文件, 工具仍在本地并发执行; 不流式输出, 也不查语义缓存
+    request = dict(api_key=api_key, base_url=base_url, max_retries=max_retries, model=model,
+                   temperature=temperature, top_p=top_p, frequency_penalty=frequency_penalty,
+                   max_tokens=max_tokens, timeout=timeout)
+
+    # 记忆上下文在提交时确定, 同一批问题看到的是相同的历史
+    planner_messages = await asyncio.gather(*(_planner_messages(question, memory_manager) for question in questions))
+    response_format = PLAN_RESPONSE_FORMAT if structured_output else None
+    responses = await asyncio.to_thread(llm.openai_batch_completions, messages_list=planner_messages,
+                                        response_format=response_format, **request)
+    plans = []
+    for messages, response in zip(planner_messages, responses):
+        if response is None:
+            # 批处理中失败的请求改走在线调用
+            response = await llm.openai_completion_async(messages=messages, stream=False,
+                                                         response_format=response_format, **request)
+        plans.append(_extract_plan(response))
+
+    # 只有一个 final 步骤的计划已经给出答案, 不进入第二个批次
+    direct = [len(plan) == 1 and plan[0].get("action") == "final" for plan in plans]
+    executions = await asyncio.gather(*(
+        _execute_steps(plan, max_steps) for plan, done in zip(plans, direct) if not done
+    ))
+    pending = [i for i, done in enumerate(direct) if not done]
+    # 只有 direct 计划保证含有步骤, 空计划与其他计划一样执行后交给构建批次
+    answers = [plan[0].get("answer", "") if done else "" for plan, done in zip(plans, direct)]
+    results_steps: List[List] = [[answer] for answer in answers]
+    for i, steps in zip(pending, executions):
+        results_steps[i] = steps
+
+    build = pending
+    if build:
+        builder_messages = [
+            _builder_messages(questions[i], command, _results_text(results_steps[i])) for i in build
+        ]
+        responses = await asyncio.to_thread(llm.openai_batch_completions, messages_list=builder_messages, **request)
+        for i, messages, response in zip(build, builder_messages, responses):
+            if response is None:
+                response = await llm.openai_completion_async(messages=messages, stream=False, **request)
+            answers[i] = response
+
+    results = []
+    for i, (question, plan, answer) in enumerate(zip(questions, plans, answers)):
+        if memory_manager:
+            _remember(memory_manager, question, command, plan, answer)
+        if return_metadata:
+            metadata = {
+                "plan": plan,
+                "execution_results": results_steps[i],
+                "steps_executed": len([s for s in results_steps[i] if isinstance(s, dict)]),
+                "max_steps": max_steps
+            }
+            results.append((answer, metadata))
+        else:
+            results.append(answer)
+    return results
+
+
+async def plan_build_batch(questions: List[str],
+                           urgency: bool = False,
+                           max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                           **kwargs) -> List:
+    """
+    Answer several questions with plan-build, returning results in the order of questions.
+
+    kwargs are passed through to plan_build_async for every question. With at
+    least BATCH_API_MIN_QUESTIONS questions and urgency=False, the planner and
+    builder prompts are submitted as two OpenAI Batch API jobs (cheaper, but may
+    take up to the 24h completion window); otherwise the questions run
+    concurrently online, at most max_concurrency at a time. Streaming output of
+    concurrent runs would interleave, so pass stream=False.
+    """
+    if not urgency and len(questions) >= BATCH_API_MIN_QUESTIONS:
+        return await _plan_build_batch_api(questions, **kwargs)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(question: str):
+        async with semaphore:
+            return await plan_build_async(question, **kwargs)
+
+    return await asyncio.gather(*(run(question) for question in questions))
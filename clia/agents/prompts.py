@@ -1,5 +1,7 @@
-from typing import Dict, List, Tuple
-Prompt = Tuple[str, List[Dict]]
+from functools import lru_cache
+from typing import Dict, Tuple
+# few-shots 使用不可变元组, 避免调用方修改共享状态
+Prompt = Tuple[str, Tuple[Dict, ...]]
 
 
 PROMPT_LIB: Dict[str, Prompt] = {
@@ -10,7 +12,7 @@ PROMPT_LIB: Dict[str, Prompt] = {
             - 解释尽量简短，突出关键步骤。
             - 无法确定时要说明假设，避免编造路径或文件。
         """,
-        []
+        (),
     ),
     "draft": (
         """
@@ -21,7 +23,7 @@ PROMPT_LIB: Dict[str, Prompt] = {
         - 优先根据用户提供的所有spec规范, 给出满足所有需求的最小实现。
         - 如果用户提供的是大型软件的spec规范, 仅给出模块、文件和目录结构, 不要给出具体的代码实现。并提示用户, 请使用clia draft命令, 以spec驱动的方式先实现模块, 逐步实现整个软件。
         """,
-        [],
+        (),
     ),
     "explain": (
         """
@@ -31,7 +33,7 @@ PROMPT_LIB: Dict[str, Prompt] = {
             - 若输入含代码，可引用行号或片段；避免凭空捏造。
             - 如信息不足，说明假设并给出需要的补充材料。
         """,
-        [],
+        (),
     ),
     "generate": (
         """
@@ -41,7 +43,7 @@ PROMPT_LIB: Dict[str, Prompt] = {
             - 简短解释设计取舍与复杂度。
             - 如果有外部依赖，显式列出。
         """,
-        [],
+        (),
     ),
     'debug': (
         """你是代码调试助手，需先定位问题再给补丁方案。
@@ -50,7 +52,7 @@ PROMPT_LIB: Dict[str, Prompt] = {
             - 如果缺少上下文，说明需要的额外信息。
             - 优先给最小修改，不要大改风格。
             """,
-        [],
+        (),
     ),
     "fix": (
         """
@@ -60,11 +62,39 @@ PROMPT_LIB: Dict[str, Prompt] = {
             - 如果缺少上下文，说明需要的额外信息。
             - 优先给最小修改，不要大改风格。
         """,
-        [],
+        (),
     ),
 }
 
 
+def msg(role: str, content: str) -> Dict[str, str]:
+    """Build a chat message dict with a fixed ("role", "content") key order."""
+    return {"role": role, "content": content}
+
+
+def _canonicalize(text: str) -> str:
+    """Strip per-line indentation and surrounding blank lines from a prompt."""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+# 规范化提示词 (去掉缩进和首尾空白), 保证前缀字节稳定, 便于服务端 prompt 缓存命中
+PROMPT_LIB: Dict[str, Prompt] = {
+    task: (_canonicalize(system_prompt), few_shots)
+    for task, (system_prompt, few_shots) in PROMPT_LIB.items()
+}
+
+
 def get_prompt(task: str) -> Prompt:
     """Return (system_prompt, few_shots) for given task, or fallback to gerneral when not matched."""
     return PROMPT_LIB.get(task)
+
+
+@lru_cache(maxsize=16)
+def get_prompt_prefix(task: str) -> Tuple[Dict, ...]:
+    """Return the frozen (system, *few_shots) message prefix for given task, falling back to "ask".
+
+    The returned dicts are shared between calls; callers should extend their own
+    message list from the tuple and never mutate the dicts in place.
+    """
+    system_prompt, few_shots = get_prompt(task) or PROMPT_LIB["ask"]
+    return (msg("system", system_prompt), *few_shots)
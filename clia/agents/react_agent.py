@@ -8,51 +8,132 @@ ReAct (Reasoning + Acting) is an iterative agent pattern where the agent:
 4. Repeats until the task is complete
 """
 
-from typing import Dict
+from typing import Any, Dict, List, Optional
+from functools import lru_cache
+import asyncio
 import json
 import re
 import logging
-from .tool_router import run_tool, tools_specs, TOOLS
+from .tool_router import ToolCallCache, run_tool, tools_specs, TOOLS
 from clia.agents import llm, prompts
+from clia.utils import truncate_tokens
 
 logger = logging.getLogger(__name__)
 
-# Regex patterns to extract ReAct components
-THOUGHT_PATTERN = re.compile(
-    r"Thought:\s*(.+?)(?=Action:|$)", re.DOTALL)
-ACTION_PATTERN = re.compile(r"Action:\s*(\w+)", re.IGNORECASE)
-ACTION_INPUT_PATTERN = re.compile(
-    r"Action Input:\s*(.+?)(?=Observation:|$)", re.DOTALL)
-FINAL_ANSWER_PATTERN = re.compile(
-    r"Final Answer:\s*(.+?)$", re.DOTALL)
-
-
-def _extract_react_components(response: str) -> Dict:
+# 对话超过该消息数后, 除最近几条外的观察结果截断为简短前缀, 避免每轮重发全部工具输出
+COMPACT_AFTER_MESSAGES = 8
+RECENT_OBSERVATIONS = 2
+OLD_OBSERVATION_TOKENS = 128
+# react_agent_batch 同时在途的问题数上限
+BATCH_MAX_CONCURRENCY = 8
+
+# Single regex extracting all ReAct components in one pass; each alternative
+# is a named group and only the Action keyword is case-insensitive (also where
+# it ends a Thought, so a lowercase "action:" is not swallowed)
+REACT_PATTERN = re.compile(
+    r"Thought:\s*(?P<thought>.+?)(?=(?i:Action):|Final Answer:|$)"
+    r"|(?i:Action):\s*(?P<action>\w+)"
+    r"|Action Input:\s*(?P<action_input>.+?)(?=Observation:|(?i:Action):|Final Answer:|$)"
+    r"|Final Answer:\s*(?P<final_answer>.+?)$",
+    re.DOTALL)
+
+
+def _extract_react_components(response: str) -> Dict[str, Any]:
     """
     Extract Thought, Action, Action Input, and Final Answer from LLM response.
 
     Returns:
-        Dict with keys: thought, action, action_input, final_answer
+        Dict with keys: thought, action, action_input, final_answer, and actions,
+        the list of (action, action_input) pairs issued before the first
+        Observation (an observation written by the model itself is not real,
+        so later actions are not trusted; if every action follows one, the
+        first action is used)
     """
-    thought_match = THOUGHT_PATTERN.search(response)
-    action_match = ACTION_PATTERN.search(response)
-    action_input_match = ACTION_INPUT_PATTERN.search(response)
-    final_answer_match = FINAL_ANSWER_PATTERN.search(response)
-
-    result = {
-        "thought": (thought_match.group(1).strip()
-                    if thought_match else None),
-        "action": (action_match.group(1).strip()
-                   if action_match else None),
-        "action_input": (action_input_match.group(1).strip()
-                         if action_input_match else None),
-        "final_answer": (final_answer_match.group(1).strip()
-                          if final_answer_match else None),
-    }
+    result: Dict[str, Any] = dict.fromkeys(("thought", "action", "action_input", "final_answer"))
+    actions: List[List[Optional[str]]] = []
+    observation_at = response.find("Observation:")
+    # 各组件取第一次出现的值
+    for match in REACT_PATTERN.finditer(response):
+        key: str = match.lastgroup or ""
+        value: str = match.group(key).strip()
+        if result[key] is None:
+            result[key] = value
+        if observation_at != -1 and match.start() > observation_at:
+            continue
+        if key == "action":
+            actions.append([value, None])
+        elif key == "action_input" and actions and actions[-1][1] is None:
+            actions[-1][1] = value
+    result["actions"] = [tuple(pair) for pair in actions]
+    if not result["actions"] and result["action"]:
+        result["actions"] = [(result["action"], result["action_input"])]
 
     return result
 
 
+def _parse_action_input(action_input_str: str) -> Dict:
+    """Parse an Action Input as JSON, falling back to the first {...} span in it."""
+    try:
+        return json.loads(action_input_str)
+    except json.JSONDecodeError:
+        # Try to extract JSON from the string if it's not pure JSON
+        json_match = re.search(r'\{[^}]+\}', action_input_str)
+        if json_match:
+            try:
+                return json.loads(json_match.group(0))
+            except json.JSONDecodeError:
+                pass
+    return {"error": f"Could not parse action input: {action_input_str}"}
+
+
+async def _run_action(action: str, action_input: Dict, tool_cache: ToolCallCache) -> str:
+    """Execute one ReAct action and return its observation; errors become the observation."""
+    try:
+        if action not in TOOLS:
+            logger.warning(f"Unknown tool requested: {action}")
+            return f"Error: Unknown tool '{action}'. Available tools: {list(TOOLS.keys())}"
+        logger.info(f"Executing tool: {action} with args: {action_input}")
+        # 工具多为阻塞 I/O, 放到线程中执行以免阻塞事件循环
+        observation, cached = await asyncio.to_thread(tool_cache.call, run_tool, action, **action_input)
+        if cached:
+            logger.info(f"Reused result of an identical earlier {action} call")
+        logger.info(f"Tool {action} executed successfully, result length: {len(observation)} chars")
+        return observation
+    except Exception as e:
+        logger.error(f"Tool execution error: {e}", exc_info=True)
+        return f"Error executing {action}: {str(e)}"
+
+
+async def _run_actions(actions: List, tool_cache: ToolCallCache) -> List[str]:
+    """
+    Execute one response's actions and return their observations in written order.
+
+    Consecutive read-only actions run concurrently; an action whose tool has
+    side effects runs alone, after everything written before it has finished.
+    """
+    observations: List[str] = []
+    batch: List = []
+
+    async def flush() -> None:
+        observations.extend(await asyncio.gather(
+            *(_run_action(action, action_input, tool_cache) for action, action_input in batch)
+        ))
+        batch.clear()
+
+    for action, action_input in actions:
+        tool = TOOLS.get(action)
+        if tool is not None and tool.side_effects:
+            # 有副作用的动作按书写顺序单独执行, 前面的读取先完成, 后面的读取看到写入结果
+            await flush()
+            observations.append(await _run_action(action, action_input, tool_cache))
+        else:
+            batch.append((action, action_input))
+    await flush()
+    return observations
+
+
+# 系统提示词只依赖 command, 缓存后每次请求的前缀字节相同, 便于服务端提示词缓存命中
+@lru_cache(maxsize=16)
 def _build_react_prompt(command: str) -> str:
     """Build the ReAct system prompt for the agent."""
     system_prompt, _ = prompts.get_prompt(command)
@@ -84,13 +165,14 @@ Final Answer: [your final answer to the user's question]
 4. If you have enough information to answer, provide Final Answer instead of another Action
 5. Be concise but thorough in your reasoning
 6. If a tool fails, reason about what went wrong and try a different approach
+7. Independent actions may be given together as several Action / Action Input pairs; their results come back as numbered Observations
 
 Let's begin!"""
 
     return react_system_prompt
 
 
-def react_agent(
+async def react_agent_async(
     question: str,
     command: str,
     max_iterations: int = 10,
@@ -109,7 +191,7 @@ def react_agent(
     memory_manager = None
 ) -> str:
     """
-    Run a ReAct agent to solve a task.
+    Run a ReAct agent to solve a task (async; LLM calls and tools do not block the event loop).
 
     Args:
         question: The user's question or task
@@ -136,37 +218,30 @@ def react_agent(
     # Get recent memory context if available
     memory_context = ""
     if memory_manager and memory_manager.memories:
-        from datetime import datetime, timedelta
-        recent_memories = []
-        for mem in memory_manager.memories:
-            try:
-                mem_time = datetime.fromisoformat(mem.timestamp)
-                if (datetime.now() - mem_time) < timedelta(hours=1):
-                    recent_memories.append(mem)
-            except Exception:
-                pass
-
-        # Get the most recent memories (up to 3)
-        recent_memories = sorted(recent_memories, key=lambda m: m.timestamp, reverse=True)[:3]
+        # Get the most relevant memories (up to 3; the most recent ones unless semantic retrieval is on)
+        # 语义检索可能发起阻塞的嵌入请求, 放到线程中执行以免阻塞事件循环
+        recent_memories = await asyncio.to_thread(memory_manager.relevant_memories, question, limit=3)
 
         if recent_memories:
-            memory_context = "\n\n## Previous Conversation Context:\n"
+            memory_context = "## Previous Conversation Context:\n"
             for i, mem in enumerate(recent_memories, 1):
-                memory_context += f"{i}. User asked: {mem.question}\n   Assistant answered: {mem.answer[:200]}{'...' if len(mem.answer) > 200 else ''}\n"
+                memory_context += f"{i}. User asked: {mem.question}\n   Assistant answered: {mem.answer_preview}\n"
             memory_context += "\nIf the current question relates to previous conversations (e.g., 'add 1 more', 'continue', 'what about next', etc.), please refer to the above context to understand the user's intent.\n"
 
-    # Append memory context to system prompt if available
-    if memory_context:
-        system_prompt = system_prompt.rstrip() + memory_context
-
     # Initialize conversation history
+    # 记忆上下文作为单独的系统消息跟在静态提示词之后, 不改动缓存的前缀
     messages = [
         {"role": "system", "content": system_prompt},
+        *([{"role": "system", "content": memory_context}] if memory_context else []),
         {"role": "user", "content": question}
     ]
 
     conversation_history = []
     full_response = []
+    # 尚未压缩的观察消息下标
+    observation_indices = []
+    # 重复的无副作用工具调用 (例如解析失败后再次读取同一文件) 直接复用结果
+    tool_cache = ToolCallCache()
 
     for iteration in range(max_iterations):
         if verbose:
@@ -176,7 +251,7 @@ def react_agent(
 
         # Get LLM response
         try:
-            response = llm.openai_completion(
+            response = await llm.openai_completion_async(
                 api_key=api_key,
                 base_url=base_url,
                 max_retries=max_retries,
@@ -230,58 +305,46 @@ def react_agent(
                 full_response.append(response)
             break
 
-        # If we reach here, we have an action to execute
-
-        # Execute the action
-        action = components["action"]
-        action_input_str = components["action_input"] or "{}"
-
+        # If we reach here, we have at least one action to execute
+        actions = [(action, _parse_action_input(action_input_str or "{}"))
+                   for action, action_input_str in components["actions"]]
         if verbose:
-            logger.info(f"Action: {action}")
-            logger.info(f"Action Input: {action_input_str}")
+            for action, action_input in actions:
+                logger.info(f"Action: {action}")
+                logger.info(f"Action Input: {action_input}")
 
-        # Parse action input (should be JSON)
-        try:
-            action_input = json.loads(action_input_str)
-        except json.JSONDecodeError:
-            # Try to extract JSON from the string if it's not pure JSON
-            json_match = re.search(r'\{[^}]+\}', action_input_str)
-            if json_match:
-                try:
-                    action_input = json.loads(json_match.group(0))
-                except json.JSONDecodeError:
-                    action_input = {"error": f"Could not parse action input: {action_input_str}"}
-            else:
-                action_input = {"error": f"Could not parse action input: {action_input_str}"}
-
-        # Execute tool
-        try:
-            if action not in TOOLS:
-                observation = f"Error: Unknown tool '{action}'. Available tools: {list(TOOLS.keys())}"
-                logger.warning(f"Unknown tool requested: {action}")
-            else:
-                logger.info(f"Executing tool: {action} with args: {action_input}")
-                observation = run_tool(action, **action_input)
-                logger.info(f"Tool {action} executed successfully, result length: {len(observation)} chars")
-        except Exception as e:
-            observation = f"Error executing {action}: {str(e)}"
-            logger.error(f"Tool execution error: {e}", exc_info=True)
+        # 同一响应中的只读动作并发执行, 结果合并为一条观察消息
+        observations = await _run_actions(actions, tool_cache)
 
         if verbose:
-            logger.info(f"Observation: {observation[:200]}..." if len(observation) > 200 else f"Observation: {observation}")
+            for observation in observations:
+                logger.info(f"Observation: {observation[:200]}..." if len(observation) > 200 else f"Observation: {observation}")
 
         # Add to conversation history
         messages.append({"role": "assistant", "content": response})
+        if len(observations) == 1:
+            observation_text = f"Observation: {observations[0]}"
+        else:
+            observation_text = "\n".join(f"Observation {i}: {observation}"
+                                         for i, observation in enumerate(observations, 1))
         messages.append({
             "role": "user",
-            "content": f"Observation: {observation}"
-        })
-
-        conversation_history.append({
-            "action": action,
-            "action_input": action_input,
-            "observation": observation
+            "content": observation_text
         })
+        observation_indices.append(len(messages) - 1)
+        if len(messages) > COMPACT_AFTER_MESSAGES:
+            # 压缩只发生一次, 之后内容不再变化, 包含它的前缀在后续轮次仍能命中服务端缓存
+            # 完整的观察结果保留在 conversation_history 中
+            while len(observation_indices) > RECENT_OBSERVATIONS:
+                i = observation_indices.pop(0)
+                messages[i] = {"role": "user", "content": truncate_tokens(messages[i]["content"], OLD_OBSERVATION_TOKENS)}
+
+        for (action, action_input), observation in zip(actions, observations):
+            conversation_history.append({
+                "action": action,
+                "action_input": action_input,
+                "observation": observation
+            })
 
         # Check if we've exceeded max iterations
         if iteration == max_iterations - 1:
@@ -324,6 +387,69 @@ def react_agent(
     return response
 
 
+def react_agent(
+    question: str,
+    command: str,
+    max_iterations: int = 10,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    stream: bool = False,
+    temperature: float = 0.0,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 4096,
+    timeout: float = 30.0,
+    verbose: bool = False,
+    return_metadata: bool = False,
+    memory_manager = None
+) -> str:
+    """
+    Run a ReAct agent to solve a task.
+
+    Synchronous wrapper around react_agent_async; see it for the arguments.
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(react_agent_async(
+        question=question,
+        command=command,
+        max_iterations=max_iterations,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        stream=stream,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose,
+        return_metadata=return_metadata,
+        memory_manager=memory_manager
+    ))
+
+
+async def react_agent_batch(questions: List[str],
+                            max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                            **kwargs) -> List:
+    """
+    Answer several questions with ReAct concurrently, returning results in the order of questions.
+
+    kwargs are passed through to react_agent_async for every question; at most
+    max_concurrency runs are in flight at a time. Streaming output of
+    concurrent runs would interleave, so pass stream=False.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(question: str):
+        async with semaphore:
+            return await react_agent_async(question, **kwargs)
+
+    return await asyncio.gather(*(run(question) for question in questions))
+
+
 def react_agent_simple(
     question: str,
     command: str = "ask",
@@ -9,9 +9,10 @@ This module provides reflection capabilities for agents to:
 """
 
 from typing import Dict, List, Optional, Any
-import json
+import asyncio
 import logging
-from .llm import openai_completion
+from clia.agents import llm
+from clia.utils import json_dumps_pretty, json_loads, json_object_end
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +84,122 @@ class AgentReflection:
         return "\n".join(lines)
 
 
-def reflect_on_execution(
+# _extract_json 最多尝试的 '{' 起点数
+JSON_MAX_CANDIDATES = 8
+
+REFLECTION_SYSTEM_PROMPT = "You are an expert AI agent evaluator. Provide honest, constructive feedback in JSON format."
+
+# reflect_many 在线模式下每个请求合并的执行记录数, 控制单次提示词长度
+REFLECT_MANY_CHUNK = 8
+# 合并请求的 max_tokens 为每条 max_tokens 之和, 不超过该值; 许多模型不接受更大的输出上限
+REFLECT_MANY_MAX_TOKENS = 8192
+# 未指定 mode 时, 记录数达到该值改用 OpenAI Batch API
+REFLECT_BATCH_API_MIN = 1000
+
+_REFLECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "success": {"type": "boolean"},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "errors": {"type": "array", "items": {"type": "string"}},
+        "improvements": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["success", "strengths", "errors", "improvements"]
+}
+
+# 合并请求的结构化输出: 根节点必须是对象, 反思数组放在 reflections 字段中, 与输入记录一一对应
+REFLECTIONS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "reflections",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "reflections": {"type": "array", "items": _REFLECTION_SCHEMA}
+            },
+            "required": ["reflections"]
+        }
+    }
+}
+
+
+# 反思提示词中与具体执行无关的部分, 模块加载时构建一次, 每次调用只拼接动态字段
+_REFLECTION_HEADER = (
+    "You are an expert AI agent evaluator. "
+    "Analyze the following agent execution and provide constructive feedback.\n\n"
+)
+_REFLECTION_INSTRUCTIONS = """## Your Task:
+Analyze this execution and provide:
+1. **Strengths**: What did the agent do well? (2-4 points)
+2. **Errors/Issues**: What went wrong or could be improved? (be specific)
+3. **Improvements**: Concrete suggestions for better performance next time
+
+Format your response as JSON:
+{
+    "success": true/false,
+    "strengths": ["strength1", "strength2", ...],
+    "errors": ["error1", "error2", ...],
+    "improvements": ["improvement1", "improvement2", ...]
+}
+
+Be honest and constructive. Focus on actionable feedback."""
+
+
+def _reflection_messages(question: str, agent_type: str, execution_summary: Dict[str, Any],
+                         final_answer: str) -> List[Dict]:
+    """Build the evaluator messages for one agent execution."""
+    reflection_prompt = (
+        f"{_REFLECTION_HEADER}## Task:\n{question}\n\n## Agent Type:\n{agent_type}\n\n"
+        f"## Execution Summary:\n{json_dumps_pretty(execution_summary)}\n\n"
+        f"## Final Answer:\n{final_answer}\n\n{_REFLECTION_INSTRUCTIONS}"
+    )
+
+    return [
+        {"role": "system", "content": REFLECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": reflection_prompt}
+    ]
+
+
+def _parsed_reflection(reflection_data: Optional[Dict], question: str, agent_type: str,
+                       execution_summary: Dict[str, Any], final_answer: str) -> AgentReflection:
+    """Turn the evaluator's JSON into an AgentReflection, with a basic one if it is missing."""
+    if not reflection_data:
+        # Fallback: create basic reflection
+        logger.warning("Could not parse reflection JSON, creating basic reflection")
+        reflection_data = {
+            "success": True,
+            "strengths": ["Agent completed the task"],
+            "errors": [],
+            "improvements": []
+        }
+
+    return AgentReflection(
+        question=question,
+        agent_type=agent_type,
+        execution_summary=execution_summary,
+        final_answer=final_answer,
+        success=reflection_data.get("success", True),
+        errors=reflection_data.get("errors", []),
+        improvements=reflection_data.get("improvements", []),
+        strengths=reflection_data.get("strengths", [])
+    )
+
+
+def _failed_reflection(error: Exception, question: str, agent_type: str,
+                       execution_summary: Dict[str, Any], final_answer: str) -> AgentReflection:
+    """Return a basic reflection recording that generation failed."""
+    return AgentReflection(
+        question=question,
+        agent_type=agent_type,
+        execution_summary=execution_summary,
+        final_answer=final_answer,
+        success=False,
+        errors=[f"Reflection generation failed: {str(error)}"],
+        improvements=["Retry reflection generation", "Check API connectivity"]
+    )
+
+
+async def areflect_on_execution(
     question: str,
     agent_type: str,
     execution_summary: Dict[str, Any],
@@ -100,7 +216,8 @@ def reflect_on_execution(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate a reflection on agent execution using LLM.
+    Generate a reflection on agent execution using LLM (async, so reflections
+    can be gathered with other work or with each other).
 
     Args:
         question: The original user question
@@ -125,47 +242,13 @@ def reflect_on_execution(
     Returns:
         AgentReflection object with analysis
     """
-    # Build reflection prompt
-    reflection_prompt = f"""You are an expert AI agent evaluator. Analyze the following agent execution and provide constructive feedback.
-
-## Task:
-{question}
-
-## Agent Type:
-{agent_type}
-
-## Execution Summary:
-{json.dumps(execution_summary, indent=2, ensure_ascii=False)}
-
-## Final Answer:
-{final_answer}
-
-## Your Task:
-Analyze this execution and provide:
-1. **Strengths**: What did the agent do well? (2-4 points)
-2. **Errors/Issues**: What went wrong or could be improved? (be specific)
-3. **Improvements**: Concrete suggestions for better performance next time
-
-Format your response as JSON:
-{{
-    "success": true/false,
-    "strengths": ["strength1", "strength2", ...],
-    "errors": ["error1", "error2", ...],
-    "improvements": ["improvement1", "improvement2", ...]
-}}
-
-Be honest and constructive. Focus on actionable feedback."""
-
-    messages = [
-        {"role": "system", "content": "You are an expert AI agent evaluator. Provide honest, constructive feedback in JSON format."},
-        {"role": "user", "content": reflection_prompt}
-    ]
+    messages = _reflection_messages(question, agent_type, execution_summary, final_answer)
 
     try:
         if verbose:
             logger.info("Generating reflection...")
 
-        response = openai_completion(
+        response = await llm.openai_completion_async(
             api_key=api_key,
             base_url=base_url,
             max_retries=max_retries,
@@ -180,28 +263,8 @@ Be honest and constructive. Focus on actionable feedback."""
         )
 
         # Extract JSON from response
-        reflection_data = _extract_json(response)
-
-        if not reflection_data:
-            # Fallback: create basic reflection
-            logger.warning("Could not parse reflection JSON, creating basic reflection")
-            reflection_data = {
-                "success": True,
-                "strengths": ["Agent completed the task"],
-                "errors": [],
-                "improvements": []
-            }
-
-        reflection = AgentReflection(
-            question=question,
-            agent_type=agent_type,
-            execution_summary=execution_summary,
-            final_answer=final_answer,
-            success=reflection_data.get("success", True),
-            errors=reflection_data.get("errors", []),
-            improvements=reflection_data.get("improvements", []),
-            strengths=reflection_data.get("strengths", [])
-        )
+        reflection = _parsed_reflection(_extract_json(response), question, agent_type,
+                                        execution_summary, final_answer)
 
         if verbose:
             logger.info("\n" + str(reflection))
@@ -210,48 +273,248 @@ Be honest and constructive. Focus on actionable feedback."""
 
     except Exception as e:
         logger.error(f"Failed to generate reflection: {e}")
-        # Return a basic reflection on error
-        return AgentReflection(
-            question=question,
-            agent_type=agent_type,
-            execution_summary=execution_summary,
-            final_answer=final_answer,
-            success=False,
-            errors=[f"Reflection generation failed: {str(e)}"],
-            improvements=["Retry reflection generation", "Check API connectivity"]
-        )
+        return _failed_reflection(e, question, agent_type, execution_summary, final_answer)
 
 
-def _extract_json(text: str) -> Optional[Dict]:
-    """Extract JSON from text response."""
-    import re
+def reflect_on_execution(
+    question: str,
+    agent_type: str,
+    execution_summary: Dict[str, Any],
+    final_answer: str,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate a reflection on agent execution using LLM.
 
-    # Try to find JSON in code blocks
-    json_match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group(1))
-        except json.JSONDecodeError:
-            pass
+    Synchronous wrapper around areflect_on_execution; see it for the arguments.
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(areflect_on_execution(
+        question=question,
+        agent_type=agent_type,
+        execution_summary=execution_summary,
+        final_answer=final_answer,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
 
-    # Try to find JSON object directly
-    json_match = re.search(r'\{.*\}', text, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group(0))
-        except json.JSONDecodeError:
-            pass
 
-    # Try parsing entire response as JSON
+def _combined_reflection_messages(items: List[Dict[str, Any]]) -> List[Dict]:
+    """Build one evaluator request covering several agent executions."""
+    records = [
+        {key: item[key] for key in ("question", "agent_type", "execution_summary", "final_answer")}
+        for item in items
+    ]
+    reflection_prompt = f"""You are an expert AI agent evaluator. Analyze each of the following {len(items)} agent executions and provide constructive feedback.
+
+## Executions (JSON array, fields: question, agent_type, execution_summary, final_answer):
+{json_dumps_pretty(records)}
+
+## Your Task:
+For each execution, in the same order, provide:
+1. **Strengths**: What did the agent do well? (2-4 points)
+2. **Errors/Issues**: What went wrong or could be improved? (be specific)
+3. **Improvements**: Concrete suggestions for better performance next time
+
+Format your response as JSON with exactly {len(items)} reflections:
+{{
+    "reflections": [
+        {{
+            "success": true/false,
+            "strengths": ["strength1", ...],
+            "errors": ["error1", ...],
+            "improvements": ["improvement1", ...]
+        }},
+        ...
+    ]
+}}
+
+Be honest and constructive. Focus on actionable feedback."""
+
+    return [
+        {"role": "system", "content": REFLECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": reflection_prompt}
+    ]
+
+
+async def _reflect_chunk(items: List[Dict[str, Any]], request: Dict[str, Any], verbose: bool) -> List[AgentReflection]:
+    # 一个请求评估整组执行记录; 返回的数量对不上时逐条重新评估
+    if len(items) == 1:
+        return [await areflect_on_execution(**items[0], **request, verbose=verbose)]
+
+    parsed = None
+    try:
+        response = await llm.openai_completion_async(
+            messages=_combined_reflection_messages(items),
+            stream=False,
+            response_format=REFLECTIONS_RESPONSE_FORMAT,
+            **{**request, "max_tokens": request["max_tokens"] * len(items)}
+        )
+        data = _extract_json(response)
+        parsed = data.get("reflections") if isinstance(data, dict) else None
+    except Exception as e:
+        logger.warning(f"Combined reflection failed: {e}")
+
+    if not isinstance(parsed, list) or len(parsed) != len(items):
+        logger.warning("Combined reflection did not cover every execution, reflecting one by one")
+        return list(await asyncio.gather(*(
+            areflect_on_execution(**item, **request, verbose=verbose) for item in items
+        )))
+    return [
+        _parsed_reflection(data if isinstance(data, dict) else None, **item)
+        for data, item in zip(parsed, items)
+    ]
+
+
+async def areflect_many(
+    reflections: List[Dict[str, Any]],
+    mode: Optional[str] = None,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False,
+    max_completion_tokens: int = REFLECT_MANY_MAX_TOKENS
+) -> List[AgentReflection]:
+    """
+    Generate reflections for many agent executions with as few requests as possible.
+
+    Args:
+        reflections: One dict per execution with the question, agent_type,
+            execution_summary and final_answer arguments of reflect_on_execution
+        mode: "online" evaluates up to REFLECT_MANY_CHUNK executions per request
+            (chunks run concurrently); "batch" submits one OpenAI Batch API job
+            (cheaper, but may take up to the 24h completion window). Defaults to
+            "batch" from REFLECT_BATCH_API_MIN executions on, "online" otherwise
+        max_tokens: Maximum tokens per reflection
+        max_completion_tokens: Maximum tokens of one combined online request;
+            a chunk holds at most max_completion_tokens // max_tokens executions
+        ... (other LLM parameters, as in reflect_on_execution)
+
+    Returns:
+        AgentReflection objects in the order of reflections
+    """
+    if mode is None:
+        mode = "batch" if len(reflections) >= REFLECT_BATCH_API_MIN else "online"
+    if mode not in ("online", "batch"):
+        raise ValueError(f"Unknown reflection mode: {mode!r}")
+
+    request = dict(api_key=api_key, base_url=base_url, max_retries=max_retries, model=model,
+                   temperature=temperature, top_p=top_p, frequency_penalty=frequency_penalty,
+                   max_tokens=max_tokens, timeout=timeout)
+
+    if mode == "online":
+        size = max(1, min(REFLECT_MANY_CHUNK, max_completion_tokens // max(max_tokens, 1)))
+        chunks = [reflections[i:i + size] for i in range(0, len(reflections), size)]
+        results = await asyncio.gather(*(_reflect_chunk(chunk, request, verbose) for chunk in chunks))
+        return [reflection for chunk in results for reflection in chunk]
+
+    messages_list = [
+        _reflection_messages(item["question"], item["agent_type"], item["execution_summary"], item["final_answer"])
+        for item in reflections
+    ]
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
+        responses = await asyncio.to_thread(llm.openai_batch_completions, messages_list=messages_list, **request)
+    except Exception as e:
+        return [_failed_reflection(e, **item) for item in reflections]
+
+    async def finish(item: Dict[str, Any], response: Optional[str]) -> AgentReflection:
+        if response is None:
+            # 批处理中失败的请求改走在线调用
+            return await areflect_on_execution(**item, **request, verbose=verbose)
+        return _parsed_reflection(_extract_json(response), **item)
+
+    return list(await asyncio.gather(*(finish(item, response) for item, response in zip(reflections, responses))))
 
+
+def reflect_many(
+    reflections: List[Dict[str, Any]],
+    mode: Optional[str] = None,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False,
+    max_completion_tokens: int = REFLECT_MANY_MAX_TOKENS
+) -> List[AgentReflection]:
+    """
+    Generate reflections for many agent executions with as few requests as possible.
+
+    Synchronous wrapper around areflect_many; see it for the arguments.
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(areflect_many(
+        reflections=reflections,
+        mode=mode,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose,
+        max_completion_tokens=max_completion_tokens
+    ))
+
+
+def _extract_json(text: str) -> Optional[Dict]:
+    """Extract the first decodable JSON object from text response, preferring a ```json block."""
+    # 有 ```json 代码块时先从块内开始扫描, 否则从头扫描; 每个候选 '{' 单向扫描到配对的 '}' 再一次解码
+    # 最多尝试 JSON_MAX_CANDIDATES 个起点, 保证畸形输出下的解析时间有界
+    fence = text.find("```json")
+    starts = [text.find('{', fence)] if fence != -1 else []
+    start = text.find('{')
+    while start != -1 and len(starts) < JSON_MAX_CANDIDATES:
+        if start not in starts:
+            starts.append(start)
+        start = text.find('{', start + 1)
+
+    for start in starts:
+        if start == -1:
+            continue
+        end = json_object_end(text, start)
+        if end == -1:
+            continue
+        try:
+            data = json_loads(text[start:end])
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(data, dict):
+            return data
     return None
 
 
-def reflect_react_agent(
+async def areflect_react_agent(
     question: str,
     conversation_history: List[Dict],
     final_answer: str,
@@ -269,7 +532,7 @@ def reflect_react_agent(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate reflection specifically for ReAct agent execution.
+    Generate reflection specifically for ReAct agent execution (async).
 
     Args:
         question: The original user question
@@ -286,22 +549,28 @@ def reflect_react_agent(
     tools_used = []
     errors_encountered = []
 
+    # 单次遍历; 观察结果已是字符串时不再重复 str()
     for turn in conversation_history:
-        if "action" in turn:
-            tools_used.append(turn.get("action"))
-        if "observation" in turn and "Error" in str(turn.get("observation", "")):
-            errors_encountered.append(str(turn.get("observation")))
+        action = turn.get("action")
+        if action:
+            tools_used.append(action)
+        observation = turn.get("observation")
+        if observation is not None:
+            if not isinstance(observation, str):
+                observation = str(observation)
+            if "Error" in observation:
+                errors_encountered.append(observation)
 
     execution_summary = {
         "iterations_used": iterations_used,
         "max_iterations": max_iterations,
-        "tools_used": list(set(tools_used)),
+        "tools_used": list(dict.fromkeys(tools_used)),
         "errors_encountered": errors_encountered,
         "conversation_turns": len(conversation_history),
         "reached_max_iterations": iterations_used >= max_iterations
     }
 
-    return reflect_on_execution(
+    return await areflect_on_execution(
         question=question,
         agent_type="react",
         execution_summary=execution_summary,
@@ -319,7 +588,48 @@ def reflect_react_agent(
     )
 
 
-def reflect_llm_compiler_agent(
+def reflect_react_agent(
+    question: str,
+    conversation_history: List[Dict],
+    final_answer: str,
+    iterations_used: int,
+    max_iterations: int,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate reflection specifically for ReAct agent execution.
+
+    Synchronous wrapper around areflect_react_agent; see it for the arguments.
+    """
+    return asyncio.run(areflect_react_agent(
+        question=question,
+        conversation_history=conversation_history,
+        final_answer=final_answer,
+        iterations_used=iterations_used,
+        max_iterations=max_iterations,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
+
+
+async def areflect_llm_compiler_agent(
     question: str,
     plan: List[Dict],
     execution_results: Dict[str, str],
@@ -337,7 +647,7 @@ def reflect_llm_compiler_agent(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate reflection specifically for LLMCompiler agent execution.
+    Generate reflection specifically for LLMCompiler agent execution (async).
 
     Args:
         question: The original user question
@@ -373,13 +683,13 @@ def reflect_llm_compiler_agent(
         "plan_valid": plan_valid,
         "total_steps": len(plan),
         "steps_executed": len(execution_results),
-        "tools_used": list(set(tools_used)),
+        "tools_used": list(dict.fromkeys(tools_used)),
         "errors_encountered": errors_encountered,
         "parallel_opportunities": parallel_steps,
         "dependency_depth": _calculate_max_depth(plan)
     }
 
-    return reflect_on_execution(
+    return await areflect_on_execution(
         question=question,
         agent_type="llm-compiler",
         execution_summary=execution_summary,
@@ -397,7 +707,48 @@ def reflect_llm_compiler_agent(
     )
 
 
-def reflect_plan_build_agent(
+def reflect_llm_compiler_agent(
+    question: str,
+    plan: List[Dict],
+    execution_results: Dict[str, str],
+    final_answer: str,
+    plan_valid: bool = True,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate reflection specifically for LLMCompiler agent execution.
+
+    Synchronous wrapper around areflect_llm_compiler_agent; see it for the arguments.
+    """
+    return asyncio.run(areflect_llm_compiler_agent(
+        question=question,
+        plan=plan,
+        execution_results=execution_results,
+        final_answer=final_answer,
+        plan_valid=plan_valid,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
+
+
+async def areflect_plan_build_agent(
     question: str,
     plan: List[Dict],
     execution_results: List[Dict],
@@ -416,7 +767,7 @@ def reflect_plan_build_agent(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate reflection specifically for Plan-Build agent execution.
+    Generate reflection specifically for Plan-Build agent execution (async).
 
     Args:
         question: The original user question
@@ -435,22 +786,26 @@ def reflect_plan_build_agent(
     errors_encountered = []
 
     for result in execution_results:
-        if isinstance(result, dict):
-            if "tool" in result:
-                tools_used.append(result["tool"])
-            if "result" in result and "失败" in str(result.get("result", "")) or "Error" in str(result.get("result", "")):
-                errors_encountered.append(str(result.get("result")))
+        if not isinstance(result, dict):
+            continue
+        if tool := result.get("tool"):
+            tools_used.append(tool)
+        if "result" in result:
+            # 结果只转换一次字符串; 执行失败的步骤带有 "失败" 或 "Error" 标记
+            result_text = str(result["result"])
+            if "失败" in result_text or "Error" in result_text:
+                errors_encountered.append(result_text)
 
     execution_summary = {
         "plan_length": len(plan),
         "steps_executed": steps_executed,
         "max_steps": max_steps,
-        "tools_used": list(set(tools_used)),
+        "tools_used": list(dict.fromkeys(tools_used)),
         "errors_encountered": errors_encountered,
         "reached_max_steps": steps_executed >= max_steps
     }
 
-    return reflect_on_execution(
+    return await areflect_on_execution(
         question=question,
         agent_type="plan-build",
         execution_summary=execution_summary,
@@ -468,7 +823,50 @@ def reflect_plan_build_agent(
     )
 
 
-def reflect_rewoo_agent(
+def reflect_plan_build_agent(
+    question: str,
+    plan: List[Dict],
+    execution_results: List[Dict],
+    final_answer: str,
+    steps_executed: int,
+    max_steps: int,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate reflection specifically for Plan-Build agent execution.
+
+    Synchronous wrapper around areflect_plan_build_agent; see it for the arguments.
+    """
+    return asyncio.run(areflect_plan_build_agent(
+        question=question,
+        plan=plan,
+        execution_results=execution_results,
+        final_answer=final_answer,
+        steps_executed=steps_executed,
+        max_steps=max_steps,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
+
+
+async def areflect_rewoo_agent(
     question: str,
     plan: List[Dict],
     execution_results: Dict[str, str],
@@ -485,7 +883,7 @@ def reflect_rewoo_agent(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate reflection specifically for ReWOO agent execution.
+    Generate reflection specifically for ReWOO agent execution (async).
 
     Args:
         question: The original user question
@@ -511,12 +909,12 @@ def reflect_rewoo_agent(
     execution_summary = {
         "plan_length": len(plan),
         "tools_executed": len(execution_results),
-        "tools_used": list(set(tools_used)),
+        "tools_used": list(dict.fromkeys(tools_used)),
         "errors_encountered": errors_encountered,
         "parallel_execution": True
     }
 
-    return reflect_on_execution(
+    return await areflect_on_execution(
         question=question,
         agent_type="rewoo",
         execution_summary=execution_summary,
@@ -533,7 +931,47 @@ def reflect_rewoo_agent(
         verbose=verbose
     )
 
-def reflect_tot_agent(
+
+def reflect_rewoo_agent(
+    question: str,
+    plan: List[Dict],
+    execution_results: Dict[str, str],
+    final_answer: str,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate reflection specifically for ReWOO agent execution.
+
+    Synchronous wrapper around areflect_rewoo_agent; see it for the arguments.
+    """
+    return asyncio.run(areflect_rewoo_agent(
+        question=question,
+        plan=plan,
+        execution_results=execution_results,
+        final_answer=final_answer,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
+
+
+async def areflect_tot_agent(
     question: str,
     all_thoughts: List[Dict],
     final_thoughts: List[Dict],
@@ -556,7 +994,7 @@ def reflect_tot_agent(
     verbose: bool = False
 ) -> AgentReflection:
     """
-    Generate reflection specifically for Tree-of-Thoughts agent execution.
+    Generate reflection specifically for Tree-of-Thoughts agent execution (async).
 
     Args:
         question: The original user question
@@ -591,13 +1029,13 @@ def reflect_tot_agent(
         "beam_width": beam_width,
         "thoughts_explored": thoughts_explored,
         "final_paths": final_paths,
-        "tools_suggested": list(set(tools_suggested)),
+        "tools_suggested": list(dict.fromkeys(tools_suggested)),
         "tools_executed": tools_executed,
         "best_score": best_score,
         "exploration_efficiency": thoughts_explored / (max_depth * branching_factor) if max_depth * branching_factor > 0 else 0
     }
 
-    return reflect_on_execution(
+    return await areflect_on_execution(
         question=question,
         agent_type="tree-of-thoughts",
         execution_summary=execution_summary,
@@ -613,3 +1051,54 @@ def reflect_tot_agent(
         timeout=timeout,
         verbose=verbose
     )
+
+
+def reflect_tot_agent(
+    question: str,
+    all_thoughts: List[Dict],
+    final_thoughts: List[Dict],
+    final_answer: str,
+    thoughts_explored: int,
+    final_paths: int,
+    max_depth: int,
+    branching_factor: int,
+    beam_width: int,
+    best_score: float,
+    api_key: str = None,
+    base_url: str = None,
+    max_retries: int = 5,
+    model: str = None,
+    temperature: float = 0.3,
+    top_p: float = 0.85,
+    frequency_penalty: float = 0.0,
+    max_tokens: int = 2048,
+    timeout: float = 30.0,
+    verbose: bool = False
+) -> AgentReflection:
+    """
+    Generate reflection specifically for Tree-of-Thoughts agent execution.
+
+    Synchronous wrapper around areflect_tot_agent; see it for the arguments.
+    """
+    return asyncio.run(areflect_tot_agent(
+        question=question,
+        all_thoughts=all_thoughts,
+        final_thoughts=final_thoughts,
+        final_answer=final_answer,
+        thoughts_explored=thoughts_explored,
+        final_paths=final_paths,
+        max_depth=max_depth,
+        branching_factor=branching_factor,
+        beam_width=beam_width,
+        best_score=best_score,
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        model=model,
+        temperature=temperature,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        verbose=verbose
+    ))
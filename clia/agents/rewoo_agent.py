@@ -10,18 +10,20 @@ Key difference: Plans WITHOUT seeing intermediate observations, enabling full pa
 """
 
 from typing import Dict, List, Tuple, Set, Any
-import json
+from functools import lru_cache
+import asyncio
 import re
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from .tool_router import run_tool, tools_specs, TOOLS
 from clia.agents import llm, prompts
+from clia.utils import json_array_end, json_loads
 
 logger = logging.getLogger(__name__)
 
 PLAN_PATTERN = re.compile(r"```json\s*(\[.*?\])\s*```", re.DOTALL)
-PLAN_PATTERN_SIMPLE = re.compile(r"\[.*?\]", re.DOTALL)
 PLACEHOLDER_PATTERN = re.compile(r"#E\d+")
+# 工作阶段同时执行的工具调用数上限
+WORKER_CONCURRENCY = 10
 
 
 def _extract_plan(response: str) -> List[Dict]:
@@ -29,27 +31,31 @@ def _extract_plan(response: str) -> List[Dict]:
     match = PLAN_PATTERN.search(response)
     if match:
         try:
-            plan = json.loads(match.group(1))
+            plan = json_loads(match.group(1))
             if isinstance(plan, list):
                 return plan
-        except json.JSONDecodeError:
+        except ValueError:
             pass
 
-    match = PLAN_PATTERN_SIMPLE.search(response)
-    if match:
+    # 单向扫描出第一个配对完整的数组, 非贪婪正则会在嵌套的 ']' 处截断
+    start = response.find('[', 0, response.rfind(']') + 1)
+    end = json_array_end(response, start) if start != -1 else -1
+    if end != -1:
         try:
-            plan = json.loads(match.group(0))
+            plan = json_loads(response[start:end])
             if isinstance(plan, list):
                 return plan
-        except json.JSONDecodeError:
+        except ValueError:
             pass
 
     logger.warning("Could not extract valid plan")
     return [{"id": "#E1", "action": "final", "answer": response}]
 
 
+# 系统提示词只依赖 command, 缓存后每次请求的前缀字节相同, 便于服务端提示词缓存命中
+@lru_cache(maxsize=32)
 def _build_rewoo_prompt(command: str) -> str:
-    """Build ReWOO system prompt."""
+    """Build ReWOO system prompt (cached per command)."""
     system_prompt, _ = prompts.get_prompt(command)
 
     return f"""You are a helpful assistant using the ReWOO (Reasoning WithOut Observation) pattern.
@@ -93,34 +99,28 @@ Rules:
 Generate the plan:"""
 
 
-def _planner(question: str, command: str, api_key: str, base_url: str, max_retries: int,
-             model: str, stream: bool, temperature: float, top_p: float,
-             frequency_penalty: float, max_tokens: int, timeout: float,
-             memory_manager=None) -> List[Dict]:
+async def _planner(question: str, command: str, api_key: str, base_url: str, max_retries: int,
+                   model: str, stream: bool, temperature: float, top_p: float,
+                   frequency_penalty: float, max_tokens: int, timeout: float,
+                   memory_manager=None) -> List[Dict]:
     """Generate ReWOO plan with variable placeholders."""
     system_prompt = _build_rewoo_prompt(command)
 
-    memory_context = ""
+    messages = [{"role": "system", "content": system_prompt}]
     if memory_manager and memory_manager.memories:
-        from datetime import datetime, timedelta
-        recent_memories = [m for m in memory_manager.memories
-                          if (datetime.now() - datetime.fromisoformat(m.timestamp)) < timedelta(hours=1)]
-        recent_memories = sorted(recent_memories, key=lambda m: m.timestamp, reverse=True)[:3]
+        # Get the most relevant memories (up to 3; the most recent ones unless semantic retrieval is on)
+        # 语义检索可能发起阻塞的嵌入请求, 放到线程中执行以免阻塞事件循环
+        recent_memories = await asyncio.to_thread(memory_manager.relevant_memories, question, limit=3)
 
         if recent_memories:
-            memory_context = "\n\n## Previous Context:\n"
+            # 记忆上下文单独作为一条系统消息, 保持缓存的系统提示词不变
+            memory_context = "## Previous Context:\n"
             for i, mem in enumerate(recent_memories, 1):
-                memory_context += f"{i}. Q: {mem.question}\n   A: {mem.answer[:200]}{'...' if len(mem.answer) > 200 else ''}\n"
-
-    if memory_context:
-        system_prompt = system_prompt.rstrip() + memory_context
+                memory_context += f"{i}. Q: {mem.question}\n   A: {mem.answer_preview}\n"
+            messages.append({"role": "system", "content": memory_context})
+    messages.append({"role": "user", "content": question})
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": question}
-    ]
-
-    response = llm.openai_completion(
+    response = await llm.openai_completion_async(
         api_key=api_key, base_url=base_url, max_retries=max_retries,
         model=model, messages=messages, stream=stream, temperature=temperature,
         top_p=top_p, frequency_penalty=frequency_penalty, max_tokens=max_tokens,
@@ -160,7 +160,7 @@ def _resolve_placeholders(value: Any, results: Dict[str, str]) -> Any:
     return value
 
 
-def _worker(plan: List[Dict]) -> Dict[str, str]:
+async def _worker(plan: List[Dict]) -> Dict[str, str]:
     """Execute tool calls with dependency-aware staging."""
     results: Dict[str, str] = {}
     tool_steps = [s for s in plan if s.get("tool")]
@@ -170,7 +170,9 @@ def _worker(plan: List[Dict]) -> Dict[str, str]:
     plan_ids = {s.get("id") for s in tool_steps if s.get("id")}
     pending = {s.get("id"): s for s in tool_steps if s.get("id")}
 
-    def execute_step(step: Dict) -> Tuple[str, str]:
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+
+    async def execute_step(step: Dict) -> Tuple[str, str]:
         step_id = step.get("id", "unknown")
         tool_name = step.get("tool")
         if tool_name not in TOOLS:
@@ -178,7 +180,9 @@ def _worker(plan: List[Dict]) -> Dict[str, str]:
         tool_args = step.get("args", {})
         resolved_args = _resolve_placeholders(tool_args, results)
         try:
-            result = run_tool(tool_name, **resolved_args)
+            # 工具多为阻塞 I/O, 放到线程中执行以免阻塞事件循环
+            async with semaphore:
+                result = await asyncio.to_thread(run_tool, tool_name, **resolved_args)
             logger.debug(f"Step {step_id} completed")
             return (step_id, result)
         except Exception as e:
@@ -205,20 +209,17 @@ def _worker(plan: List[Dict]) -> Dict[str, str]:
                 results[step_id] = f"Error: Unresolved dependencies {missing}"
             break
 
-        with ThreadPoolExecutor(max_workers=max(1, min(len(executable), 10))) as executor:
-            futures = {executor.submit(execute_step, step): step for step in executable}
-            for future in as_completed(futures):
-                step_id, result = future.result()
-                results[step_id] = result
-                pending.pop(step_id, None)
+        for step_id, result in await asyncio.gather(*(execute_step(step) for step in executable)):
+            results[step_id] = result
+            pending.pop(step_id, None)
 
     return results
 
 
-def _solver(question: str, plan: List[Dict], results: Dict[str, str],
-            command: str, api_key: str, base_url: str, max_retries: int,
-            model: str, stream: bool, temperature: float, top_p: float,
-            frequency_penalty: float, max_tokens: int, timeout: float) -> str:
+async def _solver(question: str, plan: List[Dict], results: Dict[str, str],
+                  command: str, api_key: str, base_url: str, max_retries: int,
+                  model: str, stream: bool, temperature: float, top_p: float,
+                  frequency_penalty: float, max_tokens: int, timeout: float) -> str:
     """Generate final answer using all tool results."""
     system_prompt, _ = prompts.get_prompt(command)
 
@@ -241,7 +242,7 @@ Provide the final answer:"""
         {"role": "user", "content": synthesis_prompt}
     ]
 
-    return llm.openai_completion(
+    return await llm.openai_completion_async(
         api_key=api_key, base_url=base_url, max_retries=max_retries,
         model=model, messages=messages, stream=stream, temperature=temperature,
         top_p=top_p, frequency_penalty=frequency_penalty, max_tokens=max_tokens,
@@ -249,14 +250,14 @@ Provide the final answer:"""
     )
 
 
-def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str = None,
-                max_retries: int = 5, model: str = None, stream: bool = False,
-                temperature: float = 0.0, top_p: float = 0.85,
-                frequency_penalty: float = 0.0, max_tokens: int = 4096,
-                timeout: float = 30.0, verbose: bool = False,
-                return_metadata: bool = False, memory_manager=None) -> str:
+async def rewoo_agent_async(question: str, command: str, api_key: str = None, base_url: str = None,
+                            max_retries: int = 5, model: str = None, stream: bool = False,
+                            temperature: float = 0.0, top_p: float = 0.85,
+                            frequency_penalty: float = 0.0, max_tokens: int = 4096,
+                            timeout: float = 30.0, verbose: bool = False,
+                            return_metadata: bool = False, memory_manager=None) -> str:
     """
-    Run ReWOO agent: Plan -> Work -> Solve.
+    Run ReWOO agent: Plan -> Work -> Solve (async; LLM calls and tools do not block the event loop).
 
     Returns:
         Final answer string, or tuple of (answer, metadata) if return_metadata=True
@@ -266,9 +267,9 @@ def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str
         logger.info("PHASE 1: Planning")
         logger.info("="*60)
 
-    plan = _planner(question, command, api_key, base_url, max_retries, model,
-                    stream, temperature, top_p, frequency_penalty, max_tokens,
-                    timeout, memory_manager)
+    plan = await _planner(question, command, api_key, base_url, max_retries, model,
+                          stream, temperature, top_p, frequency_penalty, max_tokens,
+                          timeout, memory_manager)
 
     # If the plan only contains a direct answer (no tools), return it immediately
     if len(plan) == 1 and plan[0].get("action") == "final" and "answer" in plan[0]:
@@ -301,7 +302,7 @@ def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str
         logger.info("PHASE 2: Working")
         logger.info("="*60)
 
-    results = _worker(plan)
+    results = await _worker(plan)
 
     if verbose:
         logger.info(f"Executed {len(results)} tools")
@@ -311,9 +312,9 @@ def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str
         logger.info("PHASE 3: Solving")
         logger.info("="*60)
 
-    final_answer = _solver(question, plan, results, command, api_key, base_url,
-                           max_retries, model, stream, temperature, top_p,
-                           frequency_penalty, max_tokens, timeout)
+    final_answer = await _solver(question, plan, results, command, api_key, base_url,
+                                 max_retries, model, stream, temperature, top_p,
+                                 frequency_penalty, max_tokens, timeout)
 
     if memory_manager:
         try:
@@ -333,3 +334,25 @@ def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str
         }
 
     return final_answer
+
+
+def rewoo_agent(question: str, command: str, api_key: str = None, base_url: str = None,
+                max_retries: int = 5, model: str = None, stream: bool = False,
+                temperature: float = 0.0, top_p: float = 0.85,
+                frequency_penalty: float = 0.0, max_tokens: int = 4096,
+                timeout: float = 30.0, verbose: bool = False,
+                return_metadata: bool = False, memory_manager=None) -> str:
+    """
+    Run ReWOO agent: Plan -> Work -> Solve.
+
+    Synchronous wrapper around rewoo_agent_async; see it for the arguments.
+    Must not be called from inside a running event loop.
+    """
+    return asyncio.run(rewoo_agent_async(
+        question=question, command=command, api_key=api_key, base_url=base_url,
+        max_retries=max_retries, model=model, stream=stream,
+        temperature=temperature, top_p=top_p,
+        frequency_penalty=frequency_penalty, max_tokens=max_tokens,
+        timeout=timeout, verbose=verbose,
+        return_metadata=return_metadata, memory_manager=memory_manager
+    ))
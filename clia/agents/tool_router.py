@@ -1,8 +1,11 @@
 import json
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
 from clia.agents import tools
 from clia.agents import code_fixer
 from dataclasses import dataclass, field
-from typing import Callable, Dict, Any, Set, Tuple
+from typing import Callable, Dict, Any, Optional, Set, Tuple
 
 
 @dataclass
@@ -14,6 +17,8 @@ class Tool:
     required: Set[str] = field(default_factory=set)
     defaults: Dict[str, Any] = field(default_factory=dict)
     arg_types: Dict[str, Any] = field(default_factory=dict)
+    # 会修改文件或外部状态的工具, 结果不能复用
+    side_effects: bool = False
 
 
 TOOLS = {
@@ -41,7 +46,8 @@ TOOLS = {
         handler=lambda path_str, content, backup=True: tools.write_file_safe(path_str, content, backup),
         required={"path_str", "content"},
         defaults={"backup": True},
-        arg_types={"path_str": str, "content": str, "backup": bool}
+        arg_types={"path_str": str, "content": str, "backup": bool},
+        side_effects=True
     ),
     "shell": Tool(
         name="shell",
@@ -54,7 +60,8 @@ TOOLS = {
         handler=lambda command, timeout=30.0, cwd=None: tools.shell_exec(command, timeout, cwd),
         required={"command"},
         defaults={"timeout": 30.0, "cwd": None},
-        arg_types={"command": str, "timeout": (int, float), "cwd": (str, type(None))}
+        arg_types={"command": str, "timeout": (int, float), "cwd": (str, type(None))},
+        side_effects=True
     ),
     "echo": Tool(
         name="echo",
@@ -122,7 +129,8 @@ TOOLS = {
             "model": str,
             "temperature": (int, float),
             "verbose": bool
-        }
+        },
+        side_effects=True
     )
 }
 
@@ -155,19 +163,77 @@ def _validate_types(tool: Tool, kwargs: Dict[str, Any]) -> Set[str]:
     return invalid
 
 
-def run_tool(tool_name: str, **kwargs):
-    if tool_name not in TOOLS:
-        raise ValueError(f"Unknown tool: {tool_name}")
-    tool = TOOLS[tool_name]
+def check_tool_call(tool_name: str, kwargs: Dict[str, Any]) -> Optional[str]:
+    """Return why calling tool_name with kwargs would be rejected, or None if it is valid."""
+    tool = TOOLS.get(tool_name)
+    if tool is None:
+        return f"Unknown tool: {tool_name}"
     merged, invalid_names = _validate_args(tool, kwargs)
     if invalid_names:
-        raise ValueError(f"Invalid or missing arguments for tool {tool_name}: {sorted(list(invalid_names))}")
+        return f"Invalid or missing arguments for tool {tool_name}: {sorted(list(invalid_names))}"
     invalid_types = _validate_types(tool, merged)
     if invalid_types:
-        raise ValueError(f"Invalid argument types for tool {tool_name}: {sorted(list(invalid_types))}")
-    return tool.handler(**merged)
+        return f"Invalid argument types for tool {tool_name}: {sorted(list(invalid_types))}"
+    return None
+
+
+def run_tool(tool_name: str, **kwargs):
+    error = check_tool_call(tool_name, kwargs)
+    if error:
+        raise ValueError(error)
+    tool = TOOLS[tool_name]
+    return tool.handler(**{**tool.defaults, **kwargs})
+
+
+class ToolCallCache:
+    """
+    Reuse results of identical side-effect-free tool calls within one agent run.
+
+    Calls are keyed by tool name and arguments (with defaults filled in); a
+    duplicate issued while the first call is still running waits for its result.
+    Running a tool with side effects clears the cache, since it may change what
+    the other tools would return. Failed calls are not cached.
+    """
+
+    def __init__(self):
+        self._results: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[..., Any], tool_name: str, /, **kwargs) -> Tuple[Any, bool]:
+        """Return (fn(tool_name, **kwargs), whether the result was reused)."""
+        tool = TOOLS.get(tool_name)
+        if tool is not None and tool.side_effects:
+            with self._lock:
+                self._results.clear()
+            return fn(tool_name, **kwargs), False
+        defaults = tool.defaults if tool is not None else {}
+        key = (tool_name, tuple(sorted({**defaults, **kwargs}.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(tool_name, **kwargs), False
+
+        with self._lock:
+            future = self._results.get(key)
+            reused = future is not None
+            if not reused:
+                future = self._results[key] = Future()
+        if reused:
+            return future.result(), True
+        try:
+            result = fn(tool_name, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                if self._results.get(key) is future:
+                    del self._results[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result, False
 
 
+# TOOLS 在进程内是静态的, 工具说明只需构建一次
+@lru_cache(maxsize=1)
 def tools_specs():
     lines = []
     for tool in TOOLS.values():
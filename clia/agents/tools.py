@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 import httpx
@@ -35,10 +36,16 @@ def echo_safe(text: str, max_chars: int = 4000) -> str:
     return text
 
 
+# 所有 http_get 调用共享一个带连接池的客户端, 同一计划内对同一主机的请求复用 keep-alive 连接 (httpx.Client 线程安全)
+@lru_cache(maxsize=1)
+def _http_client() -> httpx.Client:
+    return httpx.Client(limits=httpx.Limits(max_keepalive_connections=16, max_connections=64))
+
+
 def http_get(url: str, timeout: float = 10.0) -> str:
     "Simple HTTP GET request with timeout and basic error handling"
     try:
-        response = httpx.get(url, timeout=timeout)
+        response = _http_client().get(url, timeout=timeout)
         response.raise_for_status()
         return response.text
     except httpx.TimeoutException as e:
@@ -25,6 +25,11 @@ class Settings:
     enable_memory: bool = False
     memory_limit: int = 100
     memory_summarization: bool = True
+    cache_dir: Optional[str] = None
+    enable_cache: bool = False
+    semantic_cache: bool = False
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
 
     @classmethod
     def load_openai(cls):
@@ -47,7 +52,12 @@ class Settings:
             memory_path=os.getenv('CLIA_MEMORY_PATH', None),
             enable_memory=to_bool(os.getenv('CLIA_ENABLE_MEMORY', 'False')),
             memory_limit=int(os.getenv('CLIA_MEMORY_LIMIT', '100')),
-            memory_summarization=to_bool(os.getenv('CLIA_MEMORY_SUMMARIZATION', 'True'))
+            memory_summarization=to_bool(os.getenv('CLIA_MEMORY_SUMMARIZATION', 'True')),
+            cache_dir=os.getenv('CLIA_CACHE_DIR', None),
+            enable_cache=to_bool(os.getenv('CLIA_ENABLE_CACHE', 'False')),
+            semantic_cache=to_bool(os.getenv('CLIA_SEMANTIC_CACHE', 'False')),
+            rpm_limit=int(os.getenv('CLIA_RPM_LIMIT')) if os.getenv('CLIA_RPM_LIMIT') else None,
+            tpm_limit=int(os.getenv('CLIA_TPM_LIMIT')) if os.getenv('CLIA_TPM_LIMIT') else None
         )
 
 
@@ -1,10 +1,17 @@
-import argparse
+from __future__ import annotations
+
 import logging
 import sys
+from functools import lru_cache
 from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Union
 
 from .agents.history import History
+from .agents.prompts import msg
 from .agents.memory import MemoryManager
+from .agents.cache import ResponseCache, SemanticCache
+from .agents.llm import set_rate_limit
 from .agents.chat_agent import chat_agent
 from .agents.plan_build_agent import plan_build
 from .agents.react_agent import react_agent
@@ -19,9 +26,13 @@ from .agents.reflection import (
     reflect_rewoo_agent,
     reflect_tot_agent
 )
+from ._fastargs import fast_parse
 from .config import Settings
 from .utils import get_multiline_input
 
+if TYPE_CHECKING:
+    import argparse
+
 COMMANDS = ("ask", "explain", "debug", "fix", "generate")
 
 # 配置日志
@@ -33,6 +44,10 @@ logger = logging.getLogger(__name__)
 
 def create_parser() -> argparse.ArgumentParser:
     """Create and configure the argument parser."""
+    # argparse 只在快速解析无法处理 argv 时才需要, 不在模块顶层导入
+    import argparse
+
+    # allow_abbrev=False: 不做长参数前缀匹配, 解析更快也更明确
     parser = argparse.ArgumentParser(
         prog="clia",
         description="An Efficient Minimalist CLI AI Agent",
@@ -40,33 +55,30 @@ def create_parser() -> argparse.ArgumentParser:
         epilog="""
 Examples: to-do
   """,
+        allow_abbrev=False,
     )
-    return parser
-
-
-def parse_args() -> argparse.ArgumentParser:
-    parser = create_parser()
     sub_parsers = parser.add_subparsers(dest="command", required=True)
 
     PARSER_DICT = {
         # ask命令
         "ask_parser": sub_parsers.add_parser(
-            "ask", help="A Routine Q&A Assistant for General Tasks"),
+            "ask", help="A Routine Q&A Assistant for General Tasks",
+            allow_abbrev=False),
         # draft命令
         "draft_parser": sub_parsers.add_parser(
-            "draft", help="Parse user spec"),
+            "draft", help="Parse user spec", allow_abbrev=False),
         # explain命令
         "explain_parser": sub_parsers.add_parser(
-            "explain", help="Explain codes"),
+            "explain", help="Explain codes", allow_abbrev=False),
         # debug命令
         "debug_parser": sub_parsers.add_parser(
-            "debug", help="Debug codes"),
+            "debug", help="Debug codes", allow_abbrev=False),
         # fix命令
         "fix_parser": sub_parsers.add_parser(
-            "fix", help="Fix codes"),
+            "fix", help="Fix codes", allow_abbrev=False),
         # generate命令
         "generate_parser": sub_parsers.add_parser(
-            "generate", help="Generate codes"),
+            "generate", help="Generate codes", allow_abbrev=False),
     }
 
     # 添加通用参数
@@ -175,6 +187,12 @@ def parse_args() -> argparse.ArgumentParser:
             help="Beam width for Tree-of-Thoughts agent (default: 2)"
         )
 
+        command_parser.add_argument(
+            "--structured-output",
+            action="store_true",
+            help="Constrain plan-build plans with a JSON schema (requires API support for response_format json_schema)"
+        )
+
         # Memory management options
         command_parser.add_argument(
             "--memory-path",
@@ -207,7 +225,48 @@ def parse_args() -> argparse.ArgumentParser:
             default=3,
             help="Maximum number of relevant memories to include in context (default: 3)"
         )
-    return parser.parse_args()
+
+        command_parser.add_argument(
+            "--semantic-memory",
+            action="store_true",
+            help="Retrieve context memories by embedding similarity instead of recency (requires numpy)"
+        )
+
+        # Response cache options
+        command_parser.add_argument(
+            "--enable-cache",
+            action="store_true",
+            help="Enable exact-match response cache for the chat agent"
+        )
+
+        command_parser.add_argument(
+            "--cache-dir",
+            type=Path,
+            help="Directory for the response cache (enables response cache)"
+        )
+
+        command_parser.add_argument(
+            "--semantic-cache",
+            action="store_true",
+            help="Also answer rephrased questions from the cache via embedding similarity (requires numpy)"
+        )
+    return parser
+
+
+@lru_cache(maxsize=1)
+def _get_parser() -> argparse.ArgumentParser:
+    """Build the argparse parser once, only when the fast path cannot handle argv."""
+    return create_parser()
+
+
+def parse_args(argv=None) -> Union[argparse.Namespace, SimpleNamespace]:
+    if argv is None:
+        argv = sys.argv[1:]
+    # 常见调用走单次扫描的快速解析, --help/错误输入等交给 argparse
+    args = fast_parse(argv)
+    if args is None:
+        args = _get_parser().parse_args(argv)
+    return args
 
 
 def main():
@@ -232,12 +291,12 @@ def main():
             print("Welcome to CLI AI Agent")
             print("-" * 28 + "\n")
 
-        logger.info(f"User Query: {question}")
-        logger.info(f"Command line arguments: {args}")
+        logger.info("User Query: %s", question)
+        logger.info("Command line arguments: %s", args)
 
         # 加载配置
         settings = Settings.load_openai()
-        logger.info(f"Settings loaded: {settings}")
+        logger.info("Settings loaded: %s", settings)
 
         # 应用命令行参数覆盖
         model = args.model or settings.model
@@ -248,6 +307,11 @@ def main():
         top_p = args.top_p or settings.top_p
         max_retries = args.max_retries or settings.max_retries
 
+        # 主动限流, 避免批量调用时频繁触发 429 重试
+        if settings.rpm_limit or settings.tpm_limit:
+            set_rate_limit(settings.rpm_limit, settings.tpm_limit)
+            logger.info("Rate limit enabled: rpm=%s, tpm=%s", settings.rpm_limit, settings.tpm_limit)
+
         # Initialize memory manager if enabled
         memory_manager = None
         if args.enable_memory or args.memory_path:
@@ -261,13 +325,42 @@ def main():
                     base_url=settings.base_url,
                     model=model,
                     max_retries=max_retries,
-                    timeout=settings.timeout_seconds
+                    timeout=settings.timeout_seconds,
+                    enable_semantic_retrieval=args.semantic_memory
                 )
-                logger.info(f"Memory management enabled: {memory_path}")
+                logger.info("Memory management enabled: %s", memory_path)
             except Exception as e:
-                logger.warning(f"Failed to initialize memory manager: {e}")
+                logger.warning("Failed to initialize memory manager: %s", e)
                 memory_manager = None
 
+        # Initialize response cache if enabled
+        response_cache = None
+        semantic_cache = None
+        use_semantic_cache = args.semantic_cache or settings.semantic_cache
+        if (args.enable_cache or args.cache_dir or settings.enable_cache
+                or settings.cache_dir or use_semantic_cache):
+            cache_dir = args.cache_dir or settings.cache_dir or Path("clia/cache")
+            try:
+                response_cache = ResponseCache(cache_dir=cache_dir)
+                logger.info("Response cache enabled: %s", cache_dir)
+            except Exception as e:
+                logger.warning("Failed to initialize response cache: %s", e)
+                response_cache = None
+
+            if use_semantic_cache:
+                try:
+                    semantic_cache = SemanticCache(
+                        cache_dir=cache_dir,
+                        api_key=settings.api_key,
+                        base_url=settings.base_url,
+                        max_retries=max_retries,
+                        timeout=settings.timeout_seconds
+                    )
+                    logger.info("Semantic cache enabled: %s", cache_dir)
+                except Exception as e:
+                    logger.warning("Failed to initialize semantic cache: %s", e)
+                    semantic_cache = None
+
         # 选择agent架构
         execution_metadata = None
         if args.agent == "chat":
@@ -287,7 +380,9 @@ def main():
                 timeout=settings.timeout_seconds,
                 verbose=args.verbose,
                 return_metadata=args.with_reflection,
-                memory_manager=memory_manager
+                memory_manager=memory_manager,
+                response_cache=response_cache,
+                semantic_cache=semantic_cache
             )
             if args.with_reflection:
                 full_response, execution_metadata = result
@@ -429,7 +524,9 @@ def main():
                 max_tokens=settings.max_tokens,
                 timeout=settings.timeout_seconds,
                 return_metadata=args.with_reflection,
-                memory_manager=memory_manager
+                memory_manager=memory_manager,
+                semantic_cache=semantic_cache,
+                structured_output=args.structured_output
             )
             if args.with_reflection:
                 full_response, execution_metadata = result
@@ -555,21 +652,18 @@ def main():
 
                 logger.info("Reflection generated successfully")
             except Exception as e:
-                logger.error(f"Failed to generate reflection: {e}")
+                logger.error("Failed to generate reflection: %s", e)
                 if args.verbose:
                     print(f"\nWarning: Reflection generation failed: {e}\n")
 
         # 保存历史记录
         if args.history:
             response_content = str(full_response)
-            history = History(
-                [
-                    {"role": "user", "content": question},
-                    {"role": "assistant", "content": response_content},
-                ]
-            )
-            history.save_jsonl(Path(args.history))
-            logger.info(f"History saved to {args.history}")
+            history = History(path=Path(args.history))
+            history.add(msg("user", question))
+            history.add(msg("assistant", response_content))
+            history.flush()
+            logger.info("History saved to %s", args.history)
 
         logger.info("Request completed successfully")
 
@@ -577,7 +671,7 @@ def main():
         print("\n\nOperation cancelled by user.")
         sys.exit(1)
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         # Check if args exists before accessing args.quiet
         try:
             if not args.quiet:
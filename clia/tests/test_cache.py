@@ -0,0 +1,143 @@
+"""
+Unit tests for the response cache.
+"""
+
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from clia.agents.cache import ResponseCache, SemanticCache, np
+from clia.agents.chat_agent import chat_agent
+
+
+LLM_KWARGS = dict(
+    api_key="test_key",
+    base_url="https://test.api",
+    max_retries=1,
+    model="test-model",
+    temperature=0.0,
+    top_p=0.9,
+    frequency_penalty=0.0,
+    max_tokens=100,
+    timeout=10.0,
+)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(cache_dir=self._tmp.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self._tmp.cleanup()
+
+    def test_get_put_roundtrip(self):
+        key = ResponseCache.make_key("ask", "m", 0.0, "q")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "answer")
+        self.assertEqual(self.cache.get(key), "answer")
+
+    def test_key_depends_on_all_fields(self):
+        base = ResponseCache.make_key("ask", "m", 0.0, "q")
+        self.assertNotEqual(base, ResponseCache.make_key("explain", "m", 0.0, "q"))
+        self.assertNotEqual(base, ResponseCache.make_key("ask", "m2", 0.0, "q"))
+        self.assertNotEqual(base, ResponseCache.make_key("ask", "m", 0.5, "q"))
+        self.assertNotEqual(base, ResponseCache.make_key("ask", "m", 0.0, "q2"))
+
+    @patch('clia.agents.chat_agent.openai_completion')
+    def test_chat_agent_reuses_cached_response(self, mock_llm):
+        mock_llm.return_value = "cached answer"
+
+        first = chat_agent("q", "ask", stream=False, response_cache=self.cache, **LLM_KWARGS)
+        second = chat_agent("q", "ask", stream=False, response_cache=self.cache, **LLM_KWARGS)
+
+        self.assertEqual(first, "cached answer")
+        self.assertEqual(second, "cached answer")
+        self.assertEqual(mock_llm.call_count, 1)
+
+    @patch('clia.agents.chat_agent.openai_completion')
+    def test_chat_agent_skips_cache_when_streaming(self, mock_llm):
+        mock_llm.return_value = "streamed"
+
+        chat_agent("q", "ask", stream=True, response_cache=self.cache, **LLM_KWARGS)
+        chat_agent("q", "ask", stream=True, response_cache=self.cache, **LLM_KWARGS)
+
+        self.assertEqual(mock_llm.call_count, 2)
+
+
+@unittest.skipIf(np is None, "numpy not installed")
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = SemanticCache(cache_dir=self._tmp.name, api_key="k", base_url="u")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _vec(self, *values):
+        vector = np.asarray(values, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def test_near_match_hits_within_scope(self):
+        scope = SemanticCache.make_scope("ask", "m", 0.0)
+        self.cache.put(self._vec(1.0, 0.0, 0.0), scope, "q", "answer")
+
+        self.assertEqual(self.cache.get(self._vec(1.0, 0.1, 0.0), scope), "answer")
+        self.assertIsNone(self.cache.get(self._vec(0.0, 1.0, 0.0), scope))
+        other = SemanticCache.make_scope("explain", "m", 0.0)
+        self.assertIsNone(self.cache.get(self._vec(1.0, 0.1, 0.0), other))
+
+    def test_threshold_can_be_lowered_per_lookup(self):
+        scope = SemanticCache.make_scope("ask", "m", 0.0)
+        self.cache.put(self._vec(1.0, 0.0), scope, "q", "answer")
+
+        # 余弦相似度约 0.89: 低于默认阈值 0.92
+        self.assertIsNone(self.cache.get(self._vec(1.0, 0.5), scope))
+        self.assertEqual(self.cache.get(self._vec(1.0, 0.5), scope, threshold=0.8), "answer")
+
+    def test_entries_persist_across_instances(self):
+        scope = SemanticCache.make_scope("ask", "m", 0.0)
+        self.cache.put(self._vec(0.0, 1.0), scope, "q1", "a1")
+        self.cache.put(self._vec(1.0, 0.0), scope, "q2", "a2")
+
+        reloaded = SemanticCache(cache_dir=self._tmp.name, api_key="k", base_url="u")
+        self.assertEqual(reloaded.get(self._vec(1.0, 0.0), scope), "a2")
+        self.assertEqual(reloaded.get(self._vec(0.0, 1.0), scope), "a1")
+
+    def test_put_appends_rows_without_rewriting_the_matrix(self):
+        scope = SemanticCache.make_scope("ask", "m", 0.0)
+        for i in range(5):
+            self.cache.put(self._vec(1.0, float(i)), scope, f"q{i}", f"a{i}")
+            # 每次写入只在文件末尾追加一行 float32
+            self.assertEqual(self.cache.matrix_path.stat().st_size, (i + 1) * 2 * 4)
+
+        self.assertEqual(self.cache._buffer.shape[0], 8)
+        reloaded = SemanticCache(cache_dir=self._tmp.name, api_key="k", base_url="u")
+        for i in range(5):
+            self.assertEqual(reloaded.get(self._vec(1.0, float(i)), scope, threshold=0.9999), f"a{i}")
+
+    def test_best_match_within_scope_wins(self):
+        ask, explain = (SemanticCache.make_scope(c, "m", 0.0) for c in ("ask", "explain"))
+        self.cache.put(self._vec(1.0, 0.0), explain, "q", "explain answer")
+        self.cache.put(self._vec(1.0, 0.3), ask, "q", "far")
+        self.cache.put(self._vec(1.0, 0.1), ask, "q", "near")
+
+        self.assertEqual(self.cache.get(self._vec(1.0, 0.0), ask, threshold=0.5), "near")
+
+    @patch('clia.agents.chat_agent.openai_completion')
+    def test_chat_agent_answers_rephrased_question(self, mock_llm):
+        mock_llm.return_value = "answer"
+        embeddings = {"what is x": self._vec(1.0, 0.0), "what's x": self._vec(0.99, 0.05)}
+
+        with patch.object(self.cache, "embed", side_effect=embeddings.__getitem__):
+            first = chat_agent("what is x", "ask", stream=False, semantic_cache=self.cache, **LLM_KWARGS)
+            second = chat_agent("what's x", "ask", stream=False, semantic_cache=self.cache, **LLM_KWARGS)
+
+        self.assertEqual(first, "answer")
+        self.assertEqual(second, "answer")
+        self.assertEqual(mock_llm.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
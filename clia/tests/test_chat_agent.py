@@ -0,0 +1,56 @@
+"""
+Unit tests for the chat agent.
+"""
+
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from clia.agents.chat_agent import chat_agent
+from clia.agents.prompts import get_prompt_prefix
+
+
+LLM_KWARGS = dict(
+    api_key="test_key",
+    base_url="https://test.api",
+    max_retries=1,
+    model="test-model",
+    stream=False,
+    temperature=0.0,
+    top_p=0.9,
+    frequency_penalty=0.0,
+    max_tokens=100,
+    timeout=10.0,
+)
+
+
+class FakeMemoryManager:
+    def __init__(self, memories):
+        self.memories = memories
+        self.added = []
+
+    def add_memory(self, **kwargs):
+        self.added.append(kwargs)
+
+
+class TestChatAgentMessages(unittest.TestCase):
+    @patch('clia.agents.chat_agent.openai_completion')
+    def test_memory_context_does_not_touch_prompt_prefix(self, mock_llm):
+        mock_llm.return_value = "answer"
+        prefix = get_prompt_prefix("ask")
+        original_system = prefix[0]["content"]
+        memory = FakeMemoryManager([SimpleNamespace(question="q0", answer="a0")])
+
+        chat_agent("q1", "ask", memory_manager=memory, **LLM_KWARGS)
+
+        messages = mock_llm.call_args.kwargs["messages"]
+        self.assertEqual(messages[:len(prefix)], list(prefix))
+        self.assertEqual(messages[len(prefix)]["role"], "system")
+        self.assertIn("q0", messages[len(prefix)]["content"])
+        self.assertEqual(messages[-1], {"role": "user", "content": "q1"})
+        self.assertEqual(prefix[0]["content"], original_system)
+        self.assertEqual(memory.added[0]["answer"], "answer")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Unit tests for the code fixer helpers.
+"""
+
+import unittest
+from unittest.mock import patch
+
+from clia.agents.code_fixer import (
+    CodeFixerConfig,
+    FenceSegmenter,
+    FixResult,
+    _generate_diff,
+    _generate_fix,
+    _parse_error_input,
+    fix_code,
+    fix_code_tool
+)
+
+
+TRACEBACK = '''Traceback (most recent call last):
+  File "app.py", line 12, in <module>
+    main()
+NameError: name 'c' is not defined
+'''
+
+
+class TestParseErrorInput(unittest.TestCase):
+    def test_python_traceback(self):
+        info = _parse_error_input(TRACEBACK)
+        self.assertEqual(info["type"], "python_traceback")
+        self.assertEqual(info["file"], "app.py")
+        self.assertEqual(info["line"], 12)
+        self.assertEqual(info["message"], "NameError: name 'c' is not defined")
+
+    def test_test_failure(self):
+        self.assertEqual(_parse_error_input("FAILED tests/test_x.py::test_y")["type"], "test_failure")
+
+    def test_syntax_error(self):
+        self.assertEqual(_parse_error_input("invalid syntax near ')'")["type"], "syntax_error")
+
+    def test_traceback_takes_priority_over_later_keywords(self):
+        info = _parse_error_input("SyntaxError: bad\nFAILED x\n" + TRACEBACK)
+        self.assertEqual(info["type"], "python_traceback")
+
+    def test_test_failure_takes_priority_over_syntax_error(self):
+        self.assertEqual(_parse_error_input("SyntaxError then AssertionError")["type"], "test_failure")
+
+    def test_unknown(self):
+        info = _parse_error_input("something odd happened")
+        self.assertEqual(info["type"], "unknown")
+        self.assertIsNone(info["file"])
+
+
+class TestFenceSegmenter(unittest.TestCase):
+    def _segments(self, chunks):
+        segmenter = FenceSegmenter()
+        out = {}
+        for chunk in chunks:
+            for segment, text in segmenter.feed(chunk):
+                out[segment] = out.get(segment, "") + text
+        for segment, text in segmenter.close():
+            out[segment] = out.get(segment, "") + text
+        return out, segmenter.fences
+
+    def test_matches_split_for_fences_across_chunks(self):
+        response = "Here:\n```python\nx = `1`\n```\nDone ```extra```"
+        parts = response.split("```")
+        for size in (1, 2, 3, 5, len(response)):
+            chunks = [response[i:i + size] for i in range(0, len(response), size)]
+            out, fences = self._segments(chunks)
+            self.assertEqual(fences, len(parts) - 1)
+            self.assertEqual(out.get("preamble", ""), parts[0])
+            self.assertEqual(out.get("code", ""), parts[1])
+            self.assertEqual(out.get("explanation", ""), parts[2])
+
+
+class TestGenerateFix(unittest.TestCase):
+    @patch('clia.agents.code_fixer.openai_completion_stream')
+    def test_strips_language_header(self, mock_llm):
+        mock_llm.return_value = iter(["``", "`python3\nx = 1\n`", "``\nDefined x."])
+        code, explanation = _generate_fix("err", "x", "analysis", "k", "u", "m", 0.1)
+        self.assertEqual(code, "x = 1")
+        self.assertEqual(explanation, "Defined x.")
+
+    @patch('clia.agents.code_fixer.openai_completion_stream')
+    def test_response_without_fence_is_code(self, mock_llm):
+        mock_llm.return_value = iter(["x = ", "1\n"])
+        self.assertEqual(_generate_fix("err", "x", "a", "k", "u", "m", 0.1), ("x = 1\n", "Code fixed"))
+
+
+class TestGenerateDiff(unittest.TestCase):
+    def test_identical_code_has_empty_diff(self):
+        self.assertEqual(_generate_diff("x = 1\n", "x = 1\n"), "")
+
+    def test_changed_code_has_diff(self):
+        diff = _generate_diff("x = 1\n", "x = 2\n", "a.py")
+        self.assertIn("-x = 1", diff)
+        self.assertIn("+x = 2", diff)
+
+
+class TestFixCodeIteration(unittest.TestCase):
+    @patch('clia.agents.code_fixer.tool_funcs.shell_exec')
+    @patch('clia.agents.code_fixer._generate_fix')
+    @patch('clia.agents.code_fixer._analyze_error')
+    def test_syntax_error_in_retry_is_not_reported_as_passing(self, mock_analyze, mock_fix, mock_shell):
+        mock_analyze.return_value = "analysis"
+        mock_fix.side_effect = [("x = 1\n", "first"), ("x = (\n", "second")]
+        mock_shell.side_effect = ["FAILED test_x", "all good"]
+        config = CodeFixerConfig(max_iterations=2, auto_run_tests=True, test_command="pytest",
+                                 iterate_until_passing=True)
+
+        result = fix_code(TRACEBACK, "x = c\n", config, "k", "u", "m")
+
+        self.assertFalse(result.success)
+        self.assertIn("syntax error", result.test_results)
+
+
+class TestFixCodeTool(unittest.TestCase):
+    @patch('clia.agents.code_fixer.fix_code')
+    def test_report_layout(self, mock_fix_code):
+        mock_fix_code.return_value = FixResult(
+            success=True, fixed_code="x = 1", error_analysis="a", fix_explanation="e",
+            diff=None, test_results="ok", iterations_used=1
+        )
+
+        self.assertEqual(
+            fix_code_tool(error_input="err", code_context="x"),
+            "Fix Result:\nSuccess: True\nIterations: 1\n\n"
+            "Error Analysis:\na\n\nFix Explanation:\ne\n\n"
+            "Diff:\n(no changes)\n\nFixed Code:\nx = 1\n\nTest Results:\nok"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Unit tests for the fast-path argument parser.
+"""
+
+import argparse
+import subprocess
+import sys
+import unittest
+
+from clia import _fastargs
+from clia._fastargs import fast_parse
+from clia.main import create_parser
+
+
+def _argparse(argv):
+    return create_parser().parse_args(argv)
+
+
+class TestFastParse(unittest.TestCase):
+    def test_matches_argparse(self):
+        cases = [
+            ["ask", "hello", "world"],
+            ["ask", "--stream", "hello"],
+            ["explain", "what", "is", "this", "--file", "a.py", "-v"],
+            ["fix", "--agent", "react", "--max-iterations", "5", "bug"],
+            ["debug", "--temperature", "0.3", "--top_p", "0.5", "--max_retries", "2"],
+            ["generate", "-m", "--output-format", "json", "--history", "h.jsonl"],
+            ["ask", "q", "--agent", "tot", "--max-depth", "2", "--branching-factor", "4", "--beam-width", "1"],
+            ["ask", "q", "--enable-memory", "--memory-path", "m.jsonl", "--memory-limit", "5",
+             "--memory-context-limit", "1", "--no-memory-summarization"],
+            ["ask", "q", "--enable-cache", "--cache-dir", "c", "--semantic-cache", "--quiet"],
+            ["draft", "--with-reflection", "--with-interaction", "--model", "m", "spec"],
+            ["ask"],
+        ]
+        for argv in cases:
+            with self.subTest(argv=argv):
+                self.assertEqual(vars(fast_parse(argv)), vars(_argparse(argv)))
+
+    def test_defers_unusual_input_to_argparse(self):
+        cases = [
+            [],
+            ["--help"],
+            ["ask", "--help"],
+            ["unknown", "q"],
+            ["ask", "hello", "--stream", "world"],
+            ["ask", "--temperature", "-0.5", "q"],
+            ["ask", "--max-depth", "x"],
+            ["ask", "--agent", "nope"],
+            ["ask", "--model=m"],
+            ["ask", "--verb"],
+            ["ask", "--model"],
+            ["ask", "--", "q"],
+        ]
+        for argv in cases:
+            with self.subTest(argv=argv):
+                self.assertIsNone(fast_parse(argv))
+
+    def test_spec_matches_parser(self):
+        parser = create_parser()
+        sub_action = next(a for a in parser._actions if isinstance(a, argparse._SubParsersAction))
+        self.assertEqual(set(sub_action.choices), _fastargs.COMMANDS)
+
+        ask_parser = sub_action.choices["ask"]
+        known_flags = set(_fastargs._SWITCHES) | set(_fastargs._OPTIONS) | {"-h", "--help"}
+        for action in ask_parser._actions:
+            if action.dest == "help":
+                continue
+            with self.subTest(dest=action.dest):
+                self.assertIn(action.dest, _fastargs.DEFAULTS)
+                if action.dest != "question":
+                    self.assertEqual(action.default, _fastargs.DEFAULTS[action.dest])
+                self.assertTrue(set(action.option_strings) <= known_flags)
+
+
+    def test_fast_path_does_not_import_argparse(self):
+        code = ("import sys; from clia._fastargs import fast_parse; "
+                "assert fast_parse(['ask', 'q']) is not None; "
+                "assert 'argparse' not in sys.modules")
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Unit tests for conversation history persistence.
+"""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from clia.agents.history import History
+
+
+class TestHistory(unittest.TestCase):
+    def test_save_jsonl_appends_one_record_per_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "nested" / "history.jsonl"
+            History([{"role": "user", "content": "你好"}]).save_jsonl(path)
+            History([{"role": "assistant", "content": "hi"}]).save_jsonl(path)
+
+            lines = path.read_text(encoding="utf-8").splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(json.loads(lines[0])["content"], "你好")
+            self.assertIn("你好", lines[0])
+            self.assertEqual(json.loads(lines[1])["role"], "assistant")
+
+    def test_save_jsonl_without_messages_writes_nothing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "history.jsonl"
+            History().save_jsonl(path)
+            self.assertFalse(path.exists())
+
+    def test_add_buffers_until_threshold(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "history.jsonl"
+            history = History(path=path, buf_threshold=3)
+            history.add({"role": "user", "content": "1"})
+            history.add({"role": "assistant", "content": "2"})
+            self.assertFalse(path.exists())
+
+            history.add({"role": "user", "content": "3"})
+            self.assertEqual(len(path.read_text(encoding="utf-8").splitlines()), 3)
+
+            history.add({"role": "assistant", "content": "4"})
+            history.flush()
+            history.flush()
+            self.assertEqual(len(path.read_text(encoding="utf-8").splitlines()), 4)
+
+    def test_flush_without_path_raises(self):
+        history = History([{"role": "user", "content": "q"}])
+        with self.assertRaises(ValueError):
+            history.flush()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Unit tests for the OpenAI completion wrappers.
+"""
+
+import io
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from clia.agents import llm
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class CountingStdout(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+class TestStreamingCompletion(unittest.TestCase):
+    def test_stream_output_is_flushed_in_batches(self):
+        chunks = [_chunk("x") for _ in range(40)] + [_chunk(None)]
+        client = SimpleNamespace(chat=SimpleNamespace(
+            completions=SimpleNamespace(create=lambda **kwargs: iter(chunks))
+        ))
+        out = CountingStdout()
+
+        with patch.object(llm, '_openai_client', return_value=client), \
+                patch.object(llm.sys, 'stdout', out):
+            result = llm.openai_completion(
+                api_key="k", base_url="https://test.api", max_retries=1,
+                model="m", messages=[], stream=True, temperature=0.0,
+                top_p=1.0, frequency_penalty=0.0, max_tokens=10, timeout=1.0
+            )
+
+        self.assertEqual(result, "x" * 40)
+        self.assertEqual(out.getvalue(), "x" * 40)
+        # 40 个分块: 第 16、32 个各刷新一次, 结束时再刷新一次
+        self.assertEqual(out.flushes, 3)
+
+    def test_multiple_candidates_are_returned_as_list(self):
+        response = SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=text)) for text in ("a", "b")
+        ])
+        calls = []
+
+        def create(**kwargs):
+            calls.append(kwargs)
+            return response
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        kwargs = dict(api_key="k", base_url="https://test.api", max_retries=1, model="m",
+                      messages=[], temperature=0.0, top_p=1.0, frequency_penalty=0.0,
+                      max_tokens=10, timeout=1.0)
+
+        with patch.object(llm, '_openai_client', return_value=client):
+            self.assertEqual(llm.openai_completion(stream=False, n=2, **kwargs), ["a", "b"])
+            with self.assertRaises(ValueError):
+                llm.openai_completion(stream=True, n=2, **kwargs)
+
+        self.assertEqual(calls[0]["n"], 2)
+
+
+class TestClientReuse(unittest.TestCase):
+    def test_same_configuration_shares_one_pooled_client(self):
+        kwargs = dict(api_key="k", base_url="https://reuse.test", max_retries=2)
+        client = llm._openai_client(**kwargs)
+
+        self.assertIs(llm._openai_client(**kwargs), client)
+        self.assertIsNot(llm._openai_client(**{**kwargs, "max_retries": 3}), client)
+
+
+class TestBatchCompletions(unittest.TestCase):
+    def test_results_are_matched_by_custom_id(self):
+        uploads = []
+        statuses = iter(["in_progress", "completed"])
+        output = b"\n".join(json.dumps(record).encode() for record in (
+            {"custom_id": "1", "response": {"status_code": 200,
+                                            "body": {"choices": [{"message": {"content": "second"}}]}}},
+            {"custom_id": "0", "response": {"status_code": 500, "body": {}}},
+        ))
+        client = SimpleNamespace(
+            files=SimpleNamespace(
+                create=lambda file, **kwargs: uploads.append(file[1]) or SimpleNamespace(id="file-in"),
+                content=lambda file_id, **kwargs: SimpleNamespace(content=output),
+            ),
+            batches=SimpleNamespace(
+                create=lambda **kwargs: SimpleNamespace(id="b", status="validating", output_file_id=None),
+                retrieve=lambda batch_id, **kwargs: SimpleNamespace(id="b", status=next(statuses),
+                                                                    output_file_id="file-out"),
+            ),
+        )
+
+        with patch.object(llm, '_openai_client', return_value=client), patch.object(llm.time, 'sleep'):
+            results = llm.openai_batch_completions(
+                api_key="k", base_url="https://test.api", max_retries=1, model="m",
+                messages_list=[[{"role": "user", "content": "a"}], [{"role": "user", "content": "b"}]],
+                temperature=0.0, top_p=1.0, frequency_penalty=0.0, max_tokens=10, timeout=1.0
+            )
+
+        self.assertEqual(results, [None, "second"])
+        requests = [json.loads(line) for line in uploads[0].splitlines()]
+        self.assertEqual([r["custom_id"] for r in requests], ["0", "1"])
+        self.assertEqual(requests[1]["body"]["messages"], [{"role": "user", "content": "b"}])
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_requests_beyond_rpm_must_wait(self):
+        bucket = llm.TokenBucket(rpm=2)
+        self.assertEqual(bucket.reserve(0), 0.0)
+        self.assertEqual(bucket.reserve(0), 0.0)
+        self.assertGreater(bucket.reserve(0), 0.0)
+
+    def test_token_budget_is_charged(self):
+        bucket = llm.TokenBucket(tpm=1000)
+        self.assertEqual(bucket.reserve(800), 0.0)
+        # 剩余约 200 token, 再要 800 需要等待约 36 秒
+        self.assertAlmostEqual(bucket.reserve(800), 36.0, delta=1.0)
+
+    def test_oversized_request_is_capped_to_capacity(self):
+        bucket = llm.TokenBucket(tpm=100)
+        self.assertEqual(bucket.reserve(10_000), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+"""
+Unit tests for the LLMCompiler agent.
+"""
+
+import importlib
+import json
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+# clia.agents re-exports a function with the module's name, so import the module explicitly
+compiler = importlib.import_module("clia.agents.llm_compiler_agent")
+
+
+class TestExtractPlan(unittest.TestCase):
+    STEPS = [
+        {"id": "a", "tool": "echo", "args": {"text": "hi"}, "dependencies": []},
+        {"id": "final", "action": "final", "answer": "done", "dependencies": ["a"]},
+    ]
+
+    def test_supported_response_shapes(self):
+        body = json.dumps(self.STEPS)
+        responses = {
+            "bare": body,
+            "json_mode_padding": f"\n  {body}\n",
+            "code_block": f"Plan:\n```json\n{body}\n```\nDone.",
+            "prose": f"I will run this plan {body} and then answer.",
+        }
+        for name, response in responses.items():
+            with self.subTest(name):
+                self.assertEqual(compiler._extract_plan(response), self.STEPS)
+
+    def test_unparseable_response_becomes_final_answer(self):
+        plan = compiler._extract_plan("just text [not json]")
+        self.assertEqual(plan, [{"id": "final", "action": "final",
+                                 "answer": "just text [not json]", "dependencies": []}])
+
+
+class TestToolPools(unittest.TestCase):
+    def test_steps_are_routed_by_tool_kind(self):
+        self.assertIs(compiler._pool_for({"tool": "http_get"}), compiler._IO_POOL)
+        self.assertIs(compiler._pool_for({"tool": "echo"}), compiler._CPU_POOL)
+        self.assertIs(compiler._pool_for({"action": "final"}), compiler._CPU_POOL)
+
+    def test_http_concurrency_is_limited_per_host(self):
+        first = compiler._host_semaphore("https://example.com/a")
+        self.assertIs(first, compiler._host_semaphore("https://example.com/b"))
+        self.assertIsNot(first, compiler._host_semaphore("https://example.org/a"))
+
+
+class TestValidatePlan(unittest.TestCase):
+    def test_long_chain_is_ordered_without_recursion(self):
+        plan = [{"id": "s0", "dependencies": []}]
+        plan += [{"id": f"s{i}", "dependencies": [f"s{i - 1}"]} for i in range(1, 5000)]
+        plan.reverse()
+
+        order = compiler._topological_order(plan)
+
+        self.assertEqual(order, [f"s{i}" for i in range(5000)])
+
+    def test_transitively_implied_dependencies_are_dropped(self):
+        plan = [
+            {"id": "a", "dependencies": []},
+            {"id": "b", "dependencies": ["a"]},
+            {"id": "c", "dependencies": ["a", "b", "b"]},
+            {"id": "d", "dependencies": ["a", "c"]},
+        ]
+
+        reduced = compiler._reduced_dependencies(plan, compiler._topological_order(plan))
+
+        self.assertEqual(reduced, {"a": frozenset(), "b": {"a"}, "c": {"b"}, "d": {"c"}})
+        self.assertEqual(plan[2]["dependencies"], ["a", "b", "b"])
+
+    def test_cycle_and_missing_dependency_are_invalid(self):
+        cycle = [
+            {"id": "a", "dependencies": ["b"]},
+            {"id": "b", "dependencies": ["a"]},
+        ]
+        missing = [{"id": "a", "dependencies": ["nope"]}]
+
+        self.assertFalse(compiler._validate_plan(cycle))
+        self.assertFalse(compiler._validate_plan(missing))
+        self.assertTrue(compiler._validate_plan([{"id": "a", "dependencies": []}]))
+
+
+class TestExecutePlanParallel(unittest.TestCase):
+    def test_step_starts_when_its_own_dependencies_finish(self):
+        slow_release = threading.Event()
+        order = []
+
+        def fake_run_tool(tool_name, **kwargs):
+            if kwargs["path_str"] == "slow":
+                # 只有在依赖快速步骤的 child 完成后才放行
+                self.assertTrue(slow_release.wait(timeout=5))
+            order.append(kwargs["path_str"])
+            if kwargs["path_str"] == "child":
+                slow_release.set()
+            return kwargs["path_str"]
+
+        plan = [
+            {"id": "fast", "tool": "read_file", "args": {"path_str": "fast"}, "dependencies": []},
+            {"id": "slow", "tool": "read_file", "args": {"path_str": "slow"}, "dependencies": []},
+            {"id": "child", "tool": "read_file", "args": {"path_str": "child"}, "dependencies": ["fast"]},
+            {"id": "final", "action": "final", "answer": "done", "dependencies": ["child", "slow"]},
+        ]
+
+        with patch.object(compiler, 'run_tool', side_effect=fake_run_tool):
+            results = compiler._execute_plan_parallel(plan)
+
+        # I/O 型工具执行于大线程池, slow 阻塞时 child 仍可运行
+        self.assertEqual(order, ["fast", "child", "slow"])
+        self.assertEqual(results, {"fast": "fast", "slow": "slow", "child": "child", "final": "done"})
+
+    def test_final_steps_do_not_use_worker_pools(self):
+        plan = [
+            {"id": "a", "action": "final", "answer": "one", "dependencies": []},
+            {"id": "b", "action": "final", "answer": "two", "dependencies": ["a"]},
+        ]
+
+        with patch.object(compiler, '_pool_for', side_effect=AssertionError("pool used")):
+            results = compiler._execute_plan_parallel(plan)
+            single = compiler._execute_plan_parallel(plan[:1])
+
+        self.assertEqual(results, {"a": "one", "b": "two"})
+        self.assertEqual(single, {"a": "one"})
+
+    def test_invalid_tool_calls_never_reach_run_tool(self):
+        plan = [
+            {"id": "a", "tool": "nope", "args": {}, "dependencies": []},
+            {"id": "b", "tool": "read_file", "args": {"bogus": 1}, "dependencies": []},
+            {"id": "c", "tool": "read_file", "args": {"path_str": 3}, "dependencies": []},
+        ]
+
+        with patch.object(compiler, 'run_tool', side_effect=AssertionError("run_tool called")):
+            results = compiler._execute_plan_parallel(plan)
+
+        self.assertIn("Unknown tool 'nope'", results["a"])
+        self.assertIn("Invalid or missing arguments for tool read_file: ['bogus', 'path_str']", results["b"])
+        self.assertIn("Invalid argument types for tool read_file: ['path_str']", results["c"])
+
+    def test_unsatisfiable_steps_are_reported(self):
+        plan = [
+            {"id": "a", "action": "final", "answer": "ok", "dependencies": []},
+            {"id": "b", "action": "final", "answer": "never", "dependencies": ["missing"]},
+        ]
+
+        results = compiler._execute_plan_parallel(plan)
+
+        self.assertEqual(results["a"], "ok")
+        self.assertIn("was not executed", results["b"])
+
+
+class TestPlanStreamParser(unittest.TestCase):
+    PLAN = (
+        'Here is the plan:\n```json\n[\n'
+        '  {"id": "a", "tool": "echo", "args": {"text": "}{ ] \\" ["}, "dependencies": []},\n'
+        '  {"id": "final", "action": "final", "answer": "done", "dependencies": ["a"]}\n'
+        ']\n```'
+    )
+
+    def test_steps_are_emitted_as_soon_as_they_close(self):
+        parser = compiler.PlanStreamParser()
+        emitted = []
+        for i in range(0, len(self.PLAN), 7):
+            emitted.append([step["id"] for step in parser.feed(self.PLAN[i:i + 7])])
+
+        self.assertTrue(parser.complete)
+        self.assertEqual([step["id"] for step in parser.steps], ["a", "final"])
+        self.assertEqual(parser.steps[0]["args"]["text"], '}{ ] " [')
+        # 第一个步骤在整个计划结束之前就已经产出
+        first = next(i for i, ids in enumerate(emitted) if ids)
+        self.assertLess(first, len(emitted) - 2)
+
+    def test_non_object_elements_mark_parser_failed(self):
+        parser = compiler.PlanStreamParser()
+        parser.feed('The numbers [1, 2] are not a plan')
+        self.assertTrue(parser.failed)
+        self.assertFalse(parser.complete)
+
+    def test_missing_array_gives_up_after_probe_window(self):
+        parser = compiler.PlanStreamParser()
+        parser.feed("x" * (compiler.PLAN_STREAM_PROBE_CHARS + 1))
+        self.assertTrue(parser.failed)
+
+
+def _chunks(text, size=5):
+    async def gen(**kwargs):
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+    return gen
+
+
+class TestLLMCompilerAgent(unittest.TestCase):
+    def test_sync_wrapper_runs_async_agent(self):
+        plan = '```json\n[{"id": "final", "action": "final", "answer": "42", "dependencies": []}]\n```'
+        mock_llm = AsyncMock()
+
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(plan)), \
+                patch.object(compiler.llm, 'openai_completion_async', mock_llm):
+            answer = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m"
+            )
+
+        self.assertEqual(answer, "42")
+        mock_llm.assert_not_awaited()
+
+    def _run_with_tool_result(self, tool_result):
+        plan = json.dumps([
+            {"id": "a", "tool": "read_file", "args": {"path_str": "x"}, "dependencies": []},
+            {"id": "final", "action": "final", "answer": "base", "dependencies": ["a"]},
+        ])
+        mock_llm = AsyncMock(return_value="synthesized")
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(plan)), \
+                patch.object(compiler.llm, 'openai_completion_async', mock_llm), \
+                patch.object(compiler, 'run_tool', return_value=tool_result):
+            answer = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m"
+            )
+        return answer, mock_llm
+
+    def test_small_clean_results_skip_synthesis(self):
+        answer, mock_llm = self._run_with_tool_result("file contents")
+
+        self.assertEqual(answer, "base\n\nTool Results:\na: file contents")
+        mock_llm.assert_not_awaited()
+
+    def test_large_or_failed_results_are_synthesized(self):
+        for tool_result in ("x" * compiler.SYNTHESIS_SKIP_CHARS, "[HTTP GET error: boom]"):
+            with self.subTest(tool_result=tool_result[:20]):
+                answer, mock_llm = self._run_with_tool_result(tool_result)
+                self.assertEqual(answer, "synthesized")
+                mock_llm.assert_awaited_once()
+
+    def test_synthesis_candidates_come_from_one_request(self):
+        plan = json.dumps([
+            {"id": "a", "tool": "read_file", "args": {"path_str": "x"}, "dependencies": []},
+            {"id": "final", "action": "final", "answer": "", "dependencies": ["a"]},
+        ])
+        mock_llm = AsyncMock(return_value=["short", "the longest one", "mid size"])
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(plan)), \
+                patch.object(compiler.llm, 'openai_completion_async', mock_llm), \
+                patch.object(compiler, 'run_tool', return_value="data"):
+            answer, metadata = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m",
+                stream=True, return_metadata=True, n_candidates=3, candidate_scorer=len
+            )
+
+        self.assertEqual(answer, "the longest one")
+        self.assertEqual(metadata["synthesis_candidates"], ["short", "the longest one", "mid size"])
+        mock_llm.assert_awaited_once()
+        self.assertEqual(mock_llm.call_args.kwargs["n"], 3)
+        self.assertFalse(mock_llm.call_args.kwargs["stream"])
+
+    def test_side_effect_steps_wait_for_plan_validation(self):
+        cycle = [
+            {"id": "s1", "tool": "shell", "args": {"command": "touch x"}, "dependencies": []},
+            {"id": "s2", "tool": "read_file", "args": {"path_str": "a"}, "dependencies": ["s3"]},
+            {"id": "s3", "tool": "read_file", "args": {"path_str": "b"}, "dependencies": ["s2"]},
+        ]
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(json.dumps(cycle))), \
+                patch.object(compiler, 'run_tool', return_value="out") as mock_tool:
+            answer = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m"
+            )
+
+        self.assertIn("Generated plan is invalid", answer)
+        mock_tool.assert_not_called()
+
+    def test_side_effect_steps_run_after_validation(self):
+        plan = json.dumps([
+            {"id": "a", "tool": "read_file", "args": {"path_str": "x"}, "dependencies": []},
+            {"id": "b", "tool": "shell", "args": {"command": "ls"}, "dependencies": []},
+            {"id": "final", "action": "final", "answer": "", "dependencies": ["a", "b"]},
+        ])
+        calls = []
+
+        def fake_run_tool(tool_name, **kwargs):
+            calls.append(tool_name)
+            return "out"
+
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(plan)), \
+                patch.object(compiler.llm, 'openai_completion_async', AsyncMock(return_value="done")), \
+                patch.object(compiler, 'run_tool', side_effect=fake_run_tool):
+            answer, metadata = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m",
+                return_metadata=True
+            )
+
+        self.assertEqual(sorted(calls), ["read_file", "shell"])
+        self.assertEqual(metadata["execution_results"]["b"], "out")
+
+    def test_waiting_side_effect_step_is_replaced_by_validated_version(self):
+        read = {"id": "a", "tool": "read_file", "args": {"path_str": "x"}, "dependencies": []}
+        streamed = {"id": "w", "tool": "write_file", "args": {"path_str": "y", "content": "stale"},
+                    "dependencies": ["a"]}
+        validated = dict(streamed, args={"path_str": "y", "content": "checked"})
+        final = {"id": "final", "action": "final", "answer": "", "dependencies": ["w"]}
+        # 流式数组中出现非对象元素, 解析失败后回退到代码块中的完整计划
+        response = (json.dumps([read, streamed])[:-1] + ", 42]\n```json\n"
+                    + json.dumps([read, validated, final]) + "\n```")
+        released = threading.Event()
+        release = compiler._PlanRunner.release
+        written = []
+
+        def fake_release(runner, step_map):
+            release(runner, step_map)
+            released.set()
+
+        def fake_run_tool(tool_name, **kwargs):
+            if tool_name == "read_file":
+                # 读取在计划校验完成后才结束, 写入步骤在校验时仍在等待依赖
+                released.wait(5)
+            else:
+                written.append(kwargs["content"])
+            return "out"
+
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks(response)), \
+                patch.object(compiler.llm, 'openai_completion_async', AsyncMock(return_value="done")), \
+                patch.object(compiler._PlanRunner, 'release', fake_release), \
+                patch.object(compiler, 'run_tool', side_effect=fake_run_tool):
+            compiler.llm_compiler_agent(question="q", command="ask", api_key="k", base_url="https://test.api", model="m")
+
+        self.assertEqual(written, ["checked"])
+
+    def test_unparseable_stream_falls_back_to_full_response(self):
+        with patch.object(compiler.llm, 'openai_completion_stream_async', _chunks("plain answer")):
+            answer = compiler.llm_compiler_agent(
+                question="q", command="ask", api_key="k", base_url="https://test.api", model="m"
+            )
+
+        self.assertEqual(answer, "plain answer")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+"""
+Unit tests for the memory manager.
+"""
+
+import hashlib
+import json
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from clia.agents.memory import MemoryEntry, MemoryManager, np
+
+
+def _entry(question="q", answer="a"):
+    return MemoryEntry(
+        timestamp="2025-01-01T00:00:00",
+        question=question,
+        answer=answer,
+        command="ask",
+        agent_type="chat",
+        metadata={}
+    )
+
+
+class TestMemoryEntry(unittest.TestCase):
+    def test_cached_hash_is_not_serialized(self):
+        entry = _entry()
+        entry.get_content_hash()
+        self.assertNotIn("_content_hash", entry.to_dict())
+        self.assertEqual(MemoryEntry.from_dict(entry.to_dict()), entry)
+
+    def test_content_hash_depends_on_question_and_answer(self):
+        self.assertEqual(_entry().get_content_hash(), _entry().get_content_hash())
+        self.assertNotEqual(_entry().get_content_hash(), _entry(answer="b").get_content_hash())
+
+    def test_content_hash_algorithm_is_fixed(self):
+        # 摘要写入墓碑等文件, 不能随可选依赖变化
+        self.assertEqual(_entry().get_content_hash(), hashlib.blake2b(b"qa", digest_size=8).hexdigest())
+
+
+class TestMemoryManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "memory.jsonl"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_duplicates_are_skipped(self):
+        manager = MemoryManager(memory_path=self.path, enable_summarization=False)
+        manager.add_memory(question="q", answer="a", command="ask", agent_type="chat")
+        manager.add_memory(question="q", answer="a", command="ask", agent_type="chat")
+        manager.add_memory(question="q", answer="b", command="ask", agent_type="chat")
+
+        self.assertEqual([m.answer for m in manager.memories], ["a", "b"])
+        manager.close()
+        reloaded = MemoryManager(memory_path=self.path, enable_summarization=False)
+        self.assertEqual([m.answer for m in reloaded.memories], ["a", "b"])
+
+    def test_hash_index_follows_truncation(self):
+        manager = MemoryManager(memory_path=self.path, max_memories=2, enable_summarization=False)
+        for answer in ("a", "b", "c"):
+            manager.add_memory(question="q", answer=answer, command="ask", agent_type="chat")
+
+        self.assertEqual([m.answer for m in manager.memories], ["b", "c"])
+        # "a" 已被淘汰, 可以再次加入
+        manager.add_memory(question="q", answer="a", command="ask", agent_type="chat")
+        self.assertEqual([m.answer for m in manager.memories], ["c", "a"])
+        manager.close()
+
+    def test_add_appends_without_rewriting(self):
+        manager = MemoryManager(memory_path=self.path, enable_summarization=False)
+        with patch.object(manager, '_rewrite_all', side_effect=AssertionError("rewrite")):
+            manager.add_memory(question="q1", answer="a", command="ask", agent_type="chat")
+            manager.add_memory(question="q2", answer="a", command="ask", agent_type="chat")
+            manager.flush()
+
+        self.assertEqual(len(self.path.read_text(encoding='utf-8').splitlines()), 2)
+        self.assertEqual(manager.clear_memories(), 2)
+        self.assertEqual(self.path.read_text(encoding='utf-8'), "")
+        manager.close()
+
+    def test_load_skips_blank_and_corrupt_lines(self):
+        first, second = _entry(answer="a").to_dict(), _entry(answer="b").to_dict()
+        # 最后一行没有换行符, 中间夹杂空行和损坏的记录
+        self.path.write_bytes(
+            json.dumps(first).encode() + b"\n\n{broken\n  \n" + json.dumps(second).encode()
+        )
+        manager = MemoryManager(memory_path=self.path)
+        self.assertEqual([m.answer for m in manager.memories], ["a", "b"])
+
+        self.path.write_bytes(b"")
+        self.assertEqual(MemoryManager(memory_path=self.path).memories, [])
+
+    def test_time_queries_use_parsed_timestamps(self):
+        manager = MemoryManager(memory_path=self.path, enable_summarization=False)
+        now = datetime.now()
+        for minutes, answer in ((3 * 24 * 60, "old"), (90, "stale"), (5, "new"), (1, "newest")):
+            entry = _entry(answer=answer)
+            entry.timestamp = (now - timedelta(minutes=minutes)).isoformat()
+            manager.memories.append(MemoryEntry.from_dict(entry.to_dict()))
+
+        stats = manager.get_stats()
+        self.assertEqual(stats["by_command"], {"ask": 4})
+        self.assertEqual(stats["by_agent_type"], {"chat": 4})
+        self.assertEqual(stats["oldest"], manager.memories[0].timestamp)
+        self.assertEqual(stats["newest"], manager.memories[-1].timestamp)
+        self.assertEqual([m.answer for m in manager.recent_memories(limit=3)], ["newest", "new"])
+        self.assertEqual(manager.clear_memories(older_than_days=1), 1)
+        self.assertEqual([m.answer for m in manager.memories], ["stale", "new", "newest"])
+        manager.close()
+
+    def test_simple_summary_counts_words_without_punctuation(self):
+        memories = [_entry(question=q) for q in ("Explain python, please", "python decorators?", "is it ok")]
+        manager = MemoryManager(memory_path=self.path)
+
+        summary = manager._simple_summary(memories)
+
+        self.assertIn("covering topics: python, explain, please, decorators.", summary)
+
+    def test_llm_summaries_are_cached_and_incremental(self):
+        manager = MemoryManager(memory_path=self.path, api_key="k", base_url="https://test.api", model="m")
+        memories = [_entry(answer=str(i)) for i in range(3)]
+
+        with patch('clia.agents.llm.openai_completion', return_value=" first ") as mock_llm:
+            self.assertEqual(manager._summarize_memories(memories), "first")
+            # 新实例从旁路文件读取缓存, 不再请求 LLM
+            reloaded = MemoryManager(memory_path=self.path, api_key="k", base_url="https://test.api", model="m")
+            self.assertEqual(reloaded._summarize_memories(memories), "first")
+        mock_llm.assert_called_once()
+
+        summary_entry = MemoryEntry(timestamp="2025-01-01T00:00:00", question="[Summarized Past Conversations]",
+                                    answer="first", command="summary", agent_type="system",
+                                    metadata={}, summary="first")
+        with patch('clia.agents.llm.openai_completion', return_value="second") as mock_llm:
+            self.assertEqual(manager._summarize_memories([summary_entry, _entry(answer="new")]), "second")
+        messages = mock_llm.call_args.kwargs["messages"]
+        self.assertEqual(messages[1]["content"], "Summary of earlier conversations:\nfirst")
+        self.assertIn("A: new", messages[2]["content"])
+        self.assertNotIn("A: first", messages[2]["content"])
+        manager.close()
+
+
+    def test_appends_are_written_by_background_thread(self):
+        manager = MemoryManager(memory_path=self.path, enable_summarization=False)
+        writers = []
+        real_open = Path.open
+
+        def tracking_open(path, *args, **kwargs):
+            writers.append(threading.current_thread())
+            return real_open(path, *args, **kwargs)
+
+        with patch.object(Path, 'open', tracking_open):
+            for i in range(20):
+                manager.add_memory(question=f"q{i}", answer="a", command="ask", agent_type="chat")
+            manager.close()
+
+        self.assertEqual(len(self.path.read_bytes().splitlines()), 20)
+        # 文件只打开一次, 且不在调用线程中
+        self.assertEqual(len(writers), 1)
+        self.assertIsNot(writers[0], threading.current_thread())
+        manager.close()
+
+
+    def test_records_queued_after_the_sentinel_are_still_written(self):
+        manager = MemoryManager(memory_path=self.path, enable_summarization=False)
+        for item in (b'{"a": 1}\n', None, b'{"b": 2}\n'):
+            manager._write_queue.put(item)
+        manager._writer_loop()
+
+        self.assertEqual(self.path.read_bytes(), b'{"a": 1}\n{"b": 2}\n')
+        # 每个取出的元素都已 task_done, flush() 不会挂起
+        self.assertEqual(manager._write_queue.unfinished_tasks, 0)
+
+    def _fill(self, manager, count):
+        for i in range(count):
+            manager.add_memory(question=f"q{i}", answer="a", command="ask", agent_type="chat")
+
+    def test_evictions_are_tombstoned_until_compaction(self):
+        manager = MemoryManager(memory_path=self.path, max_memories=20, enable_summarization=False)
+        with patch.object(manager, '_rewrite_all', side_effect=AssertionError("rewrite")):
+            self._fill(manager, 22)
+        manager.close()
+
+        reloaded = MemoryManager(memory_path=self.path, max_memories=20, enable_summarization=False)
+        self.assertEqual([m.question for m in reloaded.memories], [f"q{i}" for i in range(2, 22)])
+        self.assertEqual(reloaded._dirty_count, 4)
+        # 第三次淘汰使冗余行超过 max_memories // 4, 文件被压缩
+        reloaded.add_memory(question="q22", answer="a", command="ask", agent_type="chat")
+        reloaded.close()
+        self.assertEqual(len(self.path.read_bytes().splitlines()), 20)
+        self.assertEqual(reloaded._dirty_count, 0)
+
+    def test_no_tombstone_when_nothing_is_evicted(self):
+        # max_memories 低于摘要阈值时不会移除任何条目
+        manager = MemoryManager(memory_path=self.path, max_memories=8, summary_threshold=50)
+        with patch.object(manager, '_rewrite_all', side_effect=AssertionError("rewrite")):
+            self._fill(manager, 10)
+        manager.close()
+
+        self.assertEqual(len(self.path.read_bytes().splitlines()), 10)
+        self.assertEqual(manager._dirty_count, 0)
+
+    def test_summary_replacement_is_replayed_in_place(self):
+        manager = MemoryManager(memory_path=self.path, max_memories=60, summary_threshold=5)
+        with patch.object(manager, '_rewrite_all', side_effect=AssertionError("rewrite")):
+            self._fill(manager, 61)
+        manager.close()
+
+        reloaded = MemoryManager(memory_path=self.path, max_memories=60, summary_threshold=5)
+        self.assertEqual([m.question for m in reloaded.memories], [m.question for m in manager.memories])
+        self.assertEqual(reloaded.memories[0].command, "summary")
+        self.assertEqual(len(reloaded.memories), 51)
+
+    def test_long_answers_are_truncated_with_side_file(self):
+        manager = MemoryManager(memory_path=self.path)
+        answer = "x" * 5000
+        metadata = {"k": 1}
+        manager.add_memory(question="q", answer=answer, command="ask", agent_type="chat", metadata=metadata)
+        manager.add_memory(question="q", answer=answer, command="ask", agent_type="chat")
+
+        self.assertEqual(len(manager.memories), 1)
+        memory = manager.memories[0]
+        self.assertTrue(memory.answer.startswith("x" * 2048 + "…[+2952 chars at "))
+        self.assertEqual(memory.answer_preview, "x" * 200 + "...")
+        self.assertEqual(memory.metadata, {"k": 1, "preview": "x" * 200 + "..."})
+        self.assertEqual(metadata, {"k": 1})
+        self.assertEqual(manager.load_full_answer(memory), answer)
+        self.assertEqual(len(list(manager.answers_dir.iterdir())), 1)
+        manager.close()
+
+
+@unittest.skipIf(np is None, "numpy not installed")
+class TestSemanticRetrieval(unittest.TestCase):
+    TOPICS = ("python", "cooking", "travel")
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "memory.jsonl"
+        self.embed_calls = []
+        self.batch_sizes = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fake_embedding(self, text, **kwargs):
+        # 按话题词生成 one-hot 向量
+        self.embed_calls.append(text)
+        return [float(topic in text) for topic in self.TOPICS]
+
+    def fake_embeddings(self, texts, **kwargs):
+        self.batch_sizes.append(len(texts))
+        return [self.fake_embedding(text) for text in texts]
+
+    def _manager(self):
+        return MemoryManager(memory_path=self.path, enable_summarization=False, api_key="k",
+                             base_url="https://test.api", model="m", enable_semantic_retrieval=True)
+
+    def test_memories_are_ranked_by_similarity_and_embedded_once(self):
+        manager = self._manager()
+        for topic in self.TOPICS:
+            manager.add_memory(question=f"about {topic}", answer="a", command="ask", agent_type="chat")
+
+        with patch('clia.agents.llm.openai_embedding', side_effect=self.fake_embedding), \
+                patch('clia.agents.llm.openai_embeddings', side_effect=self.fake_embeddings):
+            self.assertEqual(manager.relevant_memories("more cooking tips", limit=1)[0].question, "about cooking")
+            self.assertEqual(len(self.embed_calls), 4)
+            # 缺失的记忆向量合并为一次列表输入的请求
+            self.assertEqual(self.batch_sizes, [3])
+            manager.close()
+
+            # 向量已持久化, 新实例只需嵌入查询
+            reloaded = self._manager()
+            self.assertEqual(reloaded.relevant_memories("python again", limit=1)[0].question, "about python")
+        self.assertEqual(len(self.embed_calls), 5)
+
+    def test_embedding_failure_falls_back_to_recent_memories(self):
+        manager = self._manager()
+        manager.add_memory(question="q", answer="a", command="ask", agent_type="chat")
+
+        with patch('clia.agents.llm.openai_embedding', side_effect=RuntimeError("down")):
+            self.assertEqual([m.question for m in manager.relevant_memories("q")], ["q"])
+        manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,435 @@
+"""
+Unit tests for the plan-build agent.
+"""
+
+import asyncio
+import json
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from clia.agents import plan_build_agent
+
+
+class TestCompressToolResult(unittest.TestCase):
+    def test_short_results_are_unchanged(self):
+        self.assertEqual(plan_build_agent._compress_tool_result("ok"), "ok")
+        self.assertEqual(plan_build_agent._compress_tool_result({"a": 1}), {"a": 1})
+
+    def test_long_results_keep_head_tail_and_error_lines(self):
+        lines = [f"line {i}" for i in range(500)]
+        lines[250] = "  ERROR: disk full"
+        result = "\n".join(lines)
+
+        compressed = plan_build_agent._compress_tool_result(result)
+
+        self.assertLess(len(compressed), plan_build_agent.RESULT_BUDGET_CHARS)
+        self.assertTrue(compressed.startswith(result[:plan_build_agent.RESULT_KEEP_CHARS]))
+        self.assertTrue(compressed.endswith(result[-plan_build_agent.RESULT_KEEP_CHARS:]))
+        self.assertIn("\nERROR: disk full\n", compressed)
+        self.assertIn(f"...[truncated {len(result) - 2 * plan_build_agent.RESULT_KEEP_CHARS} chars]...", compressed)
+
+
+class TestExtractPlan(unittest.TestCase):
+    def test_first_json_array_in_prose_is_used(self):
+        response = 'See [note] first: [{"action": "final", "answer": "a"}] and ] trailing'
+        self.assertEqual(plan_build_agent._extract_plan(response), [{"action": "final", "answer": "a"}])
+
+    def test_response_without_closing_bracket_is_not_scanned(self):
+        response = "see [1, 2 and [3"
+        with patch.object(plan_build_agent, 'json_array_end', side_effect=AssertionError("scanned")):
+            self.assertEqual(plan_build_agent._extract_plan(response), [{"action": "final", "answer": response}])
+
+    def test_nested_arrays_and_bracketed_strings(self):
+        plan = [{"action": "tool", "tool": "echo", "args": {"text": "[x]"}, "tags": [[1], []]},
+                {"action": "final", "answer": "ok ]"}]
+        response = "Plan [unclosed:\n```json\n" + json.dumps(plan) + "\n```"
+        self.assertEqual(plan_build_agent._extract_plan(response), plan)
+
+    def test_response_without_plan_becomes_final_answer(self):
+        for response in ("no plan here", "[" * 10_000):
+            with self.subTest(response=response[:10]):
+                self.assertEqual(plan_build_agent._extract_plan(response),
+                                 [{"action": "final", "answer": response}])
+
+
+class TestPlannerMessages(unittest.TestCase):
+    def test_memory_context_follows_static_system_prompt(self):
+        memory = SimpleNamespace(memories=[1], relevant_memories=lambda question, limit: [
+            SimpleNamespace(question="q0", answer_preview="a0")
+        ])
+
+        plain = asyncio.run(plan_build_agent._planner_messages("q1"))
+        with_memory = asyncio.run(plan_build_agent._planner_messages("q1", memory))
+
+        self.assertIs(plain[0]["content"], with_memory[0]["content"])
+        self.assertNotIn("q0", with_memory[0]["content"])
+        self.assertIn("q0", with_memory[1]["content"])
+        self.assertEqual(with_memory[-1], {"role": "user", "content": "q1"})
+
+    def test_memory_retrieval_runs_off_the_event_loop_thread(self):
+        threads = []
+        memory = SimpleNamespace(memories=[1], relevant_memories=lambda question, limit: threads.append(
+            threading.current_thread()) or [])
+
+        asyncio.run(plan_build_agent._planner_messages("q1", memory))
+        self.assertIsNot(threads[0], threading.main_thread())
+
+
+class TestBuilder(unittest.TestCase):
+    LLM_KWARGS = dict(command="ask", max_steps=3, api_key="k", base_url="https://test.api", max_retries=1,
+                      model="m", stream=False, temperature=0.0, top_p=1.0, frequency_penalty=0.0,
+                      max_tokens=10, timeout=1.0)
+
+    def test_single_final_step_skips_llm(self):
+        plan = [{"action": "final", "answer": "42"}]
+        with patch.object(plan_build_agent.llm, 'openai_completion_async') as mock_llm:
+            answer, metadata = asyncio.run(plan_build_agent._builder("q", plan, return_metadata=True, **self.LLM_KWARGS))
+
+        self.assertEqual(answer, "42")
+        self.assertEqual(metadata["steps_executed"], 0)
+        mock_llm.assert_not_awaited()
+
+    def test_tool_plan_is_synthesized(self):
+        plan = [{"action": "tool", "tool": "echo", "args": {"text": "hi"}}, {"action": "final", "answer": ""}]
+        with patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done") as mock_llm:
+            answer = asyncio.run(plan_build_agent._builder("q", plan, **self.LLM_KWARGS))
+
+        self.assertEqual(answer, "done")
+        mock_llm.assert_awaited_once()
+
+    def test_small_tool_result_still_goes_through_builder(self):
+        plan = [{"action": "tool", "tool": "read_file", "args": {"path_str": "f"}}, {"action": "final", "answer": "See:"}]
+        with patch.object(plan_build_agent, 'run_tool', return_value="contents"), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done") as mock_llm:
+            answer = asyncio.run(plan_build_agent._builder("q", plan, **self.LLM_KWARGS))
+
+        # 计划中的答案写于工具执行之前, 不能代替构建调用
+        self.assertEqual(answer, "done")
+        mock_llm.assert_awaited_once()
+
+    def test_independent_tool_steps_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_run_tool(tool_name, **kwargs):
+            # 两个独立步骤必须同时在运行, 否则 barrier 超时
+            barrier.wait()
+            return kwargs["path_str"]
+
+        plan = [
+            {"action": "tool", "tool": "read_file", "args": {"path_str": "a"}},
+            {"action": "tool", "tool": "read_file", "args": {"path_str": "b"}},
+            {"action": "final", "answer": "x"},
+        ]
+        with patch.object(plan_build_agent, 'run_tool', side_effect=fake_run_tool), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done"):
+            _, metadata = asyncio.run(plan_build_agent._builder("q", plan, return_metadata=True, **self.LLM_KWARGS))
+
+        self.assertEqual([r["result"] for r in metadata["execution_results"][:2]], ["a", "b"])
+        self.assertEqual(metadata["execution_results"][2], "x")
+
+    def test_duplicate_tool_calls_run_once(self):
+        plan = [
+            {"action": "tool", "tool": "read_file", "args": {"path_str": "a"}},
+            {"action": "tool", "tool": "read_file", "args": {"path_str": "a", "max_chars": 4000}},
+            {"action": "final", "answer": ""},
+        ]
+        with patch.object(plan_build_agent, 'run_tool', return_value="contents") as mock_tool, \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done"):
+            _, metadata = asyncio.run(plan_build_agent._builder("q", plan, return_metadata=True, **self.LLM_KWARGS))
+
+        mock_tool.assert_called_once()
+        self.assertEqual([r["result"] for r in metadata["execution_results"][:2]], ["contents", "contents"])
+        self.assertEqual([r.get("cached", False) for r in metadata["execution_results"][:2]], [False, True])
+
+    def test_step_references_split_groups(self):
+        steps = [
+            (0, {"args": {"path_str": "a"}}),
+            (1, {"args": {"url": "b"}}),
+            (2, {"args": {"text": "use {{step_0}}"}}),
+            (3, {"args": {"path_str": "x"}}),
+            (4, {"args": {"text": "and {{step_3.result}}"}}),
+        ]
+        groups = plan_build_agent._independent_groups(steps)
+        self.assertEqual([[idx for idx, _ in group] for group in groups], [[0, 1], [2, 3], [4]])
+
+
+def _streamed(*responses, size=5):
+    """Fake openai_completion_stream_async: each call streams the next response in small chunks."""
+    remaining = list(responses)
+    calls = []
+
+    async def gen(**kwargs):
+        calls.append(kwargs)
+        text = remaining.pop(0)
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+    gen.calls = calls
+    return gen
+
+
+class TestStreamingPlanner(unittest.TestCase):
+    def test_first_tool_step_starts_before_plan_finishes(self):
+        tool_started = threading.Event()
+
+        async def fake_stream(**kwargs):
+            yield '[{"action": "tool", "tool": "read_file", "args": {"path_str": "a"}}, '
+            # 计划其余部分只有在第一个工具启动后才会到达
+            self.assertTrue(await asyncio.to_thread(tool_started.wait, 5))
+            yield '{"action": "final", "answer": ""}]'
+
+        def fake_run_tool(tool_name, **kwargs):
+            tool_started.set()
+            return "contents"
+
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', fake_stream), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done"), \
+                patch.object(plan_build_agent, 'run_tool', side_effect=fake_run_tool) as mock_tool:
+            answer, metadata = plan_build_agent.plan_build("q", return_metadata=True, **TestSemanticCache.KWARGS)
+
+        self.assertEqual(answer, "done")
+        # 提前启动的步骤不会被再次执行
+        mock_tool.assert_called_once()
+        self.assertEqual(metadata["execution_results"][0]["result"], "contents")
+
+    def test_side_effect_steps_do_not_start_before_plan_finishes(self):
+        async def fake_stream(**kwargs):
+            yield '[{"action": "tool", "tool": "shell", "args": {"command": "rm -rf build"}}, '
+            # 计划完整之前 shell 不得执行
+            await asyncio.sleep(0.05)
+            self.assertFalse(mock_tool.called)
+            yield '{"action": "final", "answer": ""}]'
+
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', fake_stream), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="done"), \
+                patch.object(plan_build_agent, 'run_tool', return_value="removed") as mock_tool:
+            answer = plan_build_agent.plan_build("q", **TestSemanticCache.KWARGS)
+
+        self.assertEqual(answer, "done")
+        mock_tool.assert_called_once()
+
+    def test_truncated_stream_keeps_started_steps(self):
+        stream = _streamed('[{"action": "tool", "tool": "read_file", "args": {"path_str": "a"}}, {"action": "fi')
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', stream), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="built") as mock_llm, \
+                patch.object(plan_build_agent, 'run_tool', return_value="contents") as mock_tool:
+            answer, metadata = plan_build_agent.plan_build("q", return_metadata=True, **TestSemanticCache.KWARGS)
+
+        self.assertEqual(answer, "built")
+        mock_tool.assert_called_once()
+        mock_llm.assert_called_once()
+        self.assertEqual(metadata["steps_executed"], 1)
+        self.assertEqual(metadata["plan"], [{"action": "tool", "tool": "read_file", "args": {"path_str": "a"}}])
+
+    def test_started_steps_missing_from_fallback_plan_are_reported(self):
+        early = plan_build_agent._EarlyToolSteps(max_steps=3)
+        step = {"action": "tool", "tool": "read_file", "args": {"path_str": "a"}}
+
+        async def run():
+            early.add(0, step)
+            return await plan_build_agent._execute_steps([{"action": "final", "answer": "x"}], 3, early)
+
+        with patch.object(plan_build_agent, 'run_tool', return_value="contents"):
+            results = asyncio.run(run())
+
+        self.assertEqual(results[0]["result"], "contents")
+        self.assertTrue(results[0]["unplanned"])
+        self.assertEqual(results[1], "x")
+
+    def test_unparseable_stream_falls_back_to_full_response(self):
+        stream = _streamed("plain answer")
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', stream):
+            answer = plan_build_agent.plan_build("q", **TestSemanticCache.KWARGS)
+
+        self.assertEqual(answer, "plain answer")
+
+
+    def test_structured_output_sends_plan_schema(self):
+        stream = _streamed('{"steps": [{"action": "final", "answer": "42"}]}')
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', stream):
+            answer = plan_build_agent.plan_build("q", structured_output=True, **TestSemanticCache.KWARGS)
+
+        self.assertEqual(answer, "42")
+        self.assertIs(stream.calls[0]["response_format"], plan_build_agent.PLAN_RESPONSE_FORMAT)
+
+
+class TestPlanBuildBatch(unittest.TestCase):
+    def test_questions_are_answered_concurrently_in_order(self):
+        started = []
+        both_started = asyncio.Event()
+
+        async def fake_stream(**kwargs):
+            # 两个规划请求必须同时在途, 否则 wait_for 超时
+            started.append(kwargs["messages"][-1]["content"])
+            if len(started) == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), timeout=5)
+            yield f'[{{"action": "final", "answer": "re: {kwargs["messages"][-1]["content"]}"}}]'
+
+        async def run():
+            return await plan_build_agent.plan_build_batch(["q1", "q2"], **TestBuilder.LLM_KWARGS)
+
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', fake_stream):
+            self.assertEqual(asyncio.run(run()), ["re: q1", "re: q2"])
+
+    def test_online_runs_are_bounded_by_max_concurrency(self):
+        in_flight, peak = [0], [0]
+
+        async def fake_stream(**kwargs):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            yield '[{"action": "final", "answer": "ok"}]'
+
+        async def run():
+            return await plan_build_agent.plan_build_batch([f"q{i}" for i in range(6)], max_concurrency=2,
+                                                           **TestBuilder.LLM_KWARGS)
+
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', fake_stream):
+            self.assertEqual(asyncio.run(run()), ["ok"] * 6)
+        self.assertEqual(peak[0], 2)
+
+    def test_large_batches_use_two_batch_api_jobs(self):
+        plans = ['[{"action": "final", "answer": "direct"}]',
+                 '[{"action": "tool", "tool": "echo", "args": {"text": "hi"}}, {"action": "final", "answer": ""}]',
+                 None]
+        submitted = []
+
+        def fake_batch(messages_list, **kwargs):
+            submitted.append(messages_list)
+            return plans if len(submitted) == 1 else ["built 1", None]
+
+        async def run(**kwargs):
+            return await plan_build_agent.plan_build_batch(["q0", "q1", "q2"], **kwargs, **TestBuilder.LLM_KWARGS)
+
+        online = ['[{"action": "tool", "tool": "echo", "args": {"text": "yo"}}]', "built 2"]
+        with patch.object(plan_build_agent, 'BATCH_API_MIN_QUESTIONS', 3), \
+                patch.object(plan_build_agent.llm, 'openai_batch_completions', side_effect=fake_batch), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', side_effect=online) as mock_llm:
+            self.assertEqual(asyncio.run(run()), ["direct", "built 1", "built 2"])
+            # 失败的批处理请求改走在线调用
+            self.assertEqual(mock_llm.call_count, 2)
+            # 单个 final 步骤的计划不进入构建批次
+            self.assertEqual([m[-2]["content"] for m in submitted[1]], ["q1", "q2"])
+
+            with patch.object(plan_build_agent.llm, 'openai_completion_stream_async',
+                              _streamed(*['[{"action": "final", "answer": "now"}]'] * 3)):
+                self.assertEqual(asyncio.run(run(urgency=True)), ["now"] * 3)
+        self.assertEqual(len(submitted), 2)
+
+    def test_empty_plan_in_batch_api_run_goes_to_builder(self):
+        submitted = []
+
+        def fake_batch(messages_list, **kwargs):
+            submitted.append(messages_list)
+            return ["[]", '[{"action": "final", "answer": "direct"}]'] if len(submitted) == 1 else ["built"]
+
+        with patch.object(plan_build_agent, 'BATCH_API_MIN_QUESTIONS', 2), \
+                patch.object(plan_build_agent.llm, 'openai_batch_completions', side_effect=fake_batch):
+            answers = asyncio.run(plan_build_agent.plan_build_batch(["q0", "q1"], **TestBuilder.LLM_KWARGS))
+
+        self.assertEqual(answers, ["built", "direct"])
+        self.assertEqual([m[-2]["content"] for m in submitted[1]], ["q0"])
+
+
+class FakeSemanticCache:
+    """Treats every question as similar; entries are keyed by scope only."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def embed(self, question):
+        return question
+
+    def get(self, embedding, scope, threshold=None):
+        return self.entries.get(scope)
+
+    def put(self, embedding, scope, question, response):
+        self.entries[scope] = response
+
+
+class TestSemanticCache(unittest.TestCase):
+    KWARGS = dict(command="ask", max_steps=3, api_key="k", base_url="https://test.api", max_retries=1,
+                  model="m", stream=False, temperature=0.0, top_p=1.0, frequency_penalty=0.0,
+                  max_tokens=10, timeout=1.0)
+
+    def test_plan_and_answer_are_reused_for_similar_questions(self):
+        cache = FakeSemanticCache()
+        stream = _streamed('[{"action": "tool", "tool": "echo", "args": {"text": "hi"}}, '
+                           '{"action": "final", "answer": ""}]')
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', stream), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="answer") as mock_llm:
+            first = plan_build_agent.plan_build("q", semantic_cache=cache, **self.KWARGS)
+            second = plan_build_agent.plan_build("q again", semantic_cache=cache, **self.KWARGS)
+
+        self.assertEqual((first, second), ("answer", "answer"))
+        self.assertEqual((len(stream.calls), mock_llm.call_count), (1, 1))
+        self.assertEqual(len(cache.entries), 3)
+
+    def test_changed_tool_results_miss_the_answer_cache(self):
+        cache = FakeSemanticCache()
+        plan = [{"action": "tool", "tool": "read_file", "args": {"path_str": "f"}}, {"action": "final", "answer": ""}]
+        with patch.object(plan_build_agent, 'run_tool', side_effect=["v1", "v2"]), \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', side_effect=["a1", "a2"]):
+            first = asyncio.run(plan_build_agent._builder("q", plan, semantic_cache=cache, embedding="q", **self.KWARGS))
+            second = asyncio.run(plan_build_agent._builder("q", plan, semantic_cache=cache, embedding="q", **self.KWARGS))
+
+        self.assertEqual((first, second), ("a1", "a2"))
+
+    def test_plan_hit_with_different_paths_falls_back_to_template(self):
+        cache = FakeSemanticCache()
+        stream = _streamed('[{"action": "tool", "tool": "read_file", "args": {"path_str": "a.txt"}}, '
+                           '{"action": "final", "answer": ""}]')
+        with patch.object(plan_build_agent.llm, 'openai_completion_stream_async', stream), \
+                patch.object(plan_build_agent, 'run_tool', return_value="text") as mock_tool, \
+                patch.object(plan_build_agent.llm, 'openai_completion_async', return_value="answer"):
+            plan_build_agent.plan_build("read a.txt", semantic_cache=cache, **self.KWARGS)
+            plan_build_agent.plan_build("read b.txt", semantic_cache=cache, **self.KWARGS)
+
+        self.assertEqual(len(stream.calls), 1)
+        self.assertEqual([c.kwargs["path_str"] for c in mock_tool.call_args_list], ["a.txt", "b.txt"])
+
+
+class TestPlanTemplates(unittest.TestCase):
+    PLAN = [
+        {"action": "tool", "tool": "read_file", "args": {"path_str": "src/app.py", "max_chars": 1000}},
+        {"action": "tool", "tool": "http_get", "args": {"url": "https://a.example/x", "timeout": 10.0}},
+        {"action": "final", "answer": "The file says..."},
+    ]
+
+    def test_question_values_become_typed_slots(self):
+        question = "Read src/app.py and fetch https://a.example/x"
+        template = plan_build_agent._make_template(question, self.PLAN)
+
+        self.assertEqual(template[0]["args"], {"path_str": "<PATH:0/1>", "max_chars": 1000})
+        self.assertEqual(template[1]["args"], {"url": "<URL:0/1>", "timeout": 10.0})
+        self.assertEqual(template[2]["answer"], "")
+
+        plan = plan_build_agent._fill_template("Read lib/util.py, then fetch https://b.example/y", template)
+        self.assertEqual(plan[0]["args"], {"path_str": "lib/util.py", "max_chars": 1000})
+        self.assertEqual(plan[1]["args"], {"url": "https://b.example/y", "timeout": 10.0})
+        self.assertIsNone(plan_build_agent._fill_template("Read lib/util.py", template))
+
+    def test_slots_keep_question_positions_and_ignore_url_hosts(self):
+        plan = [{"action": "tool", "tool": "read_file", "args": {"path_str": "b.txt"}},
+                {"action": "final", "answer": ""}]
+        template = plan_build_agent._make_template("fetch https://x.org/page and read a.txt then b.txt", plan)
+        self.assertEqual(template[0]["args"], {"path_str": "<PATH:1/2>"})
+
+        filled = plan_build_agent._fill_template("fetch https://example.com/page and read c.txt then d.txt", template)
+        self.assertEqual(filled[0]["args"], {"path_str": "d.txt"})
+        # 同类值数量不同的问题不套用模板; 版本号等数字不算路径
+        self.assertIsNone(plan_build_agent._fill_template("read c.txt", template))
+        self.assertIsNone(plan_build_agent._fill_template("read c.txt, d.txt and e.txt", template))
+        self.assertEqual(plan_build_agent._question_slots("bump 1.2 in setup.py")["PATH"], ["setup.py"])
+
+    def test_unextractable_or_tool_free_plans_are_not_templated(self):
+        echo = [{"action": "tool", "tool": "echo", "args": {"text": "hello"}}, {"action": "final", "answer": ""}]
+        self.assertIsNone(plan_build_agent._make_template("say hello", echo))
+        self.assertIsNone(plan_build_agent._make_template("q", [{"action": "final", "answer": "a"}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+"""
+Unit tests for the prompt library.
+"""
+
+import unittest
+
+from clia.agents.prompts import PROMPT_LIB, get_prompt, get_prompt_prefix
+
+
+class TestPromptPrefix(unittest.TestCase):
+    def test_prefix_starts_with_system_message(self):
+        system_prompt, few_shots = get_prompt("explain")
+        prefix = get_prompt_prefix("explain")
+        self.assertEqual(prefix[0], {"role": "system", "content": system_prompt})
+        self.assertEqual(len(prefix), 1 + len(few_shots))
+
+    def test_prefix_is_cached(self):
+        self.assertIs(get_prompt_prefix("debug"), get_prompt_prefix("debug"))
+
+    def test_unknown_task_falls_back_to_ask(self):
+        self.assertEqual(get_prompt_prefix("unknown")[0]["content"], PROMPT_LIB["ask"][0])
+
+
+    def test_system_prompts_are_canonical(self):
+        for task, (system_prompt, _) in PROMPT_LIB.items():
+            self.assertEqual(system_prompt, system_prompt.strip(), task)
+            for line in system_prompt.splitlines():
+                self.assertEqual(line, line.strip(), task)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Unit tests for the ReAct agent.
+"""
+
+import importlib
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+# clia.agents re-exports a function with the module's name, so import the module explicitly
+react = importlib.import_module("clia.agents.react_agent")
+
+LLM_KWARGS = dict(api_key="k", base_url="https://test.api", model="m")
+
+
+class TestExtractReactComponents(unittest.TestCase):
+    def test_components_are_extracted_in_one_pass(self):
+        response = ('Thought: read it\naction: read_file\nAction Input: {"path_str": "x"}\n'
+                    'Observation: hallucinated\nThought: again\nFinal Answer: done')
+
+        self.assertEqual(react._extract_react_components(response), {
+            "thought": "read it",
+            "action": "read_file",
+            "action_input": '{"path_str": "x"}',
+            "final_answer": "done",
+            "actions": [("read_file", '{"path_str": "x"}')],
+        })
+
+    def test_all_actions_before_first_observation_are_collected(self):
+        response = ('Thought: both\nAction: read_file\nAction Input: {"path_str": "a"}\n'
+                    'Action: http_get\nAction Input: {"url": "u"}\nObservation: fake\nAction: echo')
+
+        self.assertEqual(react._extract_react_components(response)["actions"],
+                         [("read_file", '{"path_str": "a"}'), ("http_get", '{"url": "u"}')])
+
+    def test_thought_stops_at_final_answer(self):
+        components = react._extract_react_components("Thought: easy\nFinal Answer: 42")
+        self.assertEqual((components["thought"], components["action"], components["final_answer"]),
+                         ("easy", None, "42"))
+
+
+class TestReactAgent(unittest.TestCase):
+    def test_tool_runs_off_the_event_loop_thread(self):
+        responses = [
+            'Thought: read it\nAction: read_file\nAction Input: {"path_str": "f"}',
+            "Thought: done\nFinal Answer: contents seen",
+        ]
+        tool_threads = []
+
+        def fake_run_tool(tool_name, **kwargs):
+            tool_threads.append(threading.current_thread())
+            return "file contents"
+
+        mock_llm = AsyncMock(side_effect=responses)
+        with patch.object(react.llm, 'openai_completion_async', mock_llm), \
+                patch.object(react, 'run_tool', side_effect=fake_run_tool):
+            answer, metadata = react.react_agent("q", "ask", return_metadata=True, **LLM_KWARGS)
+
+        self.assertEqual(answer, "contents seen")
+        self.assertEqual(metadata["iterations_used"], 2)
+        self.assertIsNot(tool_threads[0], threading.main_thread())
+        observation = mock_llm.call_args.kwargs["messages"][-1]["content"]
+        self.assertEqual(observation, "Observation: file contents")
+
+    def test_parallel_actions_share_one_observation_message(self):
+        barrier = threading.Barrier(2, timeout=5)
+        responses = [
+            'Thought: both\nAction: read_file\nAction Input: {"path_str": "a"}\n'
+            'Action: read_file\nAction Input: {"path_str": "b"}',
+            "Final Answer: done",
+        ]
+
+        def fake_run_tool(tool_name, **kwargs):
+            # 两个动作必须同时在运行, 否则 barrier 超时
+            barrier.wait()
+            return kwargs["path_str"].upper()
+
+        mock_llm = AsyncMock(side_effect=responses)
+        with patch.object(react.llm, 'openai_completion_async', mock_llm), \
+                patch.object(react, 'run_tool', side_effect=fake_run_tool):
+            answer, metadata = react.react_agent("q", "ask", return_metadata=True, **LLM_KWARGS)
+
+        self.assertEqual(answer, "done")
+        self.assertEqual(mock_llm.call_args.kwargs["messages"][-1]["content"], "Observation 1: A\nObservation 2: B")
+        self.assertEqual([h.get("observation") for h in metadata["conversation_history"][1:3]], ["A", "B"])
+
+    def test_side_effect_actions_run_alone_in_written_order(self):
+        responses = [
+            'Thought: edit\nAction: read_file\nAction Input: {"path_str": "a"}\n'
+            'Action: write_file\nAction Input: {"path_str": "a", "content": "new"}\n'
+            'Action: read_file\nAction Input: {"path_str": "a"}',
+            "Final Answer: done",
+        ]
+        files = {"a": "old"}
+        running = []
+
+        def fake_run_tool(tool_name, **kwargs):
+            running.append(tool_name)
+            # 写入期间不能有其他动作在运行
+            self.assertEqual(len(running), 1)
+            if tool_name == "write_file":
+                files[kwargs["path_str"]] = kwargs["content"]
+                result = "written"
+            else:
+                result = files[kwargs["path_str"]]
+            running.remove(tool_name)
+            return result
+
+        mock_llm = AsyncMock(side_effect=responses)
+        with patch.object(react.llm, 'openai_completion_async', mock_llm), \
+                patch.object(react, 'run_tool', side_effect=fake_run_tool):
+            react.react_agent("q", "ask", **LLM_KWARGS)
+
+        self.assertEqual(mock_llm.call_args.kwargs["messages"][-1]["content"],
+                         "Observation 1: old\nObservation 2: written\nObservation 3: new")
+
+    def test_old_observations_are_compacted_once(self):
+        steps = 'Thought: again\nAction: read_file\nAction Input: {"path_str": "f"}'
+        sent = []
+
+        async def fake_completion(**kwargs):
+            sent.append([m["content"] for m in kwargs["messages"]])
+            return steps if len(sent) <= 5 else "Final Answer: done"
+
+        with patch.object(react.llm, 'openai_completion_async', side_effect=fake_completion), \
+                patch.object(react, 'run_tool', return_value="x" * 4000), \
+                patch('clia.utils._get_token_encoder', return_value=None):
+            answer, metadata = react.react_agent("q", "ask", return_metadata=True, **LLM_KWARGS)
+
+        self.assertEqual(answer, "done")
+        last = sent[-1]
+        observations = last[3::2]
+        self.assertEqual([len(o) < 1000 for o in observations], [True, True, True, False, False])
+        # 已压缩的消息在之后的请求中保持不变
+        self.assertEqual(sent[-2][:6], last[:6])
+        self.assertEqual(metadata["conversation_history"][1]["observation"], "x" * 4000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Unit tests for agent reflection.
+"""
+
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from clia.agents import reflection
+
+KWARGS = dict(api_key="k", base_url="https://test.api", model="m")
+RESPONSE = '```json\n{"success": true, "strengths": ["fast"], "errors": [], "improvements": ["cache"]}\n```'
+
+
+class TestExtractJson(unittest.TestCase):
+    def test_supported_response_shapes(self):
+        data = {"success": True, "errors": ["}"]}
+        body = json.dumps(data)
+        responses = {
+            "bare": body,
+            "code_block": f"Review:\n```json\n{body}\n```\nDone.",
+            "prose": f"Here you go {body} thanks",
+            "braces_before_block": f"Using {{placeholders}}:\n```json\n{body}\n```",
+            "two_objects": f"{body} and {{\"other\": 1}}",
+        }
+        for name, response in responses.items():
+            with self.subTest(name):
+                self.assertEqual(reflection._extract_json(response), data)
+
+    def test_unbalanced_braces_return_none(self):
+        self.assertIsNone(reflection._extract_json("{" * 10000))
+        self.assertIsNone(reflection._extract_json("no json } here {"))
+
+
+class TestReflection(unittest.TestCase):
+    def test_sync_wrapper_parses_async_response(self):
+        mock_llm = AsyncMock(return_value=RESPONSE)
+        with patch.object(reflection.llm, 'openai_completion_async', mock_llm):
+            result = reflection.reflect_rewoo_agent(
+                question="q", plan=[{"id": "E1", "tool": "echo"}],
+                execution_results={"E1": "Error: boom"}, final_answer="a", **KWARGS
+            )
+
+        self.assertEqual(result.agent_type, "rewoo")
+        self.assertEqual(result.strengths, ["fast"])
+        self.assertEqual(result.execution_summary["errors_encountered"], ["Error: boom"])
+        mock_llm.assert_awaited_once()
+
+    def test_reflections_can_be_gathered(self):
+        started = []
+        both_started = asyncio.Event()
+
+        async def fake_completion(**kwargs):
+            # 两个反思请求必须同时在途, 否则 wait_for 超时
+            started.append(kwargs["messages"][-1]["content"])
+            if len(started) == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), timeout=5)
+            return RESPONSE
+
+        async def run():
+            return await asyncio.gather(*(
+                reflection.areflect_on_execution(question=q, agent_type="react", execution_summary={},
+                                                 final_answer="a", **KWARGS)
+                for q in ("q1", "q2")
+            ))
+
+        with patch.object(reflection.llm, 'openai_completion_async', fake_completion):
+            results = asyncio.run(run())
+
+        self.assertEqual([r.question for r in results], ["q1", "q2"])
+        self.assertTrue(all(r.success for r in results))
+
+    def test_llm_failure_returns_failed_reflection(self):
+        with patch.object(reflection.llm, 'openai_completion_async', AsyncMock(side_effect=RuntimeError("down"))):
+            result = reflection.reflect_on_execution(question="q", agent_type="react", execution_summary={},
+                                                     final_answer="a", **KWARGS)
+
+        self.assertFalse(result.success)
+        self.assertIn("down", result.errors[0])
+
+
+    def test_react_summary_collects_tools_and_errors_in_order(self):
+        history = [
+            {"action": "shell", "observation": "Error: denied"},
+            {"action": "echo", "observation": {"status": "Error"}},
+            {"action": "shell", "observation": "ok"},
+            {"thought": "done"},
+        ]
+        mock_llm = AsyncMock(return_value=RESPONSE)
+        with patch.object(reflection.llm, 'openai_completion_async', mock_llm):
+            result = reflection.reflect_react_agent(question="q", conversation_history=history, final_answer="a",
+                                                    iterations_used=3, max_iterations=3, **KWARGS)
+
+        summary = result.execution_summary
+        self.assertEqual(summary["tools_used"], ["shell", "echo"])
+        self.assertEqual(summary["errors_encountered"], ["Error: denied", "{'status': 'Error'}"])
+        self.assertTrue(summary["reached_max_iterations"])
+
+    def test_plan_build_summary_flags_failed_steps_once(self):
+        results = [
+            {"tool": "read_file", "result": "[工具执行失败] missing"},
+            {"tool": "echo", "result": "Error: bad"},
+            {"tool": "read_file", "result": "ok"},
+            {"tool": "echo"},
+            "final answer",
+        ]
+        mock_llm = AsyncMock(return_value=RESPONSE)
+        with patch.object(reflection.llm, 'openai_completion_async', mock_llm):
+            result = reflection.reflect_plan_build_agent(question="q", plan=[{}] * 4, execution_results=results,
+                                                         final_answer="a", steps_executed=4, max_steps=5, **KWARGS)
+
+        summary = result.execution_summary
+        self.assertEqual(summary["tools_used"], ["read_file", "echo"])
+        self.assertEqual(summary["errors_encountered"], ["[工具执行失败] missing", "Error: bad"])
+        self.assertFalse(summary["reached_max_steps"])
+
+
+def _item(question):
+    return {"question": question, "agent_type": "react", "execution_summary": {}, "final_answer": "a"}
+
+
+def _reflection_json(strength):
+    return {"success": True, "strengths": [strength], "errors": [], "improvements": []}
+
+
+class TestReflectMany(unittest.TestCase):
+    def test_online_mode_evaluates_a_chunk_in_one_request(self):
+        response = json.dumps({"reflections": [_reflection_json("s0"), _reflection_json("s1")]})
+        mock_llm = AsyncMock(return_value=response)
+
+        with patch.object(reflection.llm, 'openai_completion_async', mock_llm):
+            results = reflection.reflect_many([_item("q0"), _item("q1")], **KWARGS)
+
+        self.assertEqual([(r.question, r.strengths) for r in results], [("q0", ["s0"]), ("q1", ["s1"])])
+        mock_llm.assert_awaited_once()
+        self.assertIs(mock_llm.call_args.kwargs["response_format"], reflection.REFLECTIONS_RESPONSE_FORMAT)
+        self.assertIn('"question": "q1"', mock_llm.call_args.kwargs["messages"][-1]["content"])
+
+    def test_combined_requests_stay_within_the_completion_limit(self):
+        def fake_llm(messages, max_tokens, **kwargs):
+            count = messages[-1]["content"].count('"question"')
+            return json.dumps({"reflections": [_reflection_json("s")] * count})
+
+        mock_llm = AsyncMock(side_effect=fake_llm)
+        with patch.object(reflection.llm, 'openai_completion_async', mock_llm):
+            results = reflection.reflect_many([_item(f"q{i}") for i in range(8)], mode="online",
+                                              max_tokens=2048, max_completion_tokens=4096, **KWARGS)
+
+        self.assertEqual(len(results), 8)
+        # 每个合并请求最多 4096 // 2048 = 2 条执行记录
+        self.assertEqual([c.kwargs["max_tokens"] for c in mock_llm.call_args_list], [4096] * 4)
+
+    def test_mismatched_combined_response_falls_back_per_item(self):
+        responses = [json.dumps({"reflections": [_reflection_json("only one")]}), RESPONSE, RESPONSE]
+
+        with patch.object(reflection.llm, 'openai_completion_async', AsyncMock(side_effect=responses)) as mock_llm:
+            results = reflection.reflect_many([_item("q0"), _item("q1")], mode="online", **KWARGS)
+
+        self.assertEqual([r.strengths for r in results], [["fast"], ["fast"]])
+        self.assertEqual(mock_llm.await_count, 3)
+
+    def test_batch_mode_uses_batch_api_with_online_fallback(self):
+        batch = [RESPONSE, None]
+        with patch.object(reflection.llm, 'openai_batch_completions', return_value=batch) as mock_batch, \
+                patch.object(reflection.llm, 'openai_completion_async', AsyncMock(side_effect=RuntimeError("down"))):
+            results = reflection.reflect_many([_item("q0"), _item("q1")], mode="batch", **KWARGS)
+
+        self.assertEqual(len(mock_batch.call_args.kwargs["messages_list"]), 2)
+        self.assertTrue(results[0].success)
+        # 批处理失败的请求改走在线调用, 再失败则记录错误
+        self.assertFalse(results[1].success)
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            reflection.reflect_many([_item("q")], mode="fast", **KWARGS)
+
+
+if __name__ == '__main__':
+    unittest.main()
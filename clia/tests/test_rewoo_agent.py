@@ -0,0 +1,102 @@
+"""
+Unit tests for the ReWOO agent.
+"""
+
+import asyncio
+import importlib
+import json
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# clia.agents re-exports a function with the module's name, so import the module explicitly
+rewoo = importlib.import_module("clia.agents.rewoo_agent")
+
+
+class TestExtractPlan(unittest.TestCase):
+    def test_nested_arrays_are_not_truncated(self):
+        steps = [{"id": "#E1", "tool": "echo", "args": {"text": ["a", "b"]}}]
+        self.assertEqual(rewoo._extract_plan(f"Plan: {json.dumps(steps)} done"), steps)
+
+    def test_unparseable_response_becomes_final_answer(self):
+        self.assertEqual(rewoo._extract_plan("no plan"),
+                         [{"id": "#E1", "action": "final", "answer": "no plan"}])
+
+
+class TestPlannerMessages(unittest.TestCase):
+    def test_memory_context_does_not_change_cached_system_prompt(self):
+        memory = SimpleNamespace(question="earlier q", answer_preview="earlier a")
+        manager = SimpleNamespace(memories=[memory], relevant_memories=lambda question, limit: [memory])
+        mock_llm = AsyncMock(return_value='[{"id": "final", "action": "final", "answer": "x"}]')
+
+        with patch.object(rewoo.llm, 'openai_completion_async', mock_llm):
+            asyncio.run(rewoo._planner("q", "ask", "k", "https://test.api", 1, "m", False,
+                                       0.0, 1.0, 0.0, 10, 1.0, memory_manager=manager))
+
+        messages = mock_llm.call_args.kwargs["messages"]
+        self.assertIs(messages[0]["content"], rewoo._build_rewoo_prompt("ask"))
+        self.assertIn("1. Q: earlier q", messages[1]["content"])
+        self.assertEqual(messages[2], {"role": "user", "content": "q"})
+
+
+class TestWorker(unittest.TestCase):
+    def test_independent_steps_run_concurrently_and_placeholders_resolve(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_run_tool(tool_name, **kwargs):
+            if kwargs["path_str"] in ("a", "b"):
+                # 两个独立步骤必须同时执行, 否则 barrier 超时
+                barrier.wait()
+            return f"<{kwargs['path_str']}>"
+
+        plan = [
+            {"id": "#E1", "tool": "read_file", "args": {"path_str": "a"}},
+            {"id": "#E2", "tool": "read_file", "args": {"path_str": "b"}},
+            {"id": "#E3", "tool": "read_file", "args": {"path_str": "#E1+#E2"}},
+            {"id": "final", "action": "final", "plan": "combine"},
+        ]
+
+        with patch.object(rewoo, 'run_tool', side_effect=fake_run_tool):
+            results = asyncio.run(rewoo._worker(plan))
+
+        self.assertEqual(results, {"#E1": "<a>", "#E2": "<b>", "#E3": "<<a>+<b>>"})
+
+    def test_unresolved_dependencies_are_reported(self):
+        plan = [{"id": "#E1", "tool": "read_file", "args": {"path_str": "x"}, "dependencies": ["#E1"]}]
+
+        with patch.object(rewoo, 'run_tool', side_effect=AssertionError("run_tool called")):
+            results = asyncio.run(rewoo._worker(plan))
+
+        self.assertIn("Unresolved dependencies ['#E1']", results["#E1"])
+
+
+class TestRewooAgent(unittest.TestCase):
+    KWARGS = dict(api_key="k", base_url="https://test.api", model="m")
+
+    def test_sync_wrapper_runs_plan_work_solve(self):
+        plan = json.dumps([
+            {"id": "#E1", "tool": "read_file", "args": {"path_str": "x"}},
+            {"id": "final", "action": "final", "plan": "use #E1"},
+        ])
+        mock_llm = AsyncMock(side_effect=[plan, "answer"])
+
+        with patch.object(rewoo.llm, 'openai_completion_async', mock_llm), \
+                patch.object(rewoo, 'run_tool', return_value="contents"):
+            answer, metadata = rewoo.rewoo_agent(question="q", command="ask", return_metadata=True, **self.KWARGS)
+
+        self.assertEqual(answer, "answer")
+        self.assertEqual(metadata["execution_results"], {"#E1": "contents"})
+        self.assertIn("#E1: contents", mock_llm.call_args.kwargs["messages"][-1]["content"])
+
+    def test_direct_answer_skips_worker_and_solver(self):
+        plan = '[{"id": "final", "action": "final", "answer": "42"}]'
+        mock_llm = AsyncMock(return_value=plan)
+
+        with patch.object(rewoo.llm, 'openai_completion_async', mock_llm):
+            self.assertEqual(rewoo.rewoo_agent(question="q", command="ask", **self.KWARGS), "42")
+        mock_llm.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Unit tests for the tool registry and per-run tool call cache.
+"""
+
+import threading
+import unittest
+from unittest.mock import Mock
+
+from clia.agents.tool_router import ToolCallCache
+
+
+class TestToolCallCache(unittest.TestCase):
+    def test_identical_calls_run_once_with_defaults_filled_in(self):
+        cache = ToolCallCache()
+        fn = Mock(return_value="contents")
+
+        self.assertEqual(cache.call(fn, "read_file", path_str="f"), ("contents", False))
+        self.assertEqual(cache.call(fn, "read_file", path_str="f", max_chars=4000), ("contents", True))
+        self.assertEqual(cache.call(fn, "read_file", path_str="g"), ("contents", False))
+        self.assertEqual(fn.call_count, 2)
+
+    def test_side_effects_clear_the_cache(self):
+        cache = ToolCallCache()
+        fn = Mock(side_effect=["old", "written", "written", "new"])
+
+        cache.call(fn, "read_file", path_str="f")
+        cache.call(fn, "write_file", path_str="f", content="x")
+        cache.call(fn, "write_file", path_str="f", content="x")
+        self.assertEqual(cache.call(fn, "read_file", path_str="f"), ("new", False))
+
+    def test_concurrent_duplicate_waits_for_first_call(self):
+        cache = ToolCallCache()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow(tool_name, **kwargs):
+            calls.append(tool_name)
+            started.set()
+            self.assertTrue(release.wait(timeout=5))
+            return "page"
+
+        first = threading.Thread(target=cache.call, args=(slow, "http_get"), kwargs={"url": "u"})
+        first.start()
+        self.assertTrue(started.wait(timeout=5))
+        results = []
+        second = threading.Thread(target=lambda: results.append(cache.call(slow, "http_get", url="u")))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(calls, ["http_get"])
+        self.assertEqual(results, [("page", True)])
+
+    def test_failures_are_not_cached(self):
+        cache = ToolCallCache()
+        fn = Mock(side_effect=[RuntimeError("boom"), "ok"])
+
+        with self.assertRaises(RuntimeError):
+            cache.call(fn, "echo", text="hi")
+        self.assertEqual(cache.call(fn, "echo", text="hi"), ("ok", False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+"""
+Unit tests for the built-in tool implementations.
+"""
+
+import unittest
+from unittest.mock import patch
+
+from clia.agents import tools
+
+
+class FakeResponse:
+    text = "body"
+
+    def raise_for_status(self):
+        pass
+
+
+class TestHttpGet(unittest.TestCase):
+    def test_requests_share_one_pooled_client(self):
+        client = tools._http_client()
+        self.assertIs(tools._http_client(), client)
+
+        with patch.object(client, 'get', return_value=FakeResponse()) as mock_get:
+            self.assertEqual(tools.http_get("https://example.com/a", timeout=3.0), "body")
+            self.assertEqual(tools.http_get("https://example.com/b"), "body")
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args_list[0].kwargs["timeout"], 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
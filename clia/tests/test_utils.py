@@ -0,0 +1,69 @@
+"""
+Unit tests for shared utilities.
+"""
+
+import json
+import unittest
+from unittest.mock import patch
+
+from clia.utils import json_array_end, json_dumps_pretty, json_object_end, to_bool, truncate_tokens
+
+
+class FakeEncoder:
+    """Treats every character as one token."""
+
+    def encode(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+class TestToBool(unittest.TestCase):
+    def test_strings(self):
+        self.assertTrue(to_bool("Yes"))
+        self.assertFalse(to_bool("off"))
+
+
+class TestJsonArrayEnd(unittest.TestCase):
+    def test_brackets_inside_strings_are_ignored(self):
+        text = 'plan: [{"a": "]\\"["}, [1, [2]]] then ]'
+        end = json_array_end(text, text.index('['))
+        self.assertEqual(text[text.index('['):end], '[{"a": "]\\"["}, [1, [2]]]')
+
+    def test_unclosed_array(self):
+        self.assertEqual(json_array_end("[[1]", 0), -1)
+
+    def test_object_braces_inside_strings_are_ignored(self):
+        text = 'x {"a": "}\\"{", "b": {"c": []}} }'
+        end = json_object_end(text, text.index('{'))
+        self.assertEqual(text[text.index('{'):end], '{"a": "}\\"{", "b": {"c": []}}')
+        self.assertEqual(json_object_end("{{}", 0), -1)
+
+
+class TestJsonDumpsPretty(unittest.TestCase):
+    def test_matches_stdlib_indented_output(self):
+        obj = {"a": [1, {"b": "é", 2: None}], "c": {}, "d": [], "e": 1.5}
+        self.assertEqual(json_dumps_pretty(obj), json.dumps(obj, indent=2, ensure_ascii=False))
+
+
+class TestTruncateTokens(unittest.TestCase):
+    def setUp(self):
+        truncate_tokens.cache_clear()
+
+    def tearDown(self):
+        truncate_tokens.cache_clear()
+
+    @patch('clia.utils._get_token_encoder', return_value=FakeEncoder())
+    def test_truncates_by_token_count(self, _):
+        self.assertEqual(truncate_tokens("abcdef", 4), "abcd...")
+        self.assertEqual(truncate_tokens("abc", 4), "abc")
+
+    @patch('clia.utils._get_token_encoder', return_value=None)
+    def test_falls_back_to_character_estimate(self, _):
+        self.assertEqual(truncate_tokens("a" * 10, 2), "a" * 8 + "...")
+        self.assertEqual(truncate_tokens("a" * 8, 2), "a" * 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
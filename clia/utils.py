@@ -1,4 +1,32 @@
-from typing import Any
+from functools import lru_cache
+from typing import Any, Optional
+import json
+
+# 括号扫描器单独成模块, 以便构建时用 mypyc 编译
+from clia._jsonscan import json_array_end, json_object_end
+
+# JSON 编解码: 优先使用 orjson (Rust 实现, 直接输出 UTF-8 bytes), 未安装时退回标准库
+# 两种实现都输出不转义非 ASCII 字符的紧凑 JSON; json_dumps_pretty 输出两空格缩进的文本 (用于提示词)
+try:
+    import orjson
+
+    json_dumps_bytes = orjson.dumps
+    json_loads = orjson.loads
+
+    def json_dumps_pretty(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+except ImportError:
+    # 复用同一个编码器, 避免每次调用都重新构造 JSONEncoder
+    _JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    _JSON_ENCODE_PRETTY = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+
+    def json_dumps_bytes(obj: Any) -> bytes:
+        return _JSON_ENCODE(obj).encode('utf-8')
+
+    def json_dumps_pretty(obj: Any) -> str:
+        return _JSON_ENCODE_PRETTY(obj)
+
+    json_loads = json.loads
 
 
 def to_bool(value: Any, default: bool = False) -> bool:
@@ -36,5 +64,44 @@ def get_multiline_input() -> str:
             lines.append(line)
         except EOFError:
             break
-    print(lines)
     return "\n".join(lines)
+
+
+# 无 tiktoken 时按每个 token 约 4 个字符估算
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _get_token_encoder() -> Optional[Any]:
+    """懒加载 tiktoken 编码器, 未安装或加载失败 (例如无法下载词表) 时返回 None"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model("gpt-4o-mini")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=256)
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    按 token 数截断文本, 超出时追加 "..."
+
+    Args:
+        text: 要截断的文本
+        max_tokens: 最多保留的 token 数
+
+    Returns:
+        截断后的文本
+    """
+    encoder = _get_token_encoder()
+    if encoder is None:
+        max_chars = max_tokens * _CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens]) + "..."
@@ -2,6 +2,8 @@
 CLIA - An Efficient Minimalist CLI AI Agent
 """
 
+import os
+
 from setuptools import setup, find_packages
 
 with open("README.md", "r", encoding="utf-8") as fh:
@@ -10,6 +12,13 @@ with open("README.md", "r", encoding="utf-8") as fh:
 with open("requirements.txt", "r", encoding="utf-8") as fh:
     requirements = [line.strip() for line in fh if line.strip() and not line.startswith("#")]
 
+# 可选: CLIA_MYPYC=1 时用 mypyc 预编译纯 Python 的热点解析模块, 需要构建环境中装有 mypy
+ext_modules = []
+if os.environ.get("CLIA_MYPYC") == "1":
+    from mypyc.build import mypycify
+
+    ext_modules = mypycify(["clia/_jsonscan.py"])
+
 setup(
     name="clia",
     version="0.1.0",
@@ -40,6 +49,7 @@ setup(
             "clia=clia.main:main",
         ],
     },
+    ext_modules=ext_modules,
     include_package_data=True,
     package_data={
         "clia": ["*.json", "*.yaml", "*.yml"],